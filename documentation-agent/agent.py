@@ -18,14 +18,20 @@ Usage:
 
 import argparse
 import asyncio
+import codecs
+import heapq
 import json
 import logging
 import os
 import re
+import shlex
+import signal
 import subprocess
 import sys
-from dataclasses import dataclass, field
+from array import array
+from dataclasses import dataclass, field, replace
 from datetime import datetime
+from html.parser import HTMLParser
 from pathlib import Path
 from typing import Any, Callable, Optional
 
@@ -74,10 +80,27 @@ class Config:
 
     # Tool settings
     shell_timeout: int = 300  # seconds
+    persistent_shell: bool = False  # Run bash commands in one long-lived shell per agent
+    max_parallel_tools: int = 4  # Concurrent tool calls within one turn
 
     # Conversation settings
     max_turns: int = 50
 
+    # Context packing: keep the most relevant history verbatim under a token budget
+    context_packing: bool = True
+    context_token_budget: int = 60000  # ~240K chars, below the soft reset threshold
+
+    # Rolling summarization: fold aged-out turns into a running summary on a small model
+    rolling_summary: bool = True
+    summary_model_id: str = field(default_factory=lambda: os.environ.get("SUMMARY_MODEL_ID", "anthropic.claude-3-5-haiku-20241022-v1:0"))
+    summary_keep_turns: int = 8  # Recent turns always kept as full messages
+
+    # Result shaping: convert Confluence HTML to markdown and strip boilerplate from MCP results
+    shape_results: bool = True
+
+    # Continuous mode: push after this many local commits (and always at the end of a run)
+    push_every: int = 5
+
     def __post_init__(self):
         self.work_dir = Path(self.work_dir)
         self.output_dir = Path(self.output_dir)
@@ -99,42 +122,104 @@ class FileStore:
     - For current requests: return full content if < 50K, else reference
     - For historical messages: compact references replace full content
     - This optimizes context by not re-sending data Claude has already processed
+
+    The index is append-only JSON lines, one compact line per entry, so each
+    store() writes only its own entry. Previews live in <file_id>.preview.txt
+    next to the content and are read only when a reference is returned.
     """
 
     STORE_DIR = ".agent-store"
     INLINE_THRESHOLD = 50000  # Return inline if < 50K chars
+    PREVIEW_CHARS = 2500  # Cap on the skeleton preview built for oversized content
+
+    # Near-duplicate detection: bottom-k MinHash sketches over word shingles
+    SKETCH_SIZE = 64
+    SHINGLE_WORDS = 5
+    NEAR_DUP_MIN_CHARS = 2000  # Smaller content is not worth a delta
+    NEAR_DUP_JACCARD = 0.7  # Estimated shingle similarity to consider a candidate
+    NEAR_DUP_MAX_DELTA = 0.4  # Store as a delta only if the diff is this small relative to the content
+    MAX_DIFF_CHARS = 6000  # Diff shown to the model for a near-duplicate
 
     def __init__(self, work_dir: Path):
+        import threading
+
         self.work_dir = Path(work_dir).resolve()
         self.store_path = self.work_dir / self.STORE_DIR
         self.store_path.mkdir(parents=True, exist_ok=True)
         self._index: dict[str, dict] = {}  # file_id -> metadata
         self._content_hash_to_id: dict[str, str] = {}  # hash -> file_id for dedup
+        self._access_log: dict[str, list[list[int]]] = {}  # file_id -> merged [start, end) char ranges read
+        self._access_lock = threading.Lock()  # Reads come from worker threads of concurrent sessions
+        self._sketch_index: dict[int, set[str]] = {}  # sketch value -> file_ids of full (non-delta) entries
         self._load_index()
 
     def _index_path(self) -> Path:
-        return self.store_path / "index.json"
+        return self.store_path / "index.jsonl"
+
+    def _preview_path(self, file_id: str) -> Path:
+        return self.store_path / f"{file_id}.preview.txt"
 
     def _load_index(self):
         """Load the store index from disk."""
         try:
+            legacy = self.store_path / "index.json"
+            if legacy.exists() and not self._index_path().exists():
+                self._migrate_index(legacy)
             if self._index_path().exists():
-                self._index = json.loads(self._index_path().read_text())
+                with self._index_path().open() as f:
+                    for line in f:
+                        try:
+                            meta = json.loads(line)
+                        except ValueError:
+                            continue  # Torn last line of an interrupted append
+                        self._index[meta.pop("file_id")] = meta
                 # Rebuild hash lookup
                 for file_id, meta in self._index.items():
                     if "content_hash" in meta:
                         self._content_hash_to_id[meta["content_hash"]] = file_id
+                    if meta.get("sketch"):
+                        self._index_sketch(file_id, self._parse_sketch(meta["sketch"]))
         except Exception as e:
             logger.warning(f"Failed to load file store index: {e}")
             self._index = {}
 
-    def _save_index(self):
-        """Save the store index to disk."""
+    def _migrate_index(self, legacy: Path):
+        """Convert an index.json from older versions: previews to sidecar files, entries to index.jsonl."""
+        for file_id, meta in json.loads(legacy.read_text()).items():
+            preview = meta.pop("preview", None)
+            if preview:
+                self._preview_path(file_id).write_text(preview)
+            self._index[file_id] = meta
+        self._rewrite_index()
+        self._index = {}
+        legacy.unlink()
+
+    def _append_index(self, file_id: str):
+        """Append one entry to the index (a single compact line)."""
+        try:
+            with self._index_path().open("a") as f:
+                f.write(json.dumps({"file_id": file_id, **self._index[file_id]}, separators=(",", ":")) + "\n")
+        except Exception as e:
+            logger.warning(f"Failed to save file store index: {e}")
+
+    def _rewrite_index(self):
+        """Write the whole index again (after entries were removed)."""
         try:
-            self._index_path().write_text(json.dumps(self._index, indent=2))
+            lines = [json.dumps({"file_id": file_id, **meta}, separators=(",", ":")) + "\n" for file_id, meta in self._index.items()]
+            self._index_path().write_text("".join(lines))
         except Exception as e:
             logger.warning(f"Failed to save file store index: {e}")
 
+    def _preview(self, file_id: str, content: str, content_type: str) -> str:
+        """The stored preview of an entry, built and written on first use."""
+        path = self._preview_path(file_id)
+        try:
+            return path.read_text()
+        except FileNotFoundError:
+            preview = self.build_preview(content, content_type)
+            path.write_text(preview)
+            return preview
+
     def _hash_content(self, content: str) -> str:
         """Generate a short hash of content for deduplication."""
         import hashlib
@@ -165,7 +250,7 @@ class FileStore:
             existing_id = self._content_hash_to_id[content_hash]
             if existing_id in self._index:
                 # Already stored - return existing reference
-                return {
+                reference = {
                     "file_id": existing_id,
                     "size_bytes": size,
                     "lines": lines,
@@ -173,13 +258,22 @@ class FileStore:
                     "deduplicated": True,
                     "message": f"Content ({size:,} bytes, {lines} lines) available via read_from_store(file_id='{existing_id}')",
                 }
+                if size > self.INLINE_THRESHOLD:
+                    reference["preview"] = self._preview(existing_id, content, content_type)
+                return reference
 
-        # New content - store it
+        # New content - store it, as a delta if it nearly duplicates a stored file
         file_id = str(uuid.uuid4())[:8]
-        file_path = self.store_path / f"{file_id}.txt"
+        # Raw MCP results are never near-duplicate bases (their shaped form is), so are not sketched
+        sketch = self._sketch(content) if size >= self.NEAR_DUP_MIN_CHARS and "(raw)" not in source else []
+        near = self._near_duplicate(content, sketch, source) if sketch else None
 
-        # Write content
-        file_path.write_text(content)
+        if near:
+            file_path = self.store_path / f"{file_id}.delta.json"
+            file_path.write_text(json.dumps({"base": near["base"], "ops": near["ops"]}))
+        else:
+            file_path = self.store_path / f"{file_id}.txt"
+            file_path.write_text(content)
 
         # Update index
         self._index[file_id] = {
@@ -191,10 +285,243 @@ class FileStore:
             "created": datetime.now().isoformat(),
             "path": str(file_path.relative_to(self.work_dir)),
         }
+        if near:
+            self._index[file_id].update(delta_of=near["base"], similarity=near["similarity"])
+        elif sketch:
+            self._index[file_id]["sketch"] = " ".join(f"{value:x}" for value in sketch)
+            self._index_sketch(file_id, sketch)
         self._content_hash_to_id[content_hash] = file_id
-        self._save_index()
+        self._append_index(file_id)
+
+        delta_note = f", delta of {near['base']}" if near else ""
+        logger.info(f"📦 Stored result: {file_id} ({size:,} bytes from {source}{delta_note})")
+
+        reference = {
+            "file_id": file_id,
+            "size_bytes": size,
+            "lines": lines,
+            "stored_in_file_store": True,
+            "message": f"Content ({size:,} bytes, {lines} lines) available via read_from_store(file_id='{file_id}')",
+        }
+        # Oversized content will be returned by reference: describe its shape
+        if size > self.INLINE_THRESHOLD:
+            reference["preview"] = self._preview(file_id, content, content_type)
+        if near:
+            reference.update(near_duplicate_of=near["base"], similarity=near["similarity"], diff=near["diff"])
+        return reference
+
+    @classmethod
+    def _sketch(cls, content: str) -> list[int]:
+        """Bottom-k MinHash sketch: the SKETCH_SIZE smallest CRC32 hashes of the content's word shingles."""
+        import zlib
+
+        words = content.split()
+        n = cls.SHINGLE_WORDS
+        hashes = {zlib.crc32(" ".join(words[i : i + n]).encode()) for i in range(max(1, len(words) - n + 1))}
+        return heapq.nsmallest(cls.SKETCH_SIZE, hashes)
+
+    @staticmethod
+    def _parse_sketch(text: str) -> list[int]:
+        return [int(value, 16) for value in text.split()]
+
+    def _index_sketch(self, file_id: str, sketch: list[int]):
+        for value in sketch:
+            self._sketch_index.setdefault(value, set()).add(file_id)
+
+    @classmethod
+    def _jaccard(cls, a: list[int], b: list[int]) -> float:
+        """Estimate shingle-set Jaccard similarity from two bottom-k sketches."""
+        set_a, set_b = set(a), set(b)
+        union = heapq.nsmallest(cls.SKETCH_SIZE, set_a | set_b)
+        return sum(1 for value in union if value in set_a and value in set_b) / max(1, len(union))
+
+    def _near_duplicate(self, content: str, sketch: list[int], source: str) -> Optional[dict]:
+        """
+        Find a stored full entry this content nearly duplicates and compute the delta.
+
+        Candidates share sketch values with the content (an inverted index, so
+        the cost does not grow with the store); the best one by estimated
+        Jaccard is diffed line by line. Returns {base, similarity, ops, diff}
+        when the delta is small enough to be worth storing instead.
+        """
+        import difflib
+
+        shared: dict[str, int] = {}
+        for value in sketch:
+            for file_id in self._sketch_index.get(value, ()):
+                shared[file_id] = shared.get(file_id, 0) + 1
+        best, best_score = None, 0.0
+        for file_id, count in sorted(shared.items(), key=lambda kv: -kv[1])[:5]:
+            meta = self._index.get(file_id)
+            if not meta or "(raw)" in meta.get("source", "") or count < self.SKETCH_SIZE * self.NEAR_DUP_JACCARD / 2:
+                continue
+            score = self._jaccard(sketch, self._parse_sketch(meta["sketch"]))
+            if score > best_score:
+                best, best_score = file_id, score
+        if best is None or best_score < self.NEAR_DUP_JACCARD:
+            return None
+
+        base = self._load(best)
+        if base is None:
+            return None
+        base_lines, new_lines = base.splitlines(keepends=True), content.splitlines(keepends=True)
+        matcher = difflib.SequenceMatcher(None, base_lines, new_lines, autojunk=False)
+        ops = [[i1, i2, new_lines[j1:j2]] for tag, i1, i2, j1, j2 in matcher.get_opcodes() if tag != "equal"]
+        delta_chars = sum(len(line) for _, _, added in ops for line in added) + 20 * len(ops)
+        if delta_chars > len(content) * self.NEAR_DUP_MAX_DELTA:
+            return None
+
+        similarity = round(matcher.ratio(), 3)
+        diff = "".join(difflib.unified_diff(base_lines, new_lines, fromfile=best, tofile="new", n=1))
+        if len(diff) > self.MAX_DIFF_CHARS:
+            diff = diff[: self.MAX_DIFF_CHARS] + "\n... (diff truncated; read_from_store has the full content)"
+        return {"base": best, "similarity": similarity, "ops": ops, "diff": diff}
+
+    def _load(self, file_id: str) -> Optional[str]:
+        """Full content of a stored entry, rebuilding delta entries from their base."""
+        meta = self._index.get(file_id)
+        if not meta:
+            return None
+        file_path = self.work_dir / meta["path"]
+        if not file_path.exists():
+            return None
+        if "delta_of" not in meta:
+            return file_path.read_text()
+
+        base = self._load(meta["delta_of"])
+        if base is None:
+            return None
+        delta = json.loads(file_path.read_text())
+        base_lines = base.splitlines(keepends=True)
+        out, pos = [], 0
+        for i1, i2, added in delta["ops"]:
+            out.extend(base_lines[pos:i1])
+            out.extend(added)
+            pos = i2
+        out.extend(base_lines[pos:])
+        return "".join(out)
+
+    @classmethod
+    def build_preview(cls, content: str, content_type: str = "text") -> str:
+        """
+        Compact description of stored content: for JSON, a schema with key
+        counts and sample values; for text, the heading outline and first
+        paragraph. MCP results are unwrapped to the JSON in their text parts.
+        """
+        payload = None
+        if content_type == "json" or content.lstrip()[:1] in ("{", "["):
+            try:
+                payload = json.loads(content)
+            except ValueError:
+                payload = None
+        if payload is not None:
+            parts = payload.get("content") if isinstance(payload, dict) else None
+            if isinstance(parts, list) and parts and all(isinstance(p, dict) and p.get("type") == "text" for p in parts):
+                texts = [p.get("text", "") for p in parts]
+                try:
+                    payload = [json.loads(t) for t in texts] if len(texts) > 1 else json.loads(texts[0])
+                except ValueError:
+                    return cls._text_preview("\n\n".join(texts))
+            lines: list[str] = []
+            cls._describe(payload, lines, "", 0)
+            preview = "JSON structure:\n" + "\n".join(lines)
+        else:
+            preview = cls._text_preview(content)
+        return preview if len(preview) <= cls.PREVIEW_CHARS else preview[: cls.PREVIEW_CHARS] + "\n..."
+
+    @classmethod
+    def _describe(cls, value: Any, lines: list[str], indent: str, depth: int, label: str = ""):
+        """Append schema lines for value: types, lengths, key frequencies and short samples."""
+        prefix = f"{indent}{label}: " if label else indent
+        if isinstance(value, dict):
+            lines.append(f"{prefix}{{{len(value)} keys}}")
+            if depth >= 4:
+                return
+            for i, (key, item) in enumerate(value.items()):
+                if i == 20:
+                    lines.append(f"{indent}  ... {len(value) - 20} more keys")
+                    break
+                cls._describe(item, lines, indent + "  ", depth + 1, key)
+        elif isinstance(value, list):
+            dicts = [v for v in value[:50] if isinstance(v, dict)]
+            if dicts and depth < 4:
+                counts: dict[str, int] = {}
+                samples: dict[str, Any] = {}
+                for d in dicts:
+                    for key, item in d.items():
+                        counts[key] = counts.get(key, 0) + 1
+                        samples.setdefault(key, item)
+                lines.append(f"{prefix}list[{len(value)}] of objects, keys (in {len(dicts)} sampled):")
+                for key in list(counts)[:20]:
+                    cls._describe(samples[key], lines, indent + "  ", depth + 1, f"{key} ({counts[key]})")
+            else:
+                sample = f" e.g. {json.dumps(value[0])[:60]}" if value else ""
+                lines.append(f"{prefix}list[{len(value)}]{sample}")
+        elif isinstance(value, str):
+            sample = value[:80].replace("\n", "\\n")
+            lines.append(f"{prefix}str({len(value):,}) \"{sample}{'...' if len(value) > 80 else ''}\"")
+            if len(value) > 2000:
+                # Long documents (page bodies, file contents): show their headings
+                headings = [line.rstrip() for line in value.splitlines() if re.match(r"#{1,6} ", line)]
+                headings = headings or ["#" * int(level) + " " + re.sub(r"<[^>]+>", "", text) for level, text in re.findall(r"<h([1-6])[^>]*>(.*?)</h\1>", value)]
+                lines.extend(f"{indent}    {heading[:100]}" for heading in headings[:15])
+                if len(headings) > 15:
+                    lines.append(f"{indent}    ... {len(headings) - 15} more headings")
+        else:
+            lines.append(f"{prefix}{json.dumps(value)}")
+
+    @staticmethod
+    def _text_preview(text: str) -> str:
+        """Heading outline (markdown headings, at most 40) plus the first paragraph."""
+        outline = [line.rstrip() for line in text.splitlines() if re.match(r"#{1,6} ", line)]
+        paragraph = next((block.strip() for block in re.split(r"\n\s*\n", text) if block.strip() and not block.lstrip().startswith("#")), "")
+        parts = []
+        if outline:
+            parts.append("Outline:\n" + "\n".join(outline[:40]) + (f"\n... {len(outline) - 40} more headings" if len(outline) > 40 else ""))
+        parts.append("First paragraph:\n" + (paragraph[:600] + ("..." if len(paragraph) > 600 else "")))
+        return "\n\n".join(parts)
+
+    def adopt(self, path: Path, source: str, content_type: str = "text") -> dict:
+        """
+        Move an already-written file (e.g. spilled command output) into the store.
+
+        Like store(), but the content is hashed and counted in chunks rather
+        than loaded into memory. A duplicate of stored content is deleted and the
+        existing id returned.
+        """
+        import hashlib
+        import uuid
 
-        logger.info(f"📦 Stored result: {file_id} ({size:,} bytes from {source})")
+        digest = hashlib.sha256()
+        size = 0
+        lines = 1
+        with open(path) as f:
+            while chunk := f.read(1 << 20):
+                digest.update(chunk.encode())
+                size += len(chunk)
+                lines += chunk.count("\n")
+        content_hash = digest.hexdigest()[:12]
+
+        existing_id = self._content_hash_to_id.get(content_hash)
+        if existing_id in self._index:
+            Path(path).unlink(missing_ok=True)
+            file_id = existing_id
+        else:
+            file_id = str(uuid.uuid4())[:8]
+            file_path = self.store_path / f"{file_id}.txt"
+            os.replace(path, file_path)
+            self._index[file_id] = {
+                "source": source,
+                "content_type": content_type,
+                "content_hash": content_hash,
+                "size": size,
+                "lines": lines,
+                "created": datetime.now().isoformat(),
+                "path": str(file_path.relative_to(self.work_dir)),
+            }
+            self._content_hash_to_id[content_hash] = file_id
+            self._append_index(file_id)
+            logger.info(f"📦 Stored result: {file_id} ({size:,} bytes from {source})")
 
         return {
             "file_id": file_id,
@@ -204,6 +531,26 @@ class FileStore:
             "message": f"Content ({size:,} bytes, {lines} lines) available via read_from_store(file_id='{file_id}')",
         }
 
+    def _record_access(self, file_id: str, start: int, end: int) -> float:
+        """
+        Record a read of [start, end) and return the fraction already read before.
+        Ranges are kept merged, so the log stays small however often a file is read.
+        """
+        if end <= start:
+            return 0.0
+        with self._access_lock:
+            ranges = self._access_log.get(file_id, [])
+            overlap = sum(max(0, min(end, r_end) - max(start, r_start)) for r_start, r_end in ranges)
+
+            merged = []
+            for r_start, r_end in sorted(ranges + [[start, end]]):
+                if merged and r_start <= merged[-1][1]:
+                    merged[-1][1] = max(merged[-1][1], r_end)
+                else:
+                    merged.append([r_start, r_end])
+            self._access_log[file_id] = merged
+        return overlap / (end - start)
+
     def read(self, file_id: str, offset: int = 0, limit: Optional[int] = None) -> dict:
         """
         Read content from the store using CHARACTER-based offsets.
@@ -222,13 +569,10 @@ class FileStore:
             return {"error": f"File ID '{file_id}' not found in store"}
 
         metadata = self._index[file_id]
-        file_path = self.work_dir / metadata["path"]
-
-        if not file_path.exists():
-            return {"error": f"File for ID '{file_id}' no longer exists"}
-
         try:
-            content = file_path.read_text()
+            content = self._load(file_id)
+            if content is None:
+                return {"error": f"File for ID '{file_id}' no longer exists"}
             total_chars = len(content)
 
             # Apply offset and limit (character-based)
@@ -257,6 +601,11 @@ class FileStore:
                 "content": selected_content,
             }
 
+            # Flag re-reads so the model (and loop detection) can see wasted turns
+            previously_read = self._record_access(file_id, offset, end)
+            if previously_read > 0:
+                result["previously_read_pct"] = int(previously_read * 100)
+
             if remaining_chars > 0:
                 # Make it VERY clear there's more data
                 pct_shown = int((end / total_chars) * 100)
@@ -296,10 +645,12 @@ class FileStore:
                 file_path = self.work_dir / self._index[file_id]["path"]
                 if file_path.exists():
                     file_path.unlink()
+                self._preview_path(file_id).unlink(missing_ok=True)
                 del self._index[file_id]
             except Exception as e:
                 logger.warning(f"Failed to delete {file_id}: {e}")
-        self._save_index()
+        self._sketch_index.clear()
+        self._rewrite_index()
         logger.info("🗑️  Cleared file store")
 
     def get_tool_definitions(self) -> list[dict]:
@@ -331,11 +682,590 @@ class FileStore:
         ]
 
 
+# =============================================================================
+# Workspace Search Index - Trigram index over the work dir
+# =============================================================================
+
+
+class WorkspaceIndex:
+    """
+    Trigram inverted index over the text files in the work dir.
+
+    Each search first walks the tree and compares mtime and size, re-indexing
+    only files that changed, so the index stays current without a watcher.
+    Candidates are the files containing every trigram of the pattern's
+    required literals; only those are read and matched line by line.
+    """
+
+    SKIP_DIRS = {".git", "node_modules", "__pycache__", ".venv", "venv"}
+    MAX_FILE_BYTES = 2_000_000
+    MAX_LINE_CHARS = 240
+
+    def __init__(self, root: Path):
+        import threading
+
+        self.root = Path(root).resolve()
+        self._files: dict[str, tuple[int, int, frozenset[str]]] = {}  # rel path -> (mtime_ns, size, trigrams)
+        self._postings: dict[str, set[str]] = {}  # trigram -> rel paths
+        self._lock = threading.Lock()
+        self.scans = 0
+        self.reindexed = 0  # Files (re)read by the last scan
+
+    @staticmethod
+    def _trigrams(text: str) -> set[str]:
+        return {text[i : i + 3] for i in range(len(text) - 2)}
+
+    @classmethod
+    def walk(cls, root: Path):
+        """Yield (relative posix path, stat) for the indexable files under root."""
+        skip = cls.SKIP_DIRS | {FileStore.STORE_DIR, GitWorkspace.WORKTREE_DIR}
+        stack = [root]
+        while stack:
+            try:
+                with os.scandir(stack.pop()) as it:
+                    for entry in it:
+                        if entry.is_dir(follow_symlinks=False):
+                            if entry.name not in skip:
+                                stack.append(Path(entry.path))
+                        elif entry.is_file(follow_symlinks=False):
+                            st = entry.stat(follow_symlinks=False)
+                            if st.st_size <= cls.MAX_FILE_BYTES:
+                                yield Path(entry.path).relative_to(root).as_posix(), st
+            except OSError:
+                continue
+
+    def _drop(self, rel: str):
+        old = self._files.pop(rel, None)
+        if old:
+            for gram in old[2]:
+                paths = self._postings.get(gram)
+                if paths:
+                    paths.discard(rel)
+                    if not paths:
+                        del self._postings[gram]
+
+    def refresh(self):
+        """Bring the index up to date by mtime/size scan."""
+        with self._lock:
+            seen = set()
+            self.reindexed = 0
+            for rel, st in self.walk(self.root):
+                seen.add(rel)
+                known = self._files.get(rel)
+                if known and known[0] == st.st_mtime_ns and known[1] == st.st_size:
+                    continue
+                self._drop(rel)
+                try:
+                    data = (self.root / rel).read_bytes()
+                except OSError:
+                    continue
+                if b"\0" in data[:8192]:
+                    grams = frozenset()  # Binary: tracked, never a candidate
+                else:
+                    grams = frozenset(self._trigrams(data.decode("utf-8", errors="replace").lower()))
+                self._files[rel] = (st.st_mtime_ns, st.st_size, grams)
+                for gram in grams:
+                    self._postings.setdefault(gram, set()).add(rel)
+                self.reindexed += 1
+            for rel in set(self._files) - seen:
+                self._drop(rel)
+            self.scans += 1
+
+    @staticmethod
+    def _required_literals(pattern: str) -> list[str]:
+        """Literal runs every match must contain (empty if that cannot be determined cheaply)."""
+        if "|" in pattern or "(" in pattern:
+            return []
+        stripped = re.sub(r"\\.|\[[^\]]*\]|.[?*]|.\{0(,\d*)?\}", "\0", pattern)
+        return [run for run in re.split(r"[.^$*+?{}\[\]\\\0]+", stripped) if len(run) >= 3]
+
+    def candidates(self, pattern: str) -> list[str]:
+        literals = self._required_literals(pattern)
+        if not literals:
+            return sorted(rel for rel, meta in self._files.items() if meta[2])
+        result: Optional[set[str]] = None
+        for literal in literals:
+            for gram in self._trigrams(literal.lower()):
+                paths = self._postings.get(gram, set())
+                result = set(paths) if result is None else result & paths
+                if not result:
+                    return []
+        return sorted(result or [])
+
+    def search(self, pattern: str, glob: Optional[str] = None, max_results: int = 30, context_lines: int = 0) -> dict[str, Any]:
+        """
+        Search the workspace for a regex (case-insensitive unless it has capitals).
+
+        Files are ranked by matches in their path, then in markdown headings,
+        then by match count; at most max_results matching lines are returned,
+        each with its line number and up to context_lines lines either side.
+        """
+        import fnmatch
+
+        flags = 0 if any(c.isupper() for c in pattern) else re.IGNORECASE
+        try:
+            regex = re.compile(pattern, flags)
+        except re.error as e:
+            return {"success": False, "error": f"Invalid pattern: {e}"}
+
+        self.refresh()
+        files = self.candidates(pattern)
+        if glob:
+            files = [rel for rel in files if fnmatch.fnmatch(rel, glob) or ("/" not in glob and fnmatch.fnmatch(rel.rsplit("/", 1)[-1], glob))]
+
+        ranked = []
+        for rel in files:
+            try:
+                lines = (self.root / rel).read_text(errors="replace").splitlines()
+            except OSError:
+                continue
+            hits = [i for i, line in enumerate(lines) if regex.search(line)]
+            if hits:
+                headings = sum(1 for i in hits if lines[i].lstrip().startswith("#"))
+                ranked.append(((not regex.search(rel), -headings, -len(hits), rel), rel, lines, hits))
+        ranked.sort(key=lambda r: r[0])
+
+        matches = []
+        for _, rel, lines, hits in ranked:
+            for i in hits:
+                if len(matches) >= max_results:
+                    break
+                match = {"path": rel, "line": i + 1, "text": lines[i][: self.MAX_LINE_CHARS]}
+                if context_lines:
+                    match["before"] = [line[: self.MAX_LINE_CHARS] for line in lines[max(0, i - context_lines) : i]]
+                    match["after"] = [line[: self.MAX_LINE_CHARS] for line in lines[i + 1 : i + 1 + context_lines]]
+                matches.append(match)
+
+        total = sum(len(r[3]) for r in ranked)
+        return {
+            "success": True,
+            "matches": matches,
+            "total_matches": total,
+            "files_matched": len(ranked),
+            "files": [r[1] for r in ranked[:10]],
+            "truncated": total > len(matches),
+            "files_scanned": len(files),
+            "files_indexed": len(self._files),
+        }
+
+
+# =============================================================================
+# Documentation Index - Digest of the markdown files in the work dir
+# =============================================================================
+
+
+class DocIndex:
+    """
+    Per-file digest of every markdown file in the work dir: title, headings,
+    a short summary paragraph, outbound links and last-updated date.
+
+    Answers "what do we already have about X" without reading the docs.
+    Writes through ShellTool update their entry immediately (note_write);
+    before each query an mtime/size scan re-parses only files changed by
+    other means (bash, git), as WorkspaceIndex does.
+    """
+
+    MAX_HEADINGS = 40  # Per file, levels 1-3
+    DIGEST_CHARS = 280
+    MAX_LINKS = 30
+    LINK_RE = re.compile(r"\[[^\]]*\]\(\s*<?([^)\s>]+)>?(?:\s+\"[^\"]*\")?\s*\)")
+    UPDATED_RE = re.compile(r"last[ _-]?updated\W{0,6}(\d{4}-\d{2}-\d{2})", re.IGNORECASE)
+
+    def __init__(self, root: Path):
+        import threading
+
+        self.root = Path(root).resolve()
+        self._docs: dict[str, dict] = {}  # rel path -> digest (with mtime_ns and size)
+        self._lock = threading.Lock()
+
+    def _parse(self, rel: str, text: str, st: os.stat_result) -> dict:
+        import posixpath
+
+        headings, links, external, digest = [], [], [], ""
+        in_code = in_front_matter = False
+        paragraph: list[str] = []
+        for n, line in enumerate(text.splitlines()):
+            stripped = line.strip()
+            if n == 0 and stripped == "---":
+                in_front_matter = True
+                continue
+            if in_front_matter:
+                in_front_matter = stripped != "---"
+                continue
+            if stripped.startswith(("```", "~~~")):
+                in_code = not in_code
+                continue
+            if in_code:
+                continue
+            heading = re.match(r"(#{1,3})\s+(.+?)\s*#*$", stripped)
+            if heading:
+                if len(headings) < self.MAX_HEADINGS:
+                    headings.append("#" * len(heading.group(1)) + " " + heading.group(2))
+            elif not digest:
+                prose = stripped.lstrip("> ").strip()
+                if prose and not prose.startswith(("|", "---", "<!--", "![")) and not self.UPDATED_RE.search(prose):
+                    paragraph.append(prose)
+                elif paragraph:
+                    digest = " ".join(paragraph)
+            for target in self.LINK_RE.findall(line):
+                if re.match(r"[a-z][a-z0-9+.-]*:", target, re.IGNORECASE):
+                    if target.startswith(("http://", "https://")) and target not in external:
+                        external.append(target)
+                elif not target.startswith("#"):
+                    resolved = posixpath.normpath(posixpath.join(posixpath.dirname(rel), target.split("#", 1)[0]))
+                    if resolved not in links:
+                        links.append(resolved)
+        digest = digest or " ".join(paragraph)
+        if len(digest) > self.DIGEST_CHARS:
+            digest = digest[: self.DIGEST_CHARS].rsplit(" ", 1)[0] + "…"
+
+        updated = self.UPDATED_RE.search(text)
+        title = next((h.split(" ", 1)[1] for h in headings if h.startswith("# ")), headings[0].split(" ", 1)[1] if headings else Path(rel).stem)
+        return {
+            "mtime_ns": st.st_mtime_ns,
+            "size": st.st_size,
+            "title": title,
+            "headings": headings,
+            "digest": digest,
+            "links": links[: self.MAX_LINKS],
+            "external_links": external[: self.MAX_LINKS],
+            "last_updated": updated.group(1) if updated else None,
+            "modified": datetime.fromtimestamp(st.st_mtime).strftime("%Y-%m-%d"),
+        }
+
+    def _index_file(self, rel: str, st: os.stat_result):
+        try:
+            text = (self.root / rel).read_text(errors="replace")
+        except OSError:
+            self._docs.pop(rel, None)
+            return
+        self._docs[rel] = self._parse(rel, text, st)
+
+    def note_write(self, resolved: Path):
+        """Re-index one file after a write (no-op for non-markdown files)."""
+        if resolved.suffix.lower() not in (".md", ".markdown"):
+            return
+        try:
+            rel = resolved.relative_to(self.root).as_posix()
+            st = resolved.stat()
+        except (ValueError, OSError):
+            return
+        with self._lock:
+            self._index_file(rel, st)
+
+    def refresh(self):
+        """Bring the index up to date by mtime/size scan."""
+        with self._lock:
+            seen = set()
+            for rel, st in WorkspaceIndex.walk(self.root):
+                if not rel.lower().endswith((".md", ".markdown")):
+                    continue
+                seen.add(rel)
+                known = self._docs.get(rel)
+                if not known or known["mtime_ns"] != st.st_mtime_ns or known["size"] != st.st_size:
+                    self._index_file(rel, st)
+            for rel in set(self._docs) - seen:
+                del self._docs[rel]
+
+    def _inbound(self, rel: str) -> list[str]:
+        return sorted(other for other, doc in self._docs.items() if rel in doc["links"])
+
+    def find(self, query: Optional[str] = None, path: Optional[str] = None, max_results: int = 10) -> dict[str, Any]:
+        """
+        Look up existing docs.
+
+        With path: that doc's full entry, including the docs linking to it.
+        With query: docs ranked by term matches in title, path, headings and
+        digest, each with its matching headings. With neither: every doc's
+        path, title and dates.
+        """
+        self.refresh()
+        if path:
+            rel = path[len(str(self.root)) :] if path.startswith(str(self.root)) else path
+            rel = rel.strip("/")
+            if rel not in self._docs:
+                rel = next((r for r in sorted(self._docs) if r.endswith("/" + rel)), rel)  # Allow a path suffix
+            doc = self._docs.get(rel)
+            if doc is None:
+                return {"success": False, "error": f"No markdown file '{path}' in the index"}
+            return {
+                "success": True,
+                "path": rel,
+                **{k: v for k, v in doc.items() if k != "mtime_ns"},
+                "linked_from": self._inbound(rel),
+                "broken_links": [link for link in doc["links"] if link not in self._docs and not (self.root / link).exists()],
+            }
+
+        if not query:
+            return {
+                "success": True,
+                "total_docs": len(self._docs),
+                "docs": [{"path": rel, "title": doc["title"], "last_updated": doc["last_updated"] or doc["modified"]} for rel, doc in sorted(self._docs.items())],
+            }
+
+        terms = [t for t in re.findall(r"[a-z0-9]+", query.lower()) if len(t) > 1]
+        if not terms:
+            return {"success": False, "error": "Query has no searchable terms"}
+        ranked = []
+        for rel, doc in self._docs.items():
+            title, path_text, digest = doc["title"].lower(), rel.lower(), doc["digest"].lower()
+            matched_headings = [h for h in doc["headings"] if any(t in h.lower() for t in terms)]
+            score = sum(5 * (t in title) + 3 * (t in path_text) + 1 * (t in digest) for t in terms) + 2 * len(matched_headings)
+            if score:
+                ranked.append((score, rel, doc, matched_headings))
+        ranked.sort(key=lambda r: (-r[0], r[1]))
+
+        results = [
+            {
+                "path": rel,
+                "title": doc["title"],
+                "digest": doc["digest"],
+                "headings": (matched or doc["headings"])[:8],
+                "links": doc["links"][:10],
+                "linked_from": self._inbound(rel)[:10],
+                "last_updated": doc["last_updated"] or doc["modified"],
+                "size_bytes": doc["size"],
+            }
+            for _, rel, doc, matched in ranked[:max_results]
+        ]
+        return {"success": True, "query": query, "results": results, "total_matches": len(ranked), "total_docs": len(self._docs)}
+
+
 # =============================================================================
 # Shell Tool
 # =============================================================================
 
 
+class _CapturedStream:
+    """
+    Bounded capture of one output stream of an async shell command.
+
+    The first max_chars stay in memory. Past that, everything (including what
+    was buffered) goes to a spill file under the file store, and only the last
+    max_chars // 2 are kept in memory for the tail shown inline.
+    """
+
+    def __init__(self, name: str, max_chars: int, file_store: Optional["FileStore"]):
+        self.name = name
+        self.max_chars = max_chars
+        self.file_store = file_store
+        self.total = 0
+        self._decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        self._head: list[str] = []
+        self._tail = ""
+        self._spill = None
+        self._spill_path: Optional[Path] = None
+
+    def feed(self, chunk: bytes, final: bool = False) -> str:
+        text = self._decoder.decode(chunk, final=final)
+        if not text:
+            return text
+        self.total += len(text)
+        if self._spill is None and self.total <= self.max_chars:
+            self._head.append(text)
+            return text
+
+        if self._spill is None:
+            buffered = "".join(self._head) + text
+            if self.file_store is not None:
+                import uuid
+
+                self._spill_path = self.file_store.store_path / f".spill-{uuid.uuid4().hex[:8]}.tmp"
+                self._spill = self._spill_path.open("w")
+                self._spill.write(buffered)
+            else:
+                self._spill = False  # Nowhere to spill: keep head and tail only
+            self._head = [buffered[: self.max_chars // 2]]
+            self._tail = buffered[self.max_chars // 2 :][-(self.max_chars // 2) :]
+            return text
+        if self._spill:
+            self._spill.write(text)
+        self._tail = (self._tail + text)[-(self.max_chars // 2) :]
+        return text
+
+    def last_line(self) -> str:
+        text = self._tail or (self._head[-1] if self._head else "")
+        lines = text.rstrip().rsplit("\n", 1)
+        return lines[-1] if lines else ""
+
+    def discard(self):
+        if self._spill:
+            self._spill.close()
+            self._spill_path.unlink(missing_ok=True)
+        self._spill = None
+
+    def result(self, source: str) -> dict:
+        """The inline text for this stream, plus a file store reference when it spilled."""
+        if self._spill is None:
+            return {self.name: "".join(self._head)}
+
+        head = "".join(self._head)
+        omitted = self.total - len(head) - len(self._tail)
+        out = {
+            self.name: f"{head}\n\n... [{omitted:,} chars omitted, {self.total:,} total] ...\n\n{self._tail}",
+            f"{self.name}_chars": self.total,
+        }
+        if self._spill:
+            self._spill.close()
+            ref = self.file_store.adopt(self._spill_path, f"{source} ({self.name})")
+            out[f"{self.name}_file_id"] = ref["file_id"]
+            out[self.name] += f"\n\nFull {self.name}: read_from_store(file_id='{ref['file_id']}')"
+        self._spill = None
+        return out
+
+
+class PersistentShell:
+    """
+    A long-lived bash process that runs commands one at a time.
+
+    Each command is passed to eval through a quoted heredoc, so cd and exported
+    variables persist between calls, and is followed by a random sentinel on
+    stdout (with the exit code and working directory) and on stderr that marks
+    where its output ends. If a command leaves the shell outside the workspace,
+    the shell is moved back. On timeout or cancellation the shell's process
+    group is killed and the next command starts a fresh shell.
+    """
+
+    def __init__(self, work_dir: Path, file_store: Optional["FileStore"], max_capture: int):
+        self.work_dir = work_dir
+        self.file_store = file_store
+        self.max_capture = max_capture
+        self.proc: Optional[asyncio.subprocess.Process] = None
+        self.commands = 0  # Commands run by the current shell process
+        self._lock = asyncio.Lock()
+
+    async def _start(self):
+        self.proc = await asyncio.create_subprocess_exec(
+            "bash", "--noprofile", "--norc",
+            cwd=self.work_dir,
+            env={**os.environ, "HOME": str(self.work_dir), "PWD": str(self.work_dir)},
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            start_new_session=True,
+        )
+        self.commands = 0
+        logger.info(f"Started persistent shell (pid {self.proc.pid})")
+
+    async def _read_until(self, stream: asyncio.StreamReader, token: bytes, capture: "_CapturedStream", name: str, on_output) -> Optional[bytes]:
+        """Feed stream output to capture up to token; return what follows it on that line, or None at EOF."""
+        pending = b""
+        while True:
+            chunk = await stream.read(65536)
+            if not chunk:
+                capture.feed(pending, final=True)
+                return None
+            pending += chunk
+            at = pending.find(token)
+            if at != -1:
+                text = capture.feed(pending[:at], final=True)
+                if text and on_output:
+                    on_output(name, text)
+                rest = pending[at + len(token):]
+                while b"\n" not in rest and (more := await stream.read(4096)):
+                    rest += more
+                return rest.split(b"\n", 1)[0]
+            # Hold back a possible partial token at the end of the buffer
+            keep = len(token) - 1
+            if len(pending) > keep:
+                text = capture.feed(pending[:-keep])
+                pending = pending[-keep:]
+                if text and on_output:
+                    on_output(name, text)
+
+    async def run(self, command: str, timeout: int, on_output: Optional[Callable[[str, str], None]] = None) -> dict[str, Any]:
+        """Run one command in the shell; returns the same fields as ShellTool.execute_async."""
+        import uuid
+
+        async with self._lock:
+            if self.proc is None or self.proc.returncode is not None:
+                await self._start()
+            proc = self.proc
+            token = f"__AGENT_DONE_{uuid.uuid4().hex}__"
+            script = (
+                f"eval \"$(cat <<'{token}'\n{command}\n{token}\n)\" < /dev/null\n"
+                f"__agent_rc=$?\n"
+                f"printf '%s %d %s\\n' '{token}' \"$__agent_rc\" \"$PWD\"\n"
+                f"printf '%s\\n' '{token}' >&2\n"
+            )
+            captures = {"stdout": _CapturedStream("stdout", self.max_capture, self.file_store), "stderr": _CapturedStream("stderr", self.max_capture, self.file_store)}
+            notes = []
+            returncode = -1
+            try:
+                proc.stdin.write(script.encode())
+                await proc.stdin.drain()
+                status, _ = await asyncio.wait_for(
+                    asyncio.gather(
+                        self._read_until(proc.stdout, token.encode(), captures["stdout"], "stdout", on_output),
+                        self._read_until(proc.stderr, token.encode(), captures["stderr"], "stderr", on_output),
+                    ),
+                    timeout,
+                )
+                self.commands += 1
+                if status is None:
+                    returncode = await proc.wait()
+                    self.proc = None
+                    notes.append("Shell exited; the next command starts a new shell (working directory and variables are reset)")
+                else:
+                    code, _, cwd = status.decode(errors="replace").strip().partition(" ")
+                    returncode = int(code)
+                    if not Path(cwd).resolve().is_relative_to(self.work_dir):
+                        await self._reset_cwd(proc, timeout)
+                        notes.append(f"Working directory '{cwd}' is outside the workspace; reset to {self.work_dir}")
+            except asyncio.TimeoutError:
+                await self._kill()
+                notes.append(f"Command timed out after {timeout} seconds (shell restarted)")
+            except (asyncio.CancelledError, Exception) as e:
+                await self._kill()
+                for capture in captures.values():
+                    capture.discard()
+                if isinstance(e, asyncio.CancelledError):
+                    raise
+                return {"success": False, "returncode": -1, "stdout": "", "stderr": str(e)}
+
+        result = {"success": returncode == 0, "returncode": returncode}
+        for capture in captures.values():
+            result.update(capture.result(f"bash: {command[:80]}"))
+        if notes:
+            result["stderr"] = "\n".join(([result["stderr"].rstrip("\n")] if result["stderr"] else []) + notes)
+        return result
+
+    async def _reset_cwd(self, proc: asyncio.subprocess.Process, timeout: int):
+        token = f"__AGENT_CD_{os.urandom(8).hex()}__"
+        proc.stdin.write(f"cd -- {shlex.quote(str(self.work_dir))}; export PWD; echo {token}; echo {token} >&2\n".encode())
+        await proc.stdin.drain()
+        sink = _CapturedStream("reset", 1000, None)
+        await asyncio.wait_for(asyncio.gather(*(self._read_until(s, token.encode(), sink, "reset", None) for s in (proc.stdout, proc.stderr))), timeout)
+
+    async def _kill(self):
+        proc, self.proc = self.proc, None
+        if proc is None or proc.returncode is not None:
+            return
+        for sig in (signal.SIGTERM, signal.SIGKILL):
+            try:
+                os.killpg(proc.pid, sig)
+            except ProcessLookupError:
+                break
+            try:
+                await asyncio.wait_for(proc.wait(), ShellTool.KILL_GRACE)
+                break
+            except asyncio.TimeoutError:
+                continue
+        logger.warning(f"Killed persistent shell process group {proc.pid}")
+
+    async def close(self):
+        """End the shell (EOF on stdin), killing it if it does not exit promptly."""
+        proc = self.proc
+        if proc is None or proc.returncode is not None:
+            return
+        try:
+            proc.stdin.close()
+            await asyncio.wait_for(proc.wait(), ShellTool.KILL_GRACE)
+            self.proc = None
+        except (asyncio.TimeoutError, Exception):
+            await self._kill()
+
+
 class ShellTool:
     """
     Provides shell command execution capabilities.
@@ -353,12 +1283,30 @@ class ShellTool:
         r"\bln\s+-s",  # Symlinks could escape sandbox
     ]
 
-    def __init__(self, work_dir: Path, timeout: int = 300):
+    MAX_CAPTURE_CHARS = 50000  # Per stream; beyond this output spills to the file store
+    DEFAULT_WINDOW_LINES = 200  # read_file lines returned when end_line is omitted
+    DEFAULT_RANGE_BYTES = 20000  # read_file bytes returned when limit is omitted
+    MAX_DIFF_LINES = 40  # edit_file diff lines returned
+    PROGRESS_INTERVAL = 15  # Seconds between progress log lines for long-running commands
+    KILL_GRACE = 2  # Seconds between SIGTERM and SIGKILL of a timed-out process group
+
+    def __init__(self, work_dir: Path, timeout: int = 300, file_store: Optional["FileStore"] = None, persistent: bool = False):
         self.work_dir = Path(work_dir).resolve()  # Get absolute path
         self.timeout = timeout
+        self.file_store = file_store  # Where execute_async spills large output
+        self.index = WorkspaceIndex(self.work_dir)  # Backs search_workspace; built on first search
+        self.docs = DocIndex(self.work_dir)  # Backs find_docs; kept current by writes through this tool
+        # Opt-in long-lived shell for execute_async (cd and exports persist between commands)
+        self.session = PersistentShell(self.work_dir, file_store, self.MAX_CAPTURE_CHARS) if persistent else None
         self.work_dir.mkdir(parents=True, exist_ok=True)
         self._blocked_re = [re.compile(p) for p in self.BLOCKED_PATTERNS]
 
+        # Session memo for read-only tools: (tool, resolved path) -> signature,
+        # turn first returned and file store id of that result
+        self._memo: dict[tuple[str, str], dict] = {}
+        self._line_index: dict[str, tuple[tuple, array]] = {}  # resolved path -> (signature, line start offsets)
+        self.current_turn = 0  # Set by the agent each turn
+
     def _resolve_safe_path(self, path: str) -> tuple[Path, Optional[str]]:
         """
         Resolve a path and ensure it's within work_dir.
@@ -392,83 +1340,258 @@ class ShellTool:
                 return f"Blocked potentially dangerous command pattern: {pattern.pattern}"
         return None
 
-    def execute(self, command: str, description: str = "") -> dict[str, Any]:
+    def _file_signature(self, resolved: Path) -> tuple:
+        st = resolved.stat()
+        return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+    def _dir_signature(self, resolved: Path) -> tuple:
+        """Directory listings change when any entry's size or mtime does, not only the dir's own mtime."""
+        st = resolved.stat()
+        entries = []
+        with os.scandir(resolved) as it:
+            for entry in it:
+                est = entry.stat(follow_symlinks=False)
+                entries.append((entry.name, est.st_mtime_ns, est.st_size))
+        return (st.st_mtime_ns, st.st_ino, hash(tuple(sorted(entries))))
+
+    def _memo_hit(self, tool: str, resolved: Path, signature: tuple) -> Optional[dict]:
+        """Return an 'unchanged' result if this exact content was already returned and stored."""
+        memo = self._memo.get((tool, str(resolved)))
+        if not memo or memo["signature"] != signature or not memo.get("file_id"):
+            return None
+        logger.info(f"♻️  {tool}: {resolved.name} unchanged since turn {memo['turn']}")
+        return {
+            "success": True,
+            "unchanged": True,
+            "path": str(resolved),
+            "file_id": memo["file_id"],
+            "message": (
+                f"Unchanged since turn {memo['turn']}, see file_id {memo['file_id']} "
+                f"(read_from_store(file_id='{memo['file_id']}')). Pass force=true to re-read."
+            ),
+        }
+
+    def remember_result(self, tool: str, path: str, file_id: str, tool_use_id: Optional[str] = None):
+        """Attach the file store id (and tool_use id) of a returned read_file/list_directory result to its memo entry."""
+        resolved, error = self._resolve_safe_path(path)
+        memo = self._memo.get((tool, str(resolved)))
+        if not error and memo and not memo.get("file_id"):
+            memo["file_id"] = file_id
+            memo["tool_use_id"] = tool_use_id
+
+    def reset_memo(self):
+        """Forget every memoized result (the conversation that saw them is gone)."""
+        self._memo.clear()
+
+    def forget_results(self, tool_use_ids: set[str]):
+        """Drop memo entries whose result was in messages that left the context."""
+        for key, memo in list(self._memo.items()):
+            if memo.get("tool_use_id") in tool_use_ids:
+                del self._memo[key]
+
+    def invalidate(self, resolved: Path):
+        """Drop memo entries for a path and the listing of its parent; re-index it if it is a doc."""
+        self._memo.pop(("read_file", str(resolved)), None)
+        self._memo.pop(("list_directory", str(resolved)), None)
+        self._memo.pop(("list_directory", str(resolved.parent)), None)
+        self.docs.note_write(resolved)
+
+    def _invalidate_for_command(self, command: str):
+        """Drop memo entries for any path a bash command mentions (mtime checks catch the rest)."""
+        for tool, path in list(self._memo):
+            p = Path(path)
+            if p.name in command or str(p.relative_to(self.work_dir)) in command:
+                self._memo.pop((tool, path), None)
+
+    async def execute_async(self, command: str, description: str = "", on_output: Optional[Callable[[str, str], None]] = None) -> dict[str, Any]:
         """
-        Execute a shell command and return the result.
-        Command runs with cwd set to work_dir and is checked for dangerous patterns.
+        Execute a shell command without blocking the event loop.
 
-        Args:
-            command: The bash command to execute
-            description: Human-readable description of why this command is being run
+        Output is read incrementally and passed to on_output(stream, text) as it
+        arrives. Each stream keeps at most MAX_CAPTURE_CHARS in memory: beyond
+        that, the full output is written to a spill file and adopted into the
+        file store, and the result carries its head and tail plus
+        stdout_file_id/stderr_file_id. The command runs in its own process
+        group, which is killed on timeout or when the calling task is cancelled.
 
         Returns:
             Dict with 'returncode', 'stdout', 'stderr', and 'success' keys
         """
+        import time
+
         logger.info(f"Shell: {description or command[:100]}")
 
-        # Check command safety
         safety_error = self._check_command_safety(command)
         if safety_error:
             logger.warning(f"Blocked command: {safety_error}")
-            return {
-                "success": False,
-                "returncode": -1,
-                "stdout": "",
-                "stderr": safety_error,
-            }
+            return {"success": False, "returncode": -1, "stdout": "", "stderr": safety_error}
 
-        try:
-            # Create a restricted environment
-            safe_env = {
-                **os.environ,
-                "HOME": str(self.work_dir),
-                "PWD": str(self.work_dir),
-            }
+        self._invalidate_for_command(command)
 
-            result = subprocess.run(
+        if self.session is not None:
+            return await self.session.run(command, self.timeout, on_output)
+
+        try:
+            proc = await asyncio.create_subprocess_shell(
                 command,
-                shell=True,
                 cwd=self.work_dir,
-                capture_output=True,
-                text=True,
-                timeout=self.timeout,
-                env=safe_env,
+                env={**os.environ, "HOME": str(self.work_dir), "PWD": str(self.work_dir)},
+                stdin=asyncio.subprocess.DEVNULL,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
+                start_new_session=True,  # Own process group, so the whole pipeline can be killed
             )
-
-            return {
-                "success": result.returncode == 0,
-                "returncode": result.returncode,
-                "stdout": result.stdout,
-                "stderr": result.stderr,
-            }
-        except subprocess.TimeoutExpired:
-            return {
-                "success": False,
-                "returncode": -1,
-                "stdout": "",
-                "stderr": f"Command timed out after {self.timeout} seconds",
-            }
         except Exception as e:
-            return {
-                "success": False,
-                "returncode": -1,
-                "stdout": "",
-                "stderr": str(e),
-            }
+            return {"success": False, "returncode": -1, "stdout": "", "stderr": str(e)}
+
+        started = time.monotonic()
+        captures = {"stdout": _CapturedStream("stdout", self.MAX_CAPTURE_CHARS, self.file_store), "stderr": _CapturedStream("stderr", self.MAX_CAPTURE_CHARS, self.file_store)}
+
+        async def pump(name: str, stream: asyncio.StreamReader):
+            capture = captures[name]
+            while chunk := await stream.read(65536):
+                text = capture.feed(chunk)
+                if text and on_output:
+                    on_output(name, text)
+            capture.feed(b"", final=True)
+
+        async def progress():
+            while True:
+                await asyncio.sleep(self.PROGRESS_INTERVAL)
+                received = sum(c.total for c in captures.values())
+                logger.info(f"   … still running after {time.monotonic() - started:.0f}s, {received:,} chars of output: {captures['stdout'].last_line()[:100]}")
+
+        reporter = asyncio.create_task(progress())
+        timed_out = False
+        try:
+            work = asyncio.gather(pump("stdout", proc.stdout), pump("stderr", proc.stderr), proc.wait())
+            work.add_done_callback(lambda f: f.cancelled() or f.exception())  # Retrieved even when abandoned
+            await asyncio.wait_for(work, self.timeout)
+        except asyncio.TimeoutError:
+            timed_out = True
+            await self._kill_process_group(proc)
+        except asyncio.CancelledError:
+            await self._kill_process_group(proc)
+            for capture in captures.values():
+                capture.discard()
+            raise
+        finally:
+            reporter.cancel()
+
+        result = {"success": not timed_out and proc.returncode == 0, "returncode": -1 if timed_out else proc.returncode}
+        for name, capture in captures.items():
+            result.update(capture.result(f"bash: {command[:80]}"))
+        if timed_out:
+            result["stderr"] = (result["stderr"] + "\n" if result["stderr"] else "") + f"Command timed out after {self.timeout} seconds"
+        return result
+
+    async def close(self):
+        """Stop the persistent shell, if any."""
+        if self.session is not None:
+            await self.session.close()
+
+    async def _kill_process_group(self, proc: asyncio.subprocess.Process):
+        """SIGTERM the command's process group, then SIGKILL it if it is still running after KILL_GRACE."""
+        for sig in (signal.SIGTERM, signal.SIGKILL):
+            try:
+                os.killpg(proc.pid, sig)
+            except ProcessLookupError:
+                break
+            try:
+                await asyncio.wait_for(proc.wait(), self.KILL_GRACE)
+                break
+            except asyncio.TimeoutError:
+                continue
+        logger.warning(f"Killed process group {proc.pid}")
 
-    def read_file(self, path: str) -> dict[str, Any]:
-        """Read a file from the workspace. Path must be within work_dir."""
+    def read_file(
+        self,
+        path: str,
+        force: bool = False,
+        offset: Optional[int] = None,
+        limit: Optional[int] = None,
+        start_line: Optional[int] = None,
+        end_line: Optional[int] = None,
+    ) -> dict[str, Any]:
+        """
+        Read a file from the workspace. Path must be within work_dir.
+        Repeat reads of an unchanged file return a pointer to the earlier result
+        unless force is set. With offset/limit (bytes) or start_line/end_line,
+        only that slice is read. Results include size_bytes and total_lines.
+        """
         resolved, error = self._resolve_safe_path(path)
         if error:
             logger.warning(f"Blocked read_file: {error}")
             return {"success": False, "error": error}
 
         try:
+            signature = self._file_signature(resolved)
+            if any(arg is not None for arg in (offset, limit, start_line, end_line)):
+                return self._read_range(resolved, signature, offset, limit, start_line, end_line)
+            if not force:
+                hit = self._memo_hit("read_file", resolved, signature)
+                if hit:
+                    return hit
             content = resolved.read_text()
-            return {"success": True, "content": content}
+            self._memo[("read_file", str(resolved))] = {"signature": signature, "turn": self.current_turn}
+            total_lines = content.count("\n") + (1 if content and not content.endswith("\n") else 0)
+            return {"success": True, "content": content, "size_bytes": signature[1], "total_lines": total_lines}
         except Exception as e:
             return {"success": False, "error": str(e)}
 
+    def _line_offsets(self, resolved: Path, signature: tuple) -> array:
+        """Byte offset of the start of every line, built by a streaming scan and cached per file version."""
+        cached = self._line_index.get(str(resolved))
+        if cached and cached[0] == signature:
+            return cached[1]
+        offsets = array("Q", [0] if signature[1] else [])
+        pos = 0
+        with open(resolved, "rb") as f:
+            while chunk := f.read(1 << 20):
+                at = chunk.find(b"\n")
+                while at != -1:
+                    if pos + at + 1 < signature[1]:
+                        offsets.append(pos + at + 1)
+                    at = chunk.find(b"\n", at + 1)
+                pos += len(chunk)
+        self._line_index[str(resolved)] = (signature, offsets)
+        return offsets
+
+    def _read_range(self, resolved: Path, signature: tuple, offset: Optional[int], limit: Optional[int], start_line: Optional[int], end_line: Optional[int]) -> dict[str, Any]:
+        """
+        Read a byte range (offset/limit) or a line window (start_line/end_line, 1-based, inclusive).
+        Only the requested slice is read. Ranged reads are not memoized.
+        """
+        size = signature[1]
+        offsets = self._line_offsets(resolved, signature)
+        total_lines = len(offsets)
+        result: dict[str, Any] = {"success": True, "path": str(resolved), "size_bytes": size, "total_lines": total_lines}
+
+        if start_line is not None or end_line is not None:
+            first = max(1, start_line or 1)
+            last = min(total_lines, end_line if end_line is not None else first + self.DEFAULT_WINDOW_LINES - 1)
+            if first > total_lines or last < first:
+                return {**result, "content": "", "start_line": first, "end_line": first - 1, "has_more": False}
+            begin = offsets[first - 1]
+            end = offsets[last] if last < total_lines else size
+            result.update(start_line=first, end_line=last, has_more=last < total_lines)
+            if last < total_lines:
+                result["next_start_line"] = last + 1
+        else:
+            begin = min(max(0, offset or 0), size)
+            end = min(size, begin + (limit if limit is not None else self.DEFAULT_RANGE_BYTES))
+            # Line numbers covered by the range, from the same index
+            from bisect import bisect_right
+
+            result.update(offset=begin, end_offset=end, start_line=bisect_right(offsets, begin), end_line=bisect_right(offsets, max(begin, end - 1)), has_more=end < size)
+            if end < size:
+                result["next_offset"] = end
+
+        with open(resolved, "rb") as f:
+            f.seek(begin)
+            result["content"] = f.read(end - begin).decode("utf-8", errors="replace")
+        return result
+
     def write_file(self, path: str, content: str) -> dict[str, Any]:
         """Write content to a file in the workspace. Path must be within work_dir."""
         resolved, error = self._resolve_safe_path(path)
@@ -479,29 +1602,335 @@ class ShellTool:
         try:
             resolved.parent.mkdir(parents=True, exist_ok=True)
             resolved.write_text(content)
+            self.invalidate(resolved)
             logger.info(f"Wrote file: {resolved}")
             return {"success": True, "path": str(resolved)}
         except Exception as e:
             return {"success": False, "error": str(e)}
 
-    def list_directory(self, path: str = ".") -> dict[str, Any]:
-        """List contents of a directory. Path must be within work_dir."""
+    def search_workspace(self, pattern: str, glob: Optional[str] = None, max_results: int = 30, context_lines: int = 0) -> dict[str, Any]:
+        """Search workspace files for a regex using the trigram index; bounded, ranked results."""
+        return self.index.search(pattern, glob, max(1, min(max_results, 200)), max(0, min(context_lines, 5)))
+
+    def find_docs(self, query: Optional[str] = None, path: Optional[str] = None, max_results: int = 10) -> dict[str, Any]:
+        """Look up existing markdown docs by topic, or one doc's digest by path, from the doc index."""
+        return self.docs.find(query, path, max(1, min(max_results, 50)))
+
+    def _atomic_write(self, resolved: Path, content: str, expected_signature: Optional[tuple] = None):
+        """
+        Replace a file's content via a temp file in the same directory and os.replace.
+
+        With expected_signature, raises ValueError instead of replacing if the
+        file changed since that signature was taken.
+        """
+        import tempfile
+
+        fd, tmp = tempfile.mkstemp(prefix=f".{resolved.name}.", suffix=".tmp", dir=resolved.parent)
+        try:
+            with os.fdopen(fd, "w") as f:
+                f.write(content)
+                f.flush()
+                os.fsync(f.fileno())
+            if resolved.exists():
+                os.chmod(tmp, resolved.stat().st_mode & 0o7777)
+            if expected_signature is not None and self._file_signature(resolved) != expected_signature:
+                raise ValueError(f"{resolved.name} was modified while the edit was being applied; re-read it and retry")
+            os.replace(tmp, resolved)
+        except BaseException:
+            Path(tmp).unlink(missing_ok=True)
+            raise
+        self.invalidate(resolved)
+
+    @staticmethod
+    def _apply_replacements(content: str, edits: list[dict]) -> str:
+        """Apply exact-match replacements in order; raises ValueError naming the first edit that does not match exactly once."""
+        for i, edit in enumerate(edits, 1):
+            old, new = edit.get("old", ""), edit.get("new", "")
+            if not old:
+                raise ValueError(f"Edit {i}: 'old' is empty")
+            count = content.count(old)
+            if count == 0:
+                raise ValueError(f"Edit {i}: text not found: {old[:120]!r}")
+            if count > 1 and not edit.get("replace_all"):
+                raise ValueError(f"Edit {i}: text matches {count} times; include more context or set replace_all: {old[:120]!r}")
+            content = content.replace(old, new) if edit.get("replace_all") else content.replace(old, new, 1)
+        return content
+
+    HUNK_RE = re.compile(r"^@@ -(\d+)(?:,(\d+))? \+\d+(?:,\d+)? @@")
+
+    @classmethod
+    def _apply_patch(cls, content: str, patch: str) -> str:
+        """
+        Apply unified-diff hunks. Each hunk's context and removed lines must match
+        exactly; a hunk is tried at its stated line first (adjusted for earlier
+        hunks), then at the nearest place it matches. Raises ValueError on conflict.
+        """
+        lines = content.splitlines(keepends=True)
+        hunks: list[tuple[int, list[str], list[str]]] = []
+        for raw in patch.splitlines():
+            header = cls.HUNK_RE.match(raw)
+            if header:
+                hunks.append((int(header.group(1)), [], []))
+            elif hunks and raw[:1] in (" ", "-", "+", ""):
+                _, old, new = hunks[-1]
+                text = raw[1:]
+                if raw[:1] in (" ", "-", ""):
+                    old.append(text)
+                if raw[:1] in (" ", "+", ""):
+                    new.append(text)
+            elif hunks and not raw.startswith(("\\", "---", "+++")):
+                raise ValueError(f"Unrecognized patch line: {raw[:120]!r}")
+        if not hunks:
+            raise ValueError("Patch contains no @@ hunks")
+
+        stripped = [line.rstrip("\r\n") for line in lines]
+        shift = 0
+        for n, (start, old, new) in enumerate(hunks, 1):
+            expected = max(0, start - 1 + shift) if old else min(len(lines), start + shift)
+            candidates = [at for at in range(len(stripped) - len(old) + 1) if stripped[at : at + len(old)] == old]
+            if not candidates:
+                raise ValueError(f"Hunk {n} (line {start}) does not match the file: {'|'.join(old[:3])[:160]!r}")
+            at = min(candidates, key=lambda c: abs(c - expected))
+            ending = lines[at + len(old) - 1][len(stripped[at + len(old) - 1]):] if old and at + len(old) - 1 < len(lines) else "\n"
+            replacement = [text + "\n" for text in new]
+            if replacement and old and not ending:
+                replacement[-1] = replacement[-1][:-1]  # Keep a missing final newline missing
+            lines[at : at + len(old)] = replacement
+            stripped[at : at + len(old)] = new
+            shift += len(new) - len(old)
+        return "".join(lines)
+
+    def write_files(self, files: list[dict]) -> dict[str, Any]:
+        """
+        Write several files at once. Every path is checked before anything is
+        written; contents go to temp files in their target directories, are
+        fsync'd in one pass and renamed into place, then each directory is
+        fsync'd once. A failure before the renames leaves no file changed.
+        """
+        import tempfile
+
+        targets = []
+        for i, entry in enumerate(files or [], 1):
+            path, content = (entry.get("path", ""), entry.get("content")) if isinstance(entry, dict) else ("", None)
+            if not path or not isinstance(content, str):
+                return {"success": False, "error": f"File {i}: needs a path and string content"}
+            resolved, error = self._resolve_safe_path(path)
+            if error:
+                logger.warning(f"Blocked write_files: {error}")
+                return {"success": False, "error": f"File {i}: {error}"}
+            targets.append((path, resolved, content))
+        if not targets:
+            return {"success": False, "error": "No files given"}
+        if len({resolved for _, resolved, _ in targets}) < len(targets):
+            return {"success": False, "error": "The same path appears more than once"}
+
+        staged: list[tuple[str, Path]] = []
+        try:
+            for _, resolved, content in targets:
+                resolved.parent.mkdir(parents=True, exist_ok=True)
+                fd, tmp = tempfile.mkstemp(prefix=f".{resolved.name}.", suffix=".tmp", dir=resolved.parent)
+                staged.append((tmp, resolved))
+                with os.fdopen(fd, "w") as f:
+                    f.write(content)
+            for tmp, _ in staged:
+                fd = os.open(tmp, os.O_RDONLY)
+                try:
+                    os.fsync(fd)
+                finally:
+                    os.close(fd)
+        except Exception as e:
+            for tmp, _ in staged:
+                Path(tmp).unlink(missing_ok=True)
+            return {"success": False, "error": f"Nothing written: {e}"}
+
+        # mkstemp creates 0600 files: new files get the mode open() would have given them
+        umask = os.umask(0)
+        os.umask(umask)
+        written = []
+        try:
+            for (tmp, resolved), (path, _, content) in zip(staged, targets):
+                os.chmod(tmp, resolved.stat().st_mode & 0o7777 if resolved.exists() else 0o666 & ~umask)
+                os.replace(tmp, resolved)
+                self.invalidate(resolved)
+                written.append(path)
+        except Exception as e:
+            for tmp, _ in staged[len(written):]:
+                Path(tmp).unlink(missing_ok=True)
+            return {"success": False, "error": f"Failed after writing {len(written)} of {len(targets)} files: {e}", "written": written}
+
+        for directory in {resolved.parent for _, resolved, _ in targets}:
+            try:
+                fd = os.open(directory, os.O_RDONLY)
+                try:
+                    os.fsync(fd)
+                finally:
+                    os.close(fd)
+            except OSError:
+                pass
+        logger.info(f"Wrote {len(written)} files")
+        return {
+            "success": True,
+            "files_written": len(written),
+            "total_chars": sum(len(content) for _, _, content in targets),
+            "paths": written,
+        }
+
+    def edit_file(self, path: str, edits: Optional[list[dict]] = None, patch: Optional[str] = None) -> dict[str, Any]:
+        """
+        Change part of an existing file with exact-match replacements or unified-diff hunks.
+        All changes are applied to a copy and written atomically, or none are.
+        Returns a compact diff of the change rather than the file.
+        """
+        import difflib
+
+        resolved, error = self._resolve_safe_path(path)
+        if error:
+            logger.warning(f"Blocked edit_file: {error}")
+            return {"success": False, "error": error}
+        if not edits and not patch:
+            return {"success": False, "error": "Provide edits or patch"}
+
+        try:
+            signature = self._file_signature(resolved)
+            before = resolved.read_text()
+            after = self._apply_replacements(before, edits) if edits else before
+            if patch:
+                after = self._apply_patch(after, patch)
+            if after == before:
+                return {"success": True, "path": str(resolved), "changed": False}
+            self._atomic_write(resolved, after, signature)
+        except (ValueError, FileNotFoundError) as e:
+            return {"success": False, "conflict": isinstance(e, ValueError), "error": str(e)}
+        except Exception as e:
+            return {"success": False, "error": str(e)}
+
+        diff = list(difflib.unified_diff(before.splitlines(), after.splitlines(), lineterm="", n=1))[2:]
+        logger.info(f"Edited file: {resolved}")
+        return {
+            "success": True,
+            "path": str(resolved),
+            "changed": True,
+            "lines_added": sum(1 for line in diff if line.startswith("+")),
+            "lines_removed": sum(1 for line in diff if line.startswith("-")),
+            "diff": "\n".join(line[:200] for line in diff[: self.MAX_DIFF_LINES]) + ("\n..." if len(diff) > self.MAX_DIFF_LINES else ""),
+        }
+
+    def _walk_directory(self, root: Path, depth: int, pattern: Optional[str]) -> list[dict]:
+        """Entries under root to the given depth, in path order, via os.scandir (one stat per entry)."""
+        import fnmatch
+
+        skip = WorkspaceIndex.SKIP_DIRS | {FileStore.STORE_DIR, GitWorkspace.WORKTREE_DIR}
+        entries = []
+
+        def visit(directory: Path, prefix: str, level: int):
+            with os.scandir(directory) as it:
+                children = sorted(it, key=lambda e: e.name)
+            for entry in children:
+                rel = prefix + entry.name
+                is_dir = entry.is_dir(follow_symlinks=False)
+                st = entry.stat(follow_symlinks=False)
+                if not pattern or fnmatch.fnmatch(rel, pattern) or fnmatch.fnmatch(entry.name, pattern):
+                    entries.append({"name": rel, "type": "directory" if is_dir else "file", "size": None if is_dir else st.st_size, "mtime": st.st_mtime, "level": level})
+                if is_dir and level < depth and entry.name not in skip:
+                    try:
+                        visit(Path(entry.path), rel + "/", level + 1)
+                    except OSError:
+                        continue
+
+        visit(root, "", 1)
+        return entries
+
+    @staticmethod
+    def _render_tree(entries: list[dict]) -> str:
+        """Indented listing, one entry per line: directories end in '/', files show a short size."""
+
+        def short(size: int) -> str:
+            scaled = float(size)
+            for unit in ("B", "K", "M"):
+                if scaled < 1024:
+                    return f"{scaled:.0f}{unit}"
+                scaled /= 1024
+            return f"{scaled:.0f}G"
+
+        lines = []
+        shown: set[str] = set()
+        for entry in entries:
+            parent, _, name = entry["name"].rpartition("/")
+            if parent and parent not in shown:
+                # Parent filtered out (glob) or on an earlier page: show the full relative path
+                indent, name = "", entry["name"]
+            else:
+                indent = "  " * (entry["level"] - 1)
+            if entry["type"] == "directory":
+                shown.add(entry["name"])
+                lines.append(f"{indent}{name}/")
+            else:
+                lines.append(f"{indent}{name} {short(entry['size'])}")
+        return "\n".join(lines)
+
+    def list_directory(
+        self,
+        path: str = ".",
+        force: bool = False,
+        depth: int = 1,
+        glob: Optional[str] = None,
+        sort: str = "name",
+        cursor: Optional[str] = None,
+        page_size: int = 200,
+        tree: bool = False,
+    ) -> dict[str, Any]:
+        """
+        List a directory, optionally recursively. Path must be within work_dir.
+
+        depth > 1 descends (not into .git, the file store or worktrees), glob
+        filters entries by relative path or name, sort is name, size or mtime
+        (largest/newest first), and results come in pages of page_size with a
+        next_cursor. tree renders a compact indented listing in path order.
+        Only the default single-level listing is memoized, and only when it
+        fits in one page.
+        """
         resolved, error = self._resolve_safe_path(path)
         if error:
             logger.warning(f"Blocked list_directory: {error}")
             return {"success": False, "error": error}
+        if sort not in ("name", "size", "mtime"):
+            return {"success": False, "error": f"Unknown sort '{sort}' (use name, size or mtime)"}
 
         try:
-            items = []
-            for item in resolved.iterdir():
-                items.append(
-                    {
-                        "name": item.name,
-                        "type": "directory" if item.is_dir() else "file",
-                        "size": item.stat().st_size if item.is_file() else None,
-                    }
-                )
-            return {"success": True, "items": items}
+            plain = depth == 1 and not glob and sort == "name" and cursor is None and page_size == 200 and not tree
+            if plain:
+                signature = self._dir_signature(resolved)
+                if not force:
+                    hit = self._memo_hit("list_directory", resolved, signature)
+                    if hit:
+                        return hit
+                self._memo[("list_directory", str(resolved))] = {"signature": signature, "turn": self.current_turn}
+
+            entries = self._walk_directory(resolved, max(1, depth), glob)
+            if sort == "size":
+                entries.sort(key=lambda e: e["size"] or 0, reverse=True)
+            elif sort == "mtime":
+                entries.sort(key=lambda e: e["mtime"], reverse=True)
+
+            try:
+                start = int(cursor or 0)
+            except ValueError:
+                return {"success": False, "error": f"Invalid cursor '{cursor}'"}
+            page_size = max(1, min(page_size, 1000))
+            page = entries[start : start + page_size]
+            result: dict[str, Any] = {"success": True, "total": len(entries)}
+            if tree:
+                result["tree"] = self._render_tree(page)
+            else:
+                result["items"] = [
+                    {"name": e["name"], "type": e["type"], "size": e["size"], **({"mtime": datetime.fromtimestamp(e["mtime"]).isoformat(timespec="seconds")} if sort == "mtime" else {})}
+                    for e in page
+                ]
+            if start + page_size < len(entries):
+                result["next_cursor"] = str(start + page_size)
+                if plain:
+                    self._memo.pop(("list_directory", str(resolved)), None)  # A partial page is not "the listing"
+            return result
         except Exception as e:
             return {"success": False, "error": str(e)}
 
@@ -522,10 +1951,17 @@ class ShellTool:
             },
             {
                 "name": "read_file",
-                "description": "Read the contents of a file from the workspace.",
+                "description": "Read the contents of a file from the workspace, or just a line window (start_line/end_line) or byte range (offset/limit). Results include size_bytes and total_lines. If the file is unchanged since you last read it in full, returns a file_id pointing at the earlier result instead of the content.",
                 "input_schema": {
                     "type": "object",
-                    "properties": {"path": {"type": "string", "description": "Path to the file (relative to workspace or absolute)"}},
+                    "properties": {
+                        "path": {"type": "string", "description": "Path to the file (relative to workspace or absolute)"},
+                        "force": {"type": "boolean", "description": "Return the full content even if unchanged since the last read", "default": False},
+                        "start_line": {"type": "integer", "description": "First line to return (1-based)"},
+                        "end_line": {"type": "integer", "description": "Last line to return, inclusive (default: start_line + 199)"},
+                        "offset": {"type": "integer", "description": "Byte offset to start reading from"},
+                        "limit": {"type": "integer", "description": "Maximum bytes to return from offset (default: 20000)"},
+                    },
                     "required": ["path"],
                 },
             },
@@ -542,16 +1978,111 @@ class ShellTool:
                 },
             },
             {
-                "name": "list_directory",
-                "description": "List the contents of a directory in the workspace.",
+                "name": "write_files",
+                "description": "Write several files in one call, e.g. a set of related documents. Creates parent directories. Every path is validated before anything is written, and each file is replaced atomically. Prefer this over consecutive write_file calls.",
                 "input_schema": {
                     "type": "object",
-                    "properties": {"path": {"type": "string", "description": "Path to the directory (relative to workspace or absolute)", "default": "."}},
-                },
+                    "properties": {
+                        "files": {
+                            "type": "array",
+                            "description": "Files to write",
+                            "items": {
+                                "type": "object",
+                                "properties": {
+                                    "path": {"type": "string", "description": "Path to the file (relative to workspace or absolute)"},
+                                    "content": {"type": "string", "description": "Content to write to the file"},
+                                },
+                                "required": ["path", "content"],
+                            },
+                        },
+                    },
+                    "required": ["files"],
+                },
+            },
+            {
+                "name": "edit_file",
+                "description": "Change part of an existing file without rewriting it, e.g. one table row or a checkbox. Give either edits (exact-match replacements applied in order; each 'old' must match exactly once unless replace_all) or patch (unified diff hunks). All changes apply atomically or none do; returns a compact diff.",
+                "input_schema": {
+                    "type": "object",
+                    "properties": {
+                        "path": {"type": "string", "description": "Path to the file (relative to workspace or absolute)"},
+                        "edits": {
+                            "type": "array",
+                            "description": "Replacements to apply in order",
+                            "items": {
+                                "type": "object",
+                                "properties": {
+                                    "old": {"type": "string", "description": "Exact text to replace"},
+                                    "new": {"type": "string", "description": "Replacement text"},
+                                    "replace_all": {"type": "boolean", "description": "Replace every occurrence", "default": False},
+                                },
+                                "required": ["old", "new"],
+                            },
+                        },
+                        "patch": {"type": "string", "description": "Unified diff hunks (@@ -l,n +l,n @@ with ' ', '-', '+' lines)"},
+                    },
+                    "required": ["path"],
+                },
+            },
+            {
+                "name": "search_workspace",
+                "description": "Search the text of workspace files for a regex (case-insensitive unless it contains capitals). Uses an index, so prefer it over grep/find via bash. Returns ranked matches with line numbers; files whose path matches and markdown headings rank first.",
+                "input_schema": {
+                    "type": "object",
+                    "properties": {
+                        "pattern": {"type": "string", "description": "Regular expression (a plain word or phrase works)"},
+                        "glob": {"type": "string", "description": "Only files matching this glob, e.g. '*.md' or 'architecture/*'"},
+                        "max_results": {"type": "integer", "description": "Maximum matching lines to return (default 30, max 200)", "default": 30},
+                        "context_lines": {"type": "integer", "description": "Lines of context either side of each match (default 0, max 5)", "default": 0},
+                    },
+                    "required": ["pattern"],
+                },
+            },
+            {
+                "name": "find_docs",
+                "description": (
+                    "Find what is already documented: markdown files in the workspace ranked by a topic query, each with title, "
+                    "matching headings, a short digest, links in and out and last-updated date. With path, one doc's full "
+                    "outline and links; with neither, every doc's path and title. Use this before reading whole docs to "
+                    "check coverage or pick cross-links."
+                ),
+                "input_schema": {
+                    "type": "object",
+                    "properties": {
+                        "query": {"type": "string", "description": "Topic to look for, e.g. 'call recording retention'"},
+                        "path": {"type": "string", "description": "A markdown file (or path suffix) to describe in full"},
+                        "max_results": {"type": "integer", "description": "Maximum docs to return (default 10, max 50)", "default": 10},
+                    },
+                },
+            },
+            {
+                "name": "list_directory",
+                "description": "List a directory in the workspace, optionally recursively (depth), filtered (glob) and sorted, in pages (pass next_cursor back as cursor). tree=true returns a compact indented listing. If a plain listing is unchanged since you last made it, returns a file_id pointing at the earlier result.",
+                "input_schema": {
+                    "type": "object",
+                    "properties": {
+                        "path": {"type": "string", "description": "Path to the directory (relative to workspace or absolute)", "default": "."},
+                        "force": {"type": "boolean", "description": "Return the full listing even if unchanged", "default": False},
+                        "depth": {"type": "integer", "description": "Levels to descend (1 = this directory only)", "default": 1},
+                        "glob": {"type": "string", "description": "Only entries whose relative path or name matches, e.g. '*.md'"},
+                        "sort": {"type": "string", "enum": ["name", "size", "mtime"], "description": "Order: name, size (largest first) or mtime (newest first)", "default": "name"},
+                        "cursor": {"type": "string", "description": "next_cursor from the previous page"},
+                        "page_size": {"type": "integer", "description": "Entries per page (default 200, max 1000)", "default": 200},
+                        "tree": {"type": "boolean", "description": "Return a compact indented tree instead of items", "default": False},
+                    },
+                },
             },
         ]
 
 
+def _brief_input(tool_input: dict) -> dict:
+    """A tool call's arguments without file bodies (write_file content, write_files contents)."""
+    brief = {k: v for k, v in tool_input.items() if k != "content"}
+    if isinstance(brief.get("files"), list):
+        brief["files"] = [f.get("path", "") if isinstance(f, dict) else f for f in brief["files"]]
+    return brief
+
+
 # =============================================================================
 # MCP Client for Natterbox Tools (with OAuth + SSE)
 # =============================================================================
@@ -575,6 +2106,11 @@ class MCPClient:
     # Token refresh threshold (refresh if expiring within this many seconds)
     TOKEN_REFRESH_THRESHOLD = 300  # 5 minutes
 
+    # Response cache for read-only operations (shared by all agents using this client)
+    READ_ONLY_OPERATION = re.compile(r"^(get|list|search|read|find|fetch|query)(_|$)")
+    CACHE_TTL_SECONDS = 900
+    CACHE_MAX_ENTRIES = 512
+
     def __init__(self, server_url: str, token_file: Optional[Path] = None):
         self.server_url = server_url
         self.tools: dict[str, dict] = {}
@@ -583,6 +2119,43 @@ class MCPClient:
         self._token_expiry: Optional[float] = None  # Unix timestamp
         self._token_file = token_file or Path.home() / ".natterbox-mcp-tokens.json"
         self._message_endpoint = server_url  # SSE endpoint accepts POST for messages
+        self._client: Optional[httpx.AsyncClient] = None  # Pooled connections, created on first use
+        self._cache: dict[str, tuple[float, dict]] = {}  # Insertion-ordered: key -> (stored_at, result)
+        self._inflight: dict[str, asyncio.Future] = {}  # Identical concurrent calls share one request
+        self._writes: dict[str, int] = {}  # Tool name -> successful non-read-only calls, to spot reads that raced a write
+        self.cache_hits = 0
+
+    def _http(self) -> httpx.AsyncClient:
+        """Return the shared connection pool (one per client, reused across calls and agents)."""
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(timeout=120.0, limits=httpx.Limits(max_connections=16, max_keepalive_connections=8))
+        return self._client
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def is_read_only(self, name: str, arguments: dict) -> bool:
+        """Whether a call is on the read-only allowlist (get/list/search/... operations)."""
+        operation = arguments.get("operation")
+        if operation is None:
+            return "search" in name
+        return bool(self.READ_ONLY_OPERATION.match(str(operation)))
+
+    def _cache_key(self, name: str, arguments: dict) -> Optional[str]:
+        """Cache key for a read-only call, or None if the call may have side effects."""
+        return json.dumps([name, arguments], sort_keys=True) if self.is_read_only(name, arguments) else None
+
+    def _invalidate(self, name: str):
+        """Drop cached responses of a tool after a call to it that may have changed what they read."""
+        prefix = f"[{json.dumps(name)},"
+        stale = [key for key in self._cache if key.startswith(prefix)]
+        for key in stale:
+            del self._cache[key]
+        self._writes[name] = self._writes.get(name, 0) + 1
+        if stale:
+            logger.info(f"♻️  MCP cache: dropped {len(stale)} {name} responses after a write")
 
     def _load_tokens(self) -> bool:
         """Load tokens from file if they exist."""
@@ -808,73 +2381,124 @@ class MCPClient:
     async def _try_connect(self) -> bool:
         """Attempt to connect and list tools."""
         headers = {"Authorization": f"Bearer {self._access_token}"}
+        client = self._http()
 
         try:
-            async with httpx.AsyncClient(timeout=30.0) as client:
-                # Initialize connection
-                response = await client.post(
-                    self._message_endpoint,
-                    headers=headers,
-                    json={
-                        "jsonrpc": "2.0",
-                        "id": 1,
-                        "method": "initialize",
-                        "params": {"protocolVersion": "2024-11-05", "capabilities": {}, "clientInfo": {"name": "documentation-agent", "version": "1.0.0"}},
-                    },
-                )
+            # Initialize connection
+            response = await client.post(
+                self._message_endpoint,
+                headers=headers,
+                timeout=30.0,
+                json={
+                    "jsonrpc": "2.0",
+                    "id": 1,
+                    "method": "initialize",
+                    "params": {"protocolVersion": "2024-11-05", "capabilities": {}, "clientInfo": {"name": "documentation-agent", "version": "1.0.0"}},
+                },
+            )
 
-                if response.status_code == 401:
-                    logger.warning("MCP authentication failed (401)")
-                    return False
+            if response.status_code == 401:
+                logger.warning("MCP authentication failed (401)")
+                return False
 
-                if response.status_code != 200:
-                    logger.error(f"Failed to initialize MCP connection: {response.status_code}")
-                    return False
+            if response.status_code != 200:
+                logger.error(f"Failed to initialize MCP connection: {response.status_code}")
+                return False
 
-                init_result = response.json()
-                logger.info(f"MCP server initialized: {init_result.get('result', {}).get('serverInfo', {})}")
+            init_result = response.json()
+            logger.info(f"MCP server initialized: {init_result.get('result', {}).get('serverInfo', {})}")
 
-                # List available tools
-                response = await client.post(self._message_endpoint, headers=headers, json={"jsonrpc": "2.0", "id": 2, "method": "tools/list", "params": {}})
+            # List available tools
+            response = await client.post(self._message_endpoint, headers=headers, timeout=30.0, json={"jsonrpc": "2.0", "id": 2, "method": "tools/list", "params": {}})
 
-                if response.status_code == 200:
-                    tools_result = response.json()
-                    for tool in tools_result.get("result", {}).get("tools", []):
-                        self.tools[tool["name"]] = tool
-                    logger.info(f"Discovered {len(self.tools)} MCP tools")
+            if response.status_code == 200:
+                tools_result = response.json()
+                for tool in tools_result.get("result", {}).get("tools", []):
+                    self.tools[tool["name"]] = tool
+                logger.info(f"Discovered {len(self.tools)} MCP tools")
 
-                return True
+            return True
 
         except Exception as e:
             logger.error(f"Connection attempt failed: {e}")
             return False
 
     async def call_tool(self, name: str, arguments: dict) -> dict[str, Any]:
-        """Call an MCP tool with the given arguments."""
+        """
+        Call an MCP tool with the given arguments.
+
+        Read-only operations (get/list/search/...) are served from a shared
+        cache for CACHE_TTL_SECONDS, and identical calls already in flight
+        wait for that request instead of sending their own. A successful call
+        that is not read-only drops the cached responses of the same tool.
+        """
+        import time
+
+        key = self._cache_key(name, arguments)
+        if key is None:
+            result = await self._call_tool_uncached(name, arguments)
+            if result.get("success"):
+                self._invalidate(name)
+            return result
+
+        cached = self._cache.get(key)
+        if cached and time.monotonic() - cached[0] < self.CACHE_TTL_SECONDS:
+            self.cache_hits += 1
+            logger.info(f"♻️  MCP cache hit: {name}")
+            return dict(cached[1])  # Callers annotate results - never hand out the cached dict
+
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            await asyncio.wait([inflight])
+            if not inflight.cancelled():
+                self.cache_hits += 1
+                return dict(inflight.result())
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        writes = self._writes.get(name, 0)
+        try:
+            result = await self._call_tool_uncached(name, arguments)
+        except BaseException:
+            future.cancel()
+            raise
+        finally:
+            del self._inflight[key]
+
+        # A write that finished while this read was in flight may have made it stale
+        if result.get("success") and self._writes.get(name, 0) == writes:
+            self._cache.pop(key, None)
+            self._cache[key] = (time.monotonic(), dict(result))
+            while len(self._cache) > self.CACHE_MAX_ENTRIES:
+                del self._cache[next(iter(self._cache))]
+        future.set_result(dict(result))
+        return result
+
+    async def _call_tool_uncached(self, name: str, arguments: dict) -> dict[str, Any]:
         # Proactively refresh token if needed
         await self._ensure_valid_token()
 
         headers = {"Authorization": f"Bearer {self._access_token}"}
+        client = self._http()
 
         try:
-            async with httpx.AsyncClient(timeout=120.0) as client:
-                response = await client.post(
-                    self._message_endpoint, headers=headers, json={"jsonrpc": "2.0", "id": 3, "method": "tools/call", "params": {"name": name, "arguments": arguments}}
-                )
+            response = await client.post(
+                self._message_endpoint, headers=headers, json={"jsonrpc": "2.0", "id": 3, "method": "tools/call", "params": {"name": name, "arguments": arguments}}
+            )
 
-                if response.status_code == 401:
-                    # Try refresh and retry
-                    if await self._refresh_access_token():
-                        headers = {"Authorization": f"Bearer {self._access_token}"}
-                        response = await client.post(
-                            self._message_endpoint, headers=headers, json={"jsonrpc": "2.0", "id": 3, "method": "tools/call", "params": {"name": name, "arguments": arguments}}
-                        )
+            if response.status_code == 401:
+                # Try refresh and retry
+                if await self._refresh_access_token():
+                    headers = {"Authorization": f"Bearer {self._access_token}"}
+                    response = await client.post(
+                        self._message_endpoint, headers=headers, json={"jsonrpc": "2.0", "id": 3, "method": "tools/call", "params": {"name": name, "arguments": arguments}}
+                    )
 
-                if response.status_code == 200:
-                    result = response.json()
-                    return {"success": True, "result": result.get("result", {})}
-                else:
-                    return {"success": False, "error": f"HTTP {response.status_code}: {response.text}"}
+            if response.status_code == 200:
+                result = response.json()
+                return {"success": True, "result": result.get("result", {})}
+            else:
+                return {"success": False, "error": f"HTTP {response.status_code}: {response.text}"}
 
         except Exception as e:
             return {"success": False, "error": str(e)}
@@ -889,6 +2513,366 @@ class MCPClient:
         return definitions
 
 
+# =============================================================================
+# Result Shaping - Compact MCP results before they reach context
+# =============================================================================
+
+
+class _StorageHTMLConverter(HTMLParser):
+    """
+    Convert Confluence storage-format HTML to markdown.
+
+    Handles headings, paragraphs, emphasis, links (including ac:link page
+    links), lists, tables, code and panel macros, images and attachments.
+    Layout and navigation macros (toc, children, ...) are dropped.
+    """
+
+    BLOCKS = {"p", "div", "h1", "h2", "h3", "h4", "h5", "h6", "table", "ul", "ol", "pre", "blockquote", "ac:layout-cell"}
+    DROP_MACROS = {"toc", "children", "pagetree", "recently-updated", "contentbylabel", "livesearch", "excerpt-include", "anchor"}
+    PANEL_MACROS = {"info", "note", "warning", "tip", "panel", "expand"}
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.out: list[str] = []
+        self._lists: list[list] = []  # [kind, counter] per open list
+        self._row: Optional[list[str]] = None
+        self._cell: Optional[list[str]] = None
+        self._header_rows = 0
+        self._table_rows: list[list[str]] = []
+        self._href: list[Optional[str]] = []
+        self._macros: list[str] = []  # Names of open ac:structured-macro elements
+        self._param: Optional[str] = None
+        self._code_lang = ""
+        self._skip = 0  # Depth inside dropped macros
+        self._pre = 0
+
+    def _emit(self, text: str):
+        if self._skip:
+            return
+        (self._cell if self._cell is not None else self.out).append(text)
+
+    def _block(self):
+        if self._cell is None:
+            self.out.append("\n\n")
+
+    def handle_starttag(self, tag: str, attrs: list):
+        a = dict(attrs)
+        if tag == "ac:structured-macro":
+            name = a.get("ac:name", "")
+            self._macros.append(name)
+            if self._skip or name in self.DROP_MACROS:
+                self._skip += 1
+            elif name in self.PANEL_MACROS:
+                self._block()
+                self._emit(f"> **{name.capitalize()}:** ")
+            elif name in ("code", "noformat"):
+                self._code_lang = ""
+            return
+        if self._skip:
+            return
+        if tag == "ac:parameter":
+            self._param = a.get("ac:name", "")
+        elif tag in ("h1", "h2", "h3", "h4", "h5", "h6"):
+            self._block()
+            self._emit("#" * int(tag[1]) + " ")
+        elif tag in ("p", "div", "blockquote"):
+            self._block()
+            if tag == "blockquote":
+                self._emit("> ")
+        elif tag == "br":
+            self._emit("\n")
+        elif tag in ("strong", "b"):
+            self._emit("**")
+        elif tag in ("em", "i"):
+            self._emit("_")
+        elif tag == "code" and not self._pre:
+            self._emit("`")
+        elif tag == "pre":
+            self._pre += 1
+            self._block()
+            self._emit("```\n")
+        elif tag in ("a", "ac:link"):
+            self._href.append(a.get("href"))
+            self._emit("[")
+        elif tag == "ri:page":
+            if self._href:
+                self._href[-1] = self._href[-1] or f"page:{a.get('ri:content-title', '')}"
+                self._emit(a.get("ri:content-title", ""))
+        elif tag == "ri:attachment":
+            self._emit(f"[attachment: {a.get('ri:filename', '')}]")
+        elif tag == "ri:url":
+            self._emit(f"[image: {a.get('ri:value', '')}]")
+        elif tag == "img":
+            self._emit(f"[image: {a.get('alt') or a.get('src', '')}]")
+        elif tag in ("ul", "ol"):
+            if not self._lists:
+                self._block()
+            self._lists.append([tag, 0])
+        elif tag == "li":
+            kind = self._lists[-1] if self._lists else ["ul", 0]
+            kind[1] += 1
+            indent = "  " * max(0, len(self._lists) - 1)
+            self._emit(f"\n{indent}{'-' if kind[0] == 'ul' else str(kind[1]) + '.'} ")
+        elif tag == "table":
+            self._block()
+            self._table_rows = []
+            self._header_rows = 0
+        elif tag == "tr":
+            self._row = []
+        elif tag in ("td", "th"):
+            self._cell = []
+            if tag == "th" and self._row is not None and not self._row:
+                self._header_rows += 1
+
+    def handle_endtag(self, tag: str):
+        if tag == "ac:structured-macro":
+            name = self._macros.pop() if self._macros else ""
+            if self._skip:
+                self._skip -= 1
+            elif name in self.PANEL_MACROS:
+                self._block()
+            return
+        if self._skip:
+            return
+        if tag == "ac:parameter":
+            self._param = None
+        elif tag in ("h1", "h2", "h3", "h4", "h5", "h6", "p", "div", "blockquote"):
+            self._block()
+        elif tag in ("strong", "b"):
+            self._emit("**")
+        elif tag in ("em", "i"):
+            self._emit("_")
+        elif tag == "code" and not self._pre:
+            self._emit("`")
+        elif tag == "pre":
+            self._pre -= 1
+            self._emit("\n```")
+            self._block()
+        elif tag in ("a", "ac:link"):
+            href = self._href.pop() if self._href else None
+            self._emit(f"]({href})" if href and not href.startswith("page:") else "]")
+        elif tag in ("ul", "ol"):
+            if self._lists:
+                self._lists.pop()
+            if not self._lists:
+                self._block()
+        elif tag in ("td", "th"):
+            if self._row is not None and self._cell is not None:
+                self._row.append(" ".join("".join(self._cell).split()).replace("|", "\\|"))
+            self._cell = None
+        elif tag == "tr":
+            if self._row is not None:
+                self._table_rows.append(self._row)
+            self._row = None
+        elif tag == "table":
+            self._emit_table()
+
+    def _emit_table(self):
+        rows = [r for r in self._table_rows if r]
+        if not rows:
+            return
+        width = max(len(r) for r in rows)
+        lines = []
+        for i, row in enumerate(rows):
+            lines.append("| " + " | ".join(row + [""] * (width - len(row))) + " |")
+            if i == 0:
+                lines.append("|" + "---|" * width)
+        self.out.append("\n".join(lines))
+        self._block()
+        self._table_rows = []
+
+    def handle_data(self, data: str):
+        if self._param is not None:
+            if self._param == "language" and self._macros and self._macros[-1] in ("code", "noformat"):
+                self._code_lang = data.strip()
+            elif self._param == "title" and self._macros and self._macros[-1] in self.PANEL_MACROS:
+                self._emit(f"{data.strip()}. ")
+            return
+        if not self._pre:
+            data = re.sub(r"\s+", " ", data)
+        self._emit(data)
+
+    def unknown_decl(self, data: str):
+        # CDATA bodies of code macros (ac:plain-text-body)
+        if data.startswith("CDATA["):
+            body = data[6:]
+            if self._macros and self._macros[-1] in ("code", "noformat") and not self._skip:
+                self._block()
+                self._emit(f"```{self._code_lang}\n{body}\n```")
+                self._block()
+            else:
+                self._emit(body)
+
+    def markdown(self) -> str:
+        text = "".join(self.out)
+        text = re.sub(r"[ \t]+\n", "\n", text)
+        text = re.sub(r"\n{3,}", "\n\n", text)
+        return text.strip()
+
+
+def storage_to_markdown(html: str) -> str:
+    """Convert Confluence storage-format (or view) HTML to markdown."""
+    converter = _StorageHTMLConverter()
+    converter.feed(html)
+    converter.close()
+    return converter.markdown()
+
+
+class ResultShaper:
+    """
+    Per-tool pipeline that compacts MCP results before they are stored or sent.
+
+    A shaper is a function taking the decoded JSON payload of a result's text
+    part and returning a replacement (or the same object). Shapers registered
+    for a tool name (e.g. "mcp_confluence") run before those registered for
+    "*". Text that is not JSON only gets whitespace normalization. The shaped
+    payload is re-serialized compactly.
+
+    Only REST navigation boilerplate is removed, and only from the APIs known
+    to produce it; URLs and other data fields are kept (they are citations).
+    """
+
+    NAVIGATION_KEYS = {"_links", "_expandable", "_embedded"}  # REST navigation, dropped at any depth
+    CONFLUENCE_ENVELOPE_KEYS = {"extensions", "operations", "restrictions", "macroRenderedOutput", "metadata", "schema"}  # Page level only
+    TREE_COLLAPSE_ENTRIES = 150  # Listings longer than this collapse deep directories to counts
+
+    def __init__(self):
+        self.shapers: dict[str, list[Callable[[Any], Any]]] = {}
+        self.register("mcp_confluence", self.confluence)
+        self.register("mcp_confluence", self.strip_boilerplate)
+        self.register("mcp_github", self.github)
+        self.register("mcp_github", self.strip_boilerplate)
+
+    def register(self, tool: str, shaper: Callable[[Any], Any]):
+        """Add a shaper for a tool name, or "*" for every MCP tool."""
+        self.shapers.setdefault(tool, []).append(shaper)
+
+    def shape(self, tool_name: str, result: dict) -> Optional[dict]:
+        """Return a shaped copy of an MCP tool result, or None if shaping changed nothing."""
+        parts = (result.get("result") or {}).get("content") if isinstance(result.get("result"), dict) else None
+        if not isinstance(parts, list):
+            return None
+        pipeline = self.shapers.get(tool_name, []) + self.shapers.get("*", [])
+        shaped_parts, changed = [], False
+        for part in parts:
+            text = part.get("text") if isinstance(part, dict) and part.get("type") == "text" else None
+            if not isinstance(text, str):
+                shaped_parts.append(part)
+                continue
+            try:
+                payload = json.loads(text)
+            except ValueError:
+                new_text = self.normalize_whitespace(text)
+            else:
+                for shaper in pipeline:
+                    payload = shaper(payload)
+                new_text = payload if isinstance(payload, str) else json.dumps(payload, ensure_ascii=False, separators=(",", ":"))
+            changed = changed or new_text != text
+            shaped_parts.append({**part, "text": new_text})
+        if not changed:
+            return None
+        return {**result, "result": {**result["result"], "content": shaped_parts}}
+
+    @staticmethod
+    def normalize_whitespace(text: str) -> str:
+        text = re.sub(r"[ \t]+\n", "\n", text.replace("\r\n", "\n"))
+        return re.sub(r"\n{3,}", "\n\n", text)
+
+    @classmethod
+    def strip_boilerplate(cls, payload: Any) -> Any:
+        """Drop REST navigation keys (_links, _expandable, _embedded) and empty values at any depth; normalize string whitespace."""
+        if isinstance(payload, dict):
+            return {k: cls.strip_boilerplate(v) for k, v in payload.items() if k not in cls.NAVIGATION_KEYS and v not in (None, "", [], {})}
+        if isinstance(payload, list):
+            return [cls.strip_boilerplate(v) for v in payload]
+        if isinstance(payload, str) and "\n" in payload:
+            return cls.normalize_whitespace(payload)
+        return payload
+
+    @classmethod
+    def confluence(cls, payload: Any, envelope: bool = True) -> Any:
+        """
+        Replace storage/view HTML bodies with markdown; reduce versions, ancestors and attachments to the essentials.
+
+        Page-level expansion metadata (operations, restrictions, ...) is dropped
+        from the top-level object and the pages of a top-level list or results
+        list (the envelope); the same keys deeper down are left alone.
+        """
+        if isinstance(payload, list):
+            return [cls.confluence(v, envelope) for v in payload]
+        if not isinstance(payload, dict):
+            return payload
+        if envelope:
+            payload = {k: v for k, v in payload.items() if k not in cls.CONFLUENCE_ENVELOPE_KEYS}
+        shaped = {}
+        for key, value in payload.items():
+            if key == "body" and isinstance(value, dict):
+                for representation in ("storage", "view", "export_view", "styled_view"):
+                    html = (value.get(representation) or {}).get("value") if isinstance(value.get(representation), dict) else None
+                    if isinstance(html, str):
+                        shaped["body_markdown"] = storage_to_markdown(html)
+                        break
+                else:
+                    shaped[key] = cls.confluence(value, False)
+            elif key == "_links" and isinstance(value, dict) and isinstance(value.get("webui"), str):
+                shaped.setdefault("url", (value.get("base") or "") + value["webui"])  # Keep the page link for citations
+            elif key == "version" and isinstance(value, dict):
+                shaped[key] = {k: value[k] for k in ("number", "when") if k in value}
+            elif key == "ancestors" and isinstance(value, list):
+                shaped[key] = [a.get("title", a.get("id")) if isinstance(a, dict) else a for a in value]
+            elif key in ("attachments", "children") and isinstance(value, dict) and isinstance(value.get("results"), list):
+                shaped[key] = [r.get("title", r.get("id")) if isinstance(r, dict) else r for r in value["results"]]
+            elif isinstance(value, str) and key in ("value", "excerpt", "content") and "<" in value and re.search(r"</?(p|ac:|h\d|table|ul|div)\b", value):
+                shaped[key] = storage_to_markdown(value)
+            else:
+                shaped[key] = cls.confluence(value, envelope and key == "results")
+        return shaped
+
+    @classmethod
+    def github(cls, payload: Any) -> Any:
+        """Decode base64 file contents and collapse tree/directory listings into path lines."""
+        if isinstance(payload, dict):
+            if payload.get("encoding") == "base64" and isinstance(payload.get("content"), str):
+                import base64
+
+                try:
+                    decoded = base64.b64decode(payload["content"]).decode("utf-8")
+                    payload = {**payload, "content": decoded, "encoding": "utf-8"}
+                except (ValueError, UnicodeDecodeError):
+                    pass
+            if isinstance(payload.get("tree"), list):
+                payload = {**payload, "tree": cls._collapse_listing(payload["tree"])}
+            return {k: v for k, v in payload.items() if k not in ("sha", "mode")} if "tree" in payload else payload
+        if isinstance(payload, list) and payload and all(isinstance(e, dict) and "path" in e and "type" in e for e in payload):
+            return cls._collapse_listing(payload)
+        return payload
+
+    @classmethod
+    def _collapse_listing(cls, entries: list) -> str:
+        """One line per entry ('dir/' or 'path size'); long listings fold directories below depth 2 into counts."""
+        rows = []
+        for e in entries:
+            if not isinstance(e, dict):
+                continue
+            is_dir = e.get("type") in ("tree", "dir")
+            rows.append((e.get("path", e.get("name", "")), is_dir, e.get("size")))
+        if len(rows) > cls.TREE_COLLAPSE_ENTRIES:
+            folded: dict[str, int] = {}
+            kept = []
+            for path, is_dir, size in rows:
+                parts = path.split("/")
+                if len(parts) > 2:
+                    folded["/".join(parts[:2])] = folded.get("/".join(parts[:2]), 0) + 1
+                else:
+                    kept.append((path, is_dir, size))
+            # Listings without entries for the folded directories themselves still show their counts
+            listed = {path for path, is_dir, _ in kept if is_dir}
+            kept = sorted(kept + [(path, True, None) for path in folded if path not in listed], key=lambda row: row[0])
+            rows = [(path, is_dir, size if not (is_dir and path in folded) else f"[{folded[path]} entries]") for path, is_dir, size in kept]
+        lines = [f"{path}/ {size}" if is_dir and isinstance(size, str) else f"{path}/" if is_dir else f"{path} {size}" if size is not None else path for path, is_dir, size in rows]
+        return "\n".join(lines)
+
+
 # =============================================================================
 # Bedrock Client
 # =============================================================================
@@ -926,6 +2910,8 @@ class BedrockClient:
         messages: list[dict],
         system: str,
         tools: list[dict],
+        model_id: Optional[str] = None,
+        max_tokens: Optional[int] = None,
     ) -> dict:
         """
         Send a message to Claude via Bedrock and get a response.
@@ -934,6 +2920,8 @@ class BedrockClient:
             messages: Conversation history
             system: System prompt
             tools: Available tools
+            model_id: Override the configured model (e.g. a small model for summaries)
+            max_tokens: Override the configured max_tokens
 
         Returns:
             Claude's response
@@ -955,7 +2943,7 @@ class BedrockClient:
 
         request_body = {
             "anthropic_version": "bedrock-2023-05-31",
-            "max_tokens": self.config.max_tokens,
+            "max_tokens": max_tokens or self.config.max_tokens,
             "system": system,
             "messages": messages,
             "tools": tools,
@@ -963,7 +2951,7 @@ class BedrockClient:
 
         try:
             response = self.client.invoke_model(
-                modelId=self.config.bedrock_model_id,
+                modelId=model_id or self.config.bedrock_model_id,
                 body=json.dumps(request_body),
                 contentType="application/json",
                 accept="application/json",
@@ -980,6 +2968,834 @@ class BedrockClient:
             raise
 
 
+# =============================================================================
+# Loop Detection
+# =============================================================================
+
+
+class LoopDetector:
+    """
+    Incremental detector for tool call loops. Each observed call costs
+    O(max_period), independent of how long the session has run.
+
+    Three signals:
+    - Exact periodic loops: for every period p up to max_period, a running
+      count of consecutive calls identical to the call p positions earlier.
+    - Fuzzy periodic loops: the same on argument-normalized hashes (numbers,
+      offsets and whitespace ignored), counting only calls whose result was
+      not new - so advancing offsets over already-seen data are caught while
+      genuinely new reads are not.
+    - Re-reads: consecutive file store reads of ranges already read, from the
+      FileStore access log.
+    """
+
+    VOLATILE_KEYS = frozenset({"description", "offset", "limit", "start_line", "end_line", "cursor"})
+    MAX_SEEN_RESULTS = 5000  # Bound on remembered result hashes
+
+    def __init__(self, max_period: int = 5, repeats: int = 3, max_rereads: int = 4):
+        self.max_period = max_period
+        self.repeats = repeats
+        self.max_rereads = max_rereads
+        self.reset()
+
+    def reset(self):
+        self._exact: list[str] = []  # Ring of the last max_period exact hashes
+        self._fuzzy: list[str] = []
+        self._exact_runs = [0] * (self.max_period + 1)
+        self._fuzzy_runs = [0] * (self.max_period + 1)
+        self._seen_results: dict[str, None] = {}  # Insertion-ordered set
+        self._rereads = 0
+        self.calls = 0
+
+    @staticmethod
+    def _hash(text: str) -> str:
+        import hashlib
+
+        return hashlib.md5(text.encode()).hexdigest()[:12]
+
+    def _normalize(self, value: Any) -> Any:
+        if isinstance(value, dict):
+            return {k: self._normalize(v) for k, v in sorted(value.items()) if k not in self.VOLATILE_KEYS}
+        if isinstance(value, list):
+            return [self._normalize(v) for v in value]
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            return "#"
+        if isinstance(value, str):
+            return re.sub(r"\d+", "#", " ".join(value.lower().split()))
+        return value
+
+    def _required_run(self, period: int) -> int:
+        """Matching calls needed before a period-p repeat counts as a loop."""
+        return max(period * (self.repeats - 1), self.max_period)
+
+    def observe(self, tool_name: str, tool_input: dict, result: dict) -> Optional[str]:
+        """Feed one executed call; returns a reason string if a loop is detected."""
+        self.calls += 1
+        exact = self._hash(f"{tool_name}:{json.dumps(tool_input, sort_keys=True)}")
+        fuzzy = self._hash(f"{tool_name}:{json.dumps(self._normalize(tool_input), sort_keys=True)}")
+
+        result_hash = self._hash(json.dumps(result, sort_keys=True, default=str))
+        novel = result_hash not in self._seen_results
+        if novel:
+            self._seen_results[result_hash] = None
+            if len(self._seen_results) > self.MAX_SEEN_RESULTS:
+                del self._seen_results[next(iter(self._seen_results))]
+
+        reason = None
+        for p in range(1, min(self.max_period, len(self._exact)) + 1):
+            self._exact_runs[p] = self._exact_runs[p] + 1 if self._exact[-p] == exact else 0
+            self._fuzzy_runs[p] = self._fuzzy_runs[p] + 1 if self._fuzzy[-p] == fuzzy and not novel else 0
+            if reason is None and self._exact_runs[p] >= self._required_run(p):
+                reason = f"the same {p}-call pattern repeated {self._exact_runs[p] // p + 1} times"
+            elif reason is None and self._fuzzy_runs[p] >= self._required_run(p):
+                reason = f"a near-identical {p}-call pattern repeated {self._fuzzy_runs[p] // p + 1} times without new results"
+
+        self._exact = (self._exact + [exact])[-self.max_period :]
+        self._fuzzy = (self._fuzzy + [fuzzy])[-self.max_period :]
+
+        # Re-reading the same stored data
+        if tool_name == "read_from_store" and "content" in result:
+            if result.get("previously_read_pct", 0) >= 90:
+                self._rereads += 1
+            else:
+                self._rereads = 0
+            if reason is None and self._rereads >= self.max_rereads:
+                reason = f"{self._rereads} consecutive re-reads of file store data already read"
+
+        return reason
+
+
+# =============================================================================
+# Context Packing - Relevance-ranked history under a token budget
+# =============================================================================
+
+
+@dataclass
+class PackedUnit:
+    """A piece of history the packer can swap between verbatim, summary and reference forms."""
+
+    key: str
+    turn: int
+    target: dict  # The dict holding the text (tool_result item or tool_use input)
+    field: str  # Key in target that is rewritten
+    variants: dict[str, str]  # level -> text for that level
+    identifiers: set[str]  # Paths, file ids, page ids later turns may mention
+    paths: set[str]
+    level: str = "verbatim"
+    last_ref_turn: int = -1
+    produced_files: bool = False
+
+
+class ContextPacker:
+    """
+    Decides which historical messages stay verbatim, which become summaries
+    and which become file store references, under a context budget.
+
+    Each tool result (and each write_file input) is a unit scored by:
+    - Recency: exponential decay with age in turns
+    - References: later turns mentioning its file_id, path or page id
+    - Files: it fed or touched a file in _files_written
+
+    Packing is greedy by score: every unit starts as a reference, then the
+    highest-scoring units are upgraded to verbatim (or a summary) while the
+    budget allows. The most recent units are always kept verbatim.
+    """
+
+    LEVELS = ("verbatim", "summary", "reference")
+    RECENCY_HALF_LIFE = 6.0  # Turns for recency weight to halve
+    REFERENCE_WEIGHT = 1.0
+    FILES_WEIGHT = 0.8
+    SUMMARY_CHARS = 600  # Excerpt length in summaries
+    MIN_PACKABLE_CHARS = 1000  # Smaller units are always left verbatim
+
+    _TOKEN_RE = re.compile(r"[\w./:-]+")
+    _IDENTIFIER_KEYS = ("path", "file_id", "pageId", "page_id", "id", "repo", "query")
+
+    def __init__(self):
+        self.units: dict[str, PackedUnit] = {}
+        self._by_identifier: dict[str, set[str]] = {}
+
+    def forget(self):
+        """Drop all units (the message history they point into was replaced)."""
+        self.units.clear()
+        self._by_identifier.clear()
+
+    def discard(self, keys: set[str]):
+        """Drop specific units whose messages left the history."""
+        for key in keys:
+            unit = self.units.pop(key, None)
+            if unit:
+                for ident in unit.identifiers:
+                    self._by_identifier.get(ident, set()).discard(key)
+
+    def _add(self, unit: PackedUnit):
+        self.units[unit.key] = unit
+        for ident in unit.identifiers:
+            self._by_identifier.setdefault(ident, set()).add(unit.key)
+
+    def _identifiers(self, tool_input: dict) -> tuple[set[str], set[str]]:
+        identifiers: set[str] = set()
+        paths: set[str] = set()
+        for key in self._IDENTIFIER_KEYS:
+            value = tool_input.get(key)
+            if isinstance(value, (str, int)) and str(value).strip():
+                identifiers.add(str(value).strip())
+        if isinstance(tool_input.get("path"), str):
+            paths.add(tool_input["path"])
+        return identifiers, paths
+
+    def _excerpt(self, result: dict) -> str:
+        """Pull the most informative text out of a tool result for a summary."""
+        if isinstance(result.get("content"), str):
+            text = result["content"]
+        elif isinstance(result.get("stdout"), str):
+            text = result["stdout"]
+        elif isinstance(result.get("result"), dict) and isinstance(result["result"].get("content"), list):
+            text = " ".join(part.get("text", "") for part in result["result"]["content"] if isinstance(part, dict))
+        else:
+            text = json.dumps({k: v for k, v in result.items() if not k.startswith("_")})
+        text = re.sub(r"\s+", " ", text).strip()
+        return text[: self.SUMMARY_CHARS] + ("..." if len(text) > self.SUMMARY_CHARS else "")
+
+    def add_tool_result(self, key: str, turn: int, tool_name: str, tool_input: dict, item: dict, result: dict, store_info: dict):
+        """Register a tool result item; store_info is its file store reference."""
+        verbatim = item.get("content", "")
+        if len(verbatim) < self.MIN_PACKABLE_CHARS:
+            return
+        identifiers, paths = self._identifiers(tool_input)
+        identifiers.add(store_info["file_id"])
+        ref = {
+            "stored_in_file_store": True,
+            "file_id": store_info["file_id"],
+            "size_bytes": store_info["size_bytes"],
+            "lines": store_info["lines"],
+        }
+        summary = {**ref, "summary": self._excerpt(result), "note": f"Summarized historical {tool_name} result - use read_from_store for the full content"}
+        reference = {**ref, "note": "Historical result - use read_from_store if needed"}
+        self._add(
+            PackedUnit(
+                key=key,
+                turn=turn,
+                target=item,
+                field="content",
+                variants={"verbatim": verbatim, "summary": json.dumps(summary), "reference": json.dumps(reference)},
+                identifiers=identifiers,
+                paths=paths,
+            )
+        )
+
+    def add_write_input(self, key: str, turn: int, block: dict):
+        """Register the content arguments of a write_file or write_files call (the files themselves are on disk)."""
+        tool_input = block.get("input", {})
+        if block.get("name") == "write_files":
+            for i, entry in enumerate(tool_input.get("files") or []):
+                if isinstance(entry, dict):
+                    self._add_write(f"{key}:{i}", turn, entry)
+        else:
+            self._add_write(key, turn, tool_input)
+
+    def _add_write(self, key: str, turn: int, tool_input: dict):
+        content = tool_input.get("content", "")
+        path = tool_input.get("path", "")
+        if not isinstance(content, str) or len(content) < self.MIN_PACKABLE_CHARS:
+            return
+        outline = [line.strip() for line in content.splitlines() if line.startswith("#")][:15]
+        stub = f"[{len(content):,} chars written to {path} - use read_file to view]"
+        self._add(
+            PackedUnit(
+                key=f"{key}:input",
+                turn=turn,
+                target=tool_input,
+                field="content",
+                variants={"verbatim": content, "summary": stub + "\nOutline:\n" + "\n".join(outline), "reference": stub},
+                identifiers={path},
+                paths={path},
+            )
+        )
+
+    def note_turn(self, turn: int, assistant_content: list[dict]):
+        """
+        Record what a new assistant response refers to.
+
+        Units mentioned by file_id, path or page id count as referenced; when the
+        response writes files, the results of the previous turn count as having
+        produced them.
+        """
+        texts = []
+        writes = False
+        for block in assistant_content:
+            if block.get("type") == "text":
+                texts.append(block.get("text", ""))
+            elif block.get("type") == "tool_use":
+                tool_input = block.get("input", {})
+                texts.extend(str(v) for v in _brief_input(tool_input).values())
+                writes = writes or block.get("name") in ("write_file", "write_files", "edit_file")
+
+        for token in self._TOKEN_RE.findall(" ".join(texts)):
+            for key in self._by_identifier.get(token.strip(".:"), ()):
+                unit = self.units[key]
+                if unit.turn < turn:
+                    unit.last_ref_turn = turn
+
+        if writes:
+            for unit in self.units.values():
+                if unit.turn == turn - 1 and not unit.key.endswith(":input"):
+                    unit.produced_files = True
+
+    def score(self, unit: PackedUnit, turn: int, files_written: set[str]) -> float:
+        """Relevance score: recency + later references + contribution to written files."""
+        score = 0.5 ** ((turn - unit.turn) / self.RECENCY_HALF_LIFE)
+        if unit.last_ref_turn > unit.turn:
+            score += self.REFERENCE_WEIGHT * 0.5 ** ((turn - unit.last_ref_turn) / self.RECENCY_HALF_LIFE)
+        if unit.produced_files or unit.paths & files_written:
+            score += self.FILES_WEIGHT
+        return score
+
+    def pack(self, turn: int, context_chars: int, budget_chars: int, files_written: set[str], pinned: set[str]) -> dict:
+        """
+        Choose a level for every unit so the context fits budget_chars.
+
+        Args:
+            turn: Current turn number
+            context_chars: Current estimated context size
+            budget_chars: Target context size
+            files_written: Paths written this task
+            pinned: Unit keys that must stay verbatim (most recent results)
+
+        Returns:
+            Dict with counts per level, how many units changed and the size change
+        """
+        current = sum(len(u.variants[u.level]) for u in self.units.values())
+        fixed = context_chars - current  # Everything the packer cannot change
+
+        # Start from all-reference, then spend what is left on the best units
+        available = budget_chars - fixed - sum(len(u.variants["reference"]) for u in self.units.values())
+        plan: dict[str, str] = {}
+        for key in pinned & self.units.keys():
+            unit = self.units[key]
+            plan[key] = "verbatim"
+            available -= len(unit.variants["verbatim"]) - len(unit.variants["reference"])
+
+        ranked = sorted((u for k, u in self.units.items() if k not in plan), key=lambda u: self.score(u, turn, files_written), reverse=True)
+        for unit in ranked:
+            plan[unit.key] = "reference"
+            for level in ("verbatim", "summary"):
+                extra = len(unit.variants[level]) - len(unit.variants["reference"])
+                if extra <= available:
+                    plan[unit.key] = level
+                    available -= extra
+                    break
+
+        stats = {level: 0 for level in self.LEVELS}
+        stats["changed"] = 0
+        stats["chars_delta"] = 0
+        for key, level in plan.items():
+            unit = self.units[key]
+            stats[level] += 1
+            if unit.level != level:
+                stats["chars_delta"] += len(unit.variants[level]) - len(unit.variants[unit.level])
+                unit.target[unit.field] = unit.variants[level]
+                unit.level = level
+                stats["changed"] += 1
+        return stats
+
+
+# =============================================================================
+# Rolling Summarization - Gradual context degradation instead of resets
+# =============================================================================
+
+
+class RollingSummarizer:
+    """
+    Maintains a hierarchical running summary of turns that aged out of the
+    message history.
+
+    Tier 1 holds one short note per folded turn. When more than PHASE_SIZE
+    notes accumulate, the oldest are condensed into a tier-2 phase summary.
+    Both tiers are produced on a small model; if that call fails, an
+    extractive fallback built from the turn itself is used instead.
+
+    The summarize/fold methods are blocking and meant to run in a worker
+    thread while the main loop carries on.
+    """
+
+    PHASE_SIZE = 8  # Turn notes folded into one phase summary
+    FOLD_TURNS = 4  # Turns summarized per background request
+    RESULT_EXCERPT_CHARS = 400
+    MAX_TRANSCRIPT_CHARS = 40000
+
+    TURN_PROMPT = """Summarize each turn of this documentation-agent transcript in one or two lines.
+Keep concrete facts: page ids, repo paths, names, numbers, decisions and files written.
+Output exactly one line per turn, each starting with "Turn <n>:".
+
+{transcript}"""
+
+    PHASE_PROMPT = """Condense these turn notes from a documentation agent into one paragraph (under 200 words).
+Keep concrete facts: page ids, repo paths, names, decisions and files written.
+
+{notes}"""
+
+    def __init__(self, bedrock: "BedrockClient", model_id: str):
+        self.bedrock = bedrock
+        self.model_id = model_id
+        self.turn_notes: list[str] = []
+        self.phases: list[str] = []
+        self.turns_folded = 0
+        self._model_failed = False
+
+    def reset(self):
+        self.turn_notes = []
+        self.phases = []
+        self.turns_folded = 0
+
+    def render_transcript(self, turns: list[tuple[dict, dict]]) -> tuple[str, list[str]]:
+        """
+        Render (assistant, tool results) pairs as text for the summarizer.
+
+        Returns the transcript and an extractive fallback note per turn. Runs
+        on the main thread so the worker never touches live message dicts.
+        """
+        blocks, fallbacks = [], []
+        for offset, (assistant, results) in enumerate(turns):
+            n = self.turns_folded + offset + 1
+            texts, calls, outcomes = [], [], []
+            for block in assistant.get("content", []):
+                if block.get("type") == "text":
+                    texts.append(block.get("text", "").strip())
+                elif block.get("type") == "tool_use":
+                    args = _brief_input(block.get("input", {}))
+                    calls.append(f"{block.get('name')}({json.dumps(args)[:200]})")
+            for item in results.get("content", []):
+                if isinstance(item, dict) and item.get("type") == "tool_result":
+                    outcomes.append(str(item.get("content", ""))[: self.RESULT_EXCERPT_CHARS])
+            said = " ".join(texts)
+            blocks.append(f"Turn {n}:\nAssistant: {said[:1000]}\nTool calls: {'; '.join(calls)}\nResults: {' | '.join(outcomes)}")
+            fallbacks.append(f"Turn {n}: {said[:200]} [{'; '.join(calls)[:300]}]")
+        return "\n\n".join(blocks)[: self.MAX_TRANSCRIPT_CHARS], fallbacks
+
+    def _ask(self, prompt: str) -> str:
+        if self._model_failed:
+            return ""
+        try:
+            response = self.bedrock.create_message(
+                messages=[{"role": "user", "content": prompt}],
+                system="You write terse, factual progress notes.",
+                tools=[],
+                model_id=self.model_id,
+                max_tokens=1024,
+            )
+            return "".join(block.get("text", "") for block in response.get("content", []) if block.get("type") == "text").strip()
+        except Exception as e:
+            logger.warning(f"Summary model unavailable, using extractive summaries: {e}")
+            self._model_failed = True
+            return ""
+
+    def summarize_turns(self, transcript: str, fallbacks: list[str]) -> list[str]:
+        """Produce one note per turn (blocking)."""
+        text = self._ask(self.TURN_PROMPT.format(transcript=transcript))
+        notes = [line.strip() for line in text.splitlines() if line.strip().lower().startswith("turn")]
+        if len(notes) == len(fallbacks):
+            return notes
+        return [text] if text else fallbacks
+
+    def fold_phase(self, notes: list[str]) -> str:
+        """Condense turn notes into one phase summary (blocking)."""
+        return self._ask(self.PHASE_PROMPT.format(notes="\n".join(notes))) or " ".join(note[:150] for note in notes)
+
+    def render(self) -> str:
+        """Render the running summary for the head of the conversation."""
+        if not self.phases and not self.turn_notes:
+            return ""
+        parts = ["## Progress so far (earlier turns, summarized)"]
+        for i, phase in enumerate(self.phases, 1):
+            parts.append(f"### Phase {i}\n{phase}")
+        if self.turn_notes:
+            parts.append("### Recent turns\n" + "\n".join(f"- {note}" for note in self.turn_notes))
+        parts.append("Full tool results from these turns remain available via list_store_files / read_from_store.")
+        return "\n\n".join(parts)
+
+
+# =============================================================================
+# Session Transcript
+# =============================================================================
+
+
+class SessionTranscript:
+    """
+    Append-only, crash-safe record of a task session.
+
+    One JSONL file per task under .agent-store/sessions/. Each completed turn
+    appends a record with the messages added since the previous record and
+    the session state (files written, tool calls, file store references),
+    flushed and fsync'd before the next turn starts. History rewrites are
+    recorded as operations (dropped ranges, a new head message) so records
+    stay small; only a replaced message list (soft reset) writes a full
+    snapshot. Replaying the file reproduces the message list exactly, so an
+    interrupted task resumes without re-research or a summary request.
+
+    A torn final line (process killed mid-write) is ignored and truncated.
+    """
+
+    SESSIONS_DIR = "sessions"
+
+    def __init__(self, store_path: Path, task: str):
+        import hashlib
+
+        task_hash = hashlib.sha256(task.encode()).hexdigest()[:16]
+        self.path = Path(store_path) / self.SESSIONS_DIR / f"{task_hash}.jsonl"
+
+    def exists(self) -> bool:
+        return self.path.exists() and self.path.stat().st_size > 0
+
+    def append(self, record: dict):
+        """Append one record durably."""
+        record = {"ts": datetime.now().isoformat(), **record}
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.path, "a") as f:
+            f.write(json.dumps(record) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def load(self) -> Optional[dict]:
+        """
+        Replay the transcript.
+
+        Returns {"messages", "state", "store_refs", "exit"} where state merges
+        the state of every record, store_refs lists the file store ids the
+        session's tool results were saved under and exit is the last exit
+        record (if nothing followed it), or None when there is nothing to resume.
+        """
+        if not self.exists():
+            return None
+
+        messages: list[dict] = []
+        state: dict = {}
+        store_refs: dict[str, None] = {}
+        exit_record: Optional[dict] = None
+        good_bytes = 0
+        with open(self.path, "rb") as f:
+            for raw in f:
+                try:
+                    record = json.loads(raw)
+                except ValueError:
+                    logger.warning(f"Ignoring torn record at byte {good_bytes} of {self.path.name}")
+                    break
+                good_bytes += len(raw)
+
+                kind = record.get("type")
+                if kind == "snapshot":
+                    messages = record["messages"]
+                elif kind == "turn":
+                    for start, count in record.get("drop", []):
+                        del messages[start : start + count]
+                    if "head" in record and messages:
+                        messages[0]["content"] = record["head"]
+                    messages.extend(record.get("messages", []))
+                    store_refs.update(dict.fromkeys(record.get("store_refs", [])))
+                elif kind == "exit":
+                    exit_record = record
+                    continue
+                state.update(record.get("state", {}))
+                exit_record = None
+
+        if good_bytes < self.path.stat().st_size:
+            with open(self.path, "r+b") as f:
+                f.truncate(good_bytes)
+
+        if not messages:
+            return None
+        return {"messages": messages, "state": state, "store_refs": list(store_refs), "exit": exit_record}
+
+    def clear(self):
+        """Remove the transcript (task complete)."""
+        try:
+            self.path.unlink(missing_ok=True)
+        except OSError as e:
+            logger.warning(f"Failed to remove session transcript: {e}")
+
+
+# =============================================================================
+# Research Cache
+# =============================================================================
+
+
+class ResearchCache:
+    """
+    Distilled research that outlives a task, keyed by topic.
+
+    The model records what it learned about a topic (a backlog item, a
+    service) with remember(topic, facts, sources); a later task or continuous
+    iteration gets it back with recall(topic) instead of searching Confluence
+    and GitHub again. Sources are "confluence:<pageId>" or
+    "github:<owner>/<repo>:<path>". Each is pinned to the Confluence page
+    version or git blob sha last seen in an MCP result, and every MCP result
+    is scanned for those versions: when a source changes, the entries built
+    on it go stale and recall reports them as needing re-research instead of
+    returning their facts. A source with no version seen yet is pinned to
+    None, and its entry goes stale as soon as any version of it is seen.
+    Versions persisted from an earlier run prove nothing about today: recall
+    withholds the facts of an entry until each of its sources has been seen
+    in this run (the agent re-reads them once per run, see pending_checks).
+
+    Persisted as one JSON file in the file store directory, shared by all
+    agents of a run.
+    """
+
+    FILE_NAME = "research.json"
+    MAX_FACTS = 40  # Per topic; the newest are kept
+    MAX_RECALL = 5  # Topics returned for a fuzzy recall
+    SOURCE_RE = re.compile(r"^(confluence:\d+|github:[\w.-]+/[\w.-]+:.+)$")
+
+    def __init__(self, store_path: Path):
+        self.path = Path(store_path) / self.FILE_NAME
+        self.entries: dict[str, dict] = {}  # normalized topic -> {topic, facts, sources, updated, stale?}
+        self.versions: dict[str, str] = {}  # source -> latest version seen in an MCP result
+        self._seen_this_run: set[str] = set()
+        self._checked_this_run: set[str] = set()  # Sources a recall already tried to re-read
+        self._load()
+
+    def _load(self):
+        try:
+            data = json.loads(self.path.read_text())
+            self.entries = data.get("entries", {})
+            self.versions = data.get("versions", {})
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            logger.warning(f"Failed to load research cache: {e}")
+
+    def _save(self):
+        import tempfile
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # Only versions of sources an entry cites are worth keeping across runs
+        cited = {pinned["source"] for entry in self.entries.values() for pinned in entry["sources"]}
+        versions = {source: version for source, version in self.versions.items() if source in cited}
+        fd, tmp = tempfile.mkstemp(prefix=f".{self.path.name}.", suffix=".tmp", dir=self.path.parent)
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump({"entries": self.entries, "versions": versions}, f, indent=1)
+            os.replace(tmp, self.path)
+        except BaseException:
+            Path(tmp).unlink(missing_ok=True)
+            raise
+
+    @staticmethod
+    def _key(topic: str) -> str:
+        return " ".join(re.findall(r"[a-z0-9]+", topic.lower()))
+
+    # -------------------------------------------------------------------------
+    # Source versions
+    # -------------------------------------------------------------------------
+
+    def observe(self, tool_name: str, tool_input: dict, result: dict):
+        """Record source versions found in an MCP result; invalidate entries whose sources changed."""
+        parts = (result.get("result") or {}).get("content") if isinstance(result.get("result"), dict) else None
+        if not result.get("success") or not isinstance(parts, list):
+            return
+        repo = f"{tool_input.get('owner')}/{tool_input.get('repo')}" if tool_input.get("owner") and tool_input.get("repo") else None
+        found: dict[str, str] = {}
+        for part in parts:
+            text = part.get("text") if isinstance(part, dict) else None
+            try:
+                payload = json.loads(text) if isinstance(text, str) else None
+            except ValueError:
+                continue
+            if tool_name == "confluence":
+                self._scan_confluence(payload, found)
+            elif tool_name == "github" and repo:
+                self._scan_github(payload, repo, found)
+        if found:
+            self._update_versions(found)
+
+    def _scan_confluence(self, payload: Any, found: dict[str, str]):
+        if isinstance(payload, list):
+            for item in payload:
+                self._scan_confluence(item, found)
+        elif isinstance(payload, dict):
+            version = payload.get("version")
+            if payload.get("id") is not None and isinstance(version, dict) and version.get("number") is not None:
+                found[f"confluence:{payload['id']}"] = str(version["number"])
+            for value in payload.values():
+                if isinstance(value, (list, dict)):
+                    self._scan_confluence(value, found)
+
+    def _scan_github(self, payload: Any, repo: str, found: dict[str, str]):
+        if isinstance(payload, list):
+            for item in payload:
+                self._scan_github(item, repo, found)
+        elif isinstance(payload, dict):
+            if isinstance(payload.get("path"), str) and isinstance(payload.get("sha"), str):
+                found[f"github:{repo}:{payload['path']}"] = payload["sha"]
+            if isinstance(payload.get("tree"), list):
+                self._scan_github(payload["tree"], repo, found)
+
+    def _update_versions(self, found: dict[str, str]):
+        self.versions.update(found)
+        self._seen_this_run.update(found)
+        dirty = False
+        for entry in self.entries.values():
+            if entry.get("stale"):
+                continue
+            moved = []
+            for pinned in entry["sources"]:
+                version = found.get(pinned["source"])
+                if version is None or version == pinned["version"]:
+                    continue
+                if pinned["version"] is None:
+                    # Unknown what was read when the facts were remembered, so the source may have changed since
+                    moved.append(f"{pinned['source']} was unversioned when remembered, now at {version}")
+                else:
+                    moved.append(f"{pinned['source']} changed ({pinned['version']} -> {version})")
+            if moved:
+                entry["stale"] = moved
+                dirty = True
+                logger.info(f"🧠 Research on '{entry['topic']}' invalidated: {', '.join(moved)}")
+        if dirty:
+            self._save()
+
+    def pending_checks(self, topic: str) -> list[str]:
+        """
+        Sources of the entries recall(topic) would return that have not been
+        seen this run, each handed out once per run so a failed re-read is not
+        retried on every recall.
+        """
+        pending = []
+        for entry in self._matches(topic):
+            for pinned in entry["sources"]:
+                source = pinned["source"]
+                if not entry.get("stale") and source not in self._seen_this_run and source not in self._checked_this_run and source not in pending:
+                    pending.append(source)
+        self._checked_this_run.update(pending)
+        return pending
+
+    @staticmethod
+    def check_call(source: str) -> tuple[str, dict]:
+        """The MCP tool and arguments that read a source's current version."""
+        kind, _, rest = source.partition(":")
+        if kind == "confluence":
+            return "confluence", {"operation": "get_page", "pageId": rest}
+        repo, _, path = rest.partition(":")
+        owner, _, name = repo.partition("/")
+        return "github", {"operation": "get_file_content", "owner": owner, "repo": name, "path": path}
+
+    # -------------------------------------------------------------------------
+    # Tools
+    # -------------------------------------------------------------------------
+
+    def remember(self, topic: str, facts: list[str], sources: list[str], replace: bool = False) -> dict:
+        """Record facts about a topic, pinning each source to its latest seen version."""
+        if not topic.strip() or not facts:
+            return {"success": False, "error": "topic and at least one fact are required"}
+        bad = [s for s in sources if not isinstance(s, str) or not self.SOURCE_RE.match(s)]
+        if bad:
+            return {"success": False, "error": f"Sources must be 'confluence:<pageId>' or 'github:<owner>/<repo>:<path>': {bad}"}
+
+        key = self._key(topic)
+        entry = self.entries.get(key)
+        if entry is None or replace or entry.get("stale"):
+            entry = {"topic": topic, "facts": [], "sources": []}
+            self.entries[key] = entry
+        entry["facts"] = (entry["facts"] + [str(f) for f in facts if f not in entry["facts"]])[-self.MAX_FACTS :]
+        pinned = {s["source"]: s for s in entry["sources"]}
+        for source in sources:
+            pinned[source] = {"source": source, "version": self.versions.get(source)}
+        entry["sources"] = list(pinned.values())
+        entry["updated"] = datetime.now().isoformat(timespec="seconds")
+        self._save()
+
+        unpinned = [s["source"] for s in entry["sources"] if not s["version"]]
+        result = {"success": True, "topic": entry["topic"], "facts": len(entry["facts"]), "sources": len(entry["sources"])}
+        if unpinned:
+            result["unversioned_sources"] = unpinned
+            result["note"] = "These sources were not seen in an MCP result; the topic goes stale as soon as one of them is, so read them before remembering"
+        return result
+
+    def _matches(self, topic: str) -> list[dict]:
+        """Entries for a topic: the exact one, else the best by word overlap."""
+        key = self._key(topic)
+        if key in self.entries:
+            return [self.entries[key]]
+        words = set(key.split())
+        scored = []
+        for entry_key, entry in self.entries.items():
+            overlap = len(words & set(entry_key.split()))
+            if overlap:
+                scored.append((overlap / len(words | set(entry_key.split())), entry))
+        return [entry for _, entry in sorted(scored, key=lambda pair: -pair[0])[: self.MAX_RECALL]]
+
+    def recall(self, topic: Optional[str] = None) -> dict:
+        """Facts for a topic (exact, else best word overlap), or the list of topics when none is given."""
+        if not topic:
+            return {
+                "topics": [
+                    {"topic": e["topic"], "facts": len(e["facts"]), "updated": e.get("updated"), **({"stale": True} if e.get("stale") else {})}
+                    for e in sorted(self.entries.values(), key=lambda e: e.get("updated", ""), reverse=True)
+                ]
+            }
+
+        matches = self._matches(topic)
+        if not matches:
+            return {"found": False, "topic": topic, "message": "Nothing cached for this topic; research it and call remember() with what you find."}
+
+        results = []
+        for entry in matches:
+            if entry.get("stale"):
+                results.append({"topic": entry["topic"], "stale": entry["stale"], "sources": [s["source"] for s in entry["sources"]], "message": "Sources changed since this was researched; re-read them and remember() again."})
+                continue
+            unverified = [s["source"] for s in entry["sources"] if s["source"] not in self._seen_this_run]
+            if unverified:
+                results.append(
+                    {
+                        "topic": entry["topic"],
+                        "unverified": unverified,
+                        "message": "Could not confirm these sources are unchanged this run; read them, then recall again.",
+                    }
+                )
+                continue
+            results.append({"topic": entry["topic"], "facts": entry["facts"], "sources": entry["sources"], "updated": entry.get("updated")})
+        logger.info(f"🧠 recall '{topic}': {len(results)} topic(s)")
+        return {"found": True, "results": results}
+
+    def get_tool_definitions(self) -> list[dict]:
+        """Return tool definitions for Claude."""
+        return [
+            {
+                "name": "recall",
+                "description": (
+                    "Recall research cached by earlier tasks: distilled facts and their Confluence/GitHub sources for a topic "
+                    "(a backlog item, service or component). Call this BEFORE searching Confluence or GitHub. "
+                    "Sources are checked for changes first: entries whose sources changed are reported as stale, and entries "
+                    "whose sources could not be checked as unverified. Omit topic to list cached topics."
+                ),
+                "input_schema": {
+                    "type": "object",
+                    "properties": {
+                        "topic": {"type": "string", "description": "Topic to recall, e.g. 'call recording service'"},
+                    },
+                },
+            },
+            {
+                "name": "remember",
+                "description": (
+                    "Cache what you learned about a topic for later tasks: short, self-contained facts, and the sources "
+                    "they came from as 'confluence:<pageId>' or 'github:<owner>/<repo>:<path>'. Sources are pinned to the "
+                    "version you read, so the facts are invalidated when the page or file changes."
+                ),
+                "input_schema": {
+                    "type": "object",
+                    "properties": {
+                        "topic": {"type": "string", "description": "Topic the facts are about"},
+                        "facts": {"type": "array", "items": {"type": "string"}, "description": "Distilled facts, one per item"},
+                        "sources": {"type": "array", "items": {"type": "string"}, "description": "Sources of the facts"},
+                        "replace": {"type": "boolean", "description": "Replace the topic's facts instead of adding to them", "default": False},
+                    },
+                    "required": ["topic", "facts", "sources"],
+                },
+            },
+        ]
+
+
 # =============================================================================
 # Documentation Agent
 # =============================================================================
@@ -991,7 +3807,7 @@ class DocumentationAgent:
     with shell and MCP tools.
 
     Features:
-    - Loop detection: Detects repeated tool call patterns
+    - Loop detection: Detects repeated and near-repeated tool call patterns
     - Error handling: Exits after consecutive errors
     - Completion detection: Recognizes when tasks are done
     """
@@ -999,19 +3815,42 @@ class DocumentationAgent:
     # Exit conditions
     MAX_CONSECUTIVE_ERRORS = 3
     MAX_REPEATED_PATTERNS = 3  # Exit if same pattern repeats this many times
-    PATTERN_WINDOW_SIZE = 5  # Look at last N tool calls for pattern detection
+    PATTERN_WINDOW_SIZE = 5  # Longest repeating tool call period detected
 
     # Context management
     MAX_TOOL_RESULT_CHARS = 50000  # Store results larger than this (~12K tokens)
     CONTEXT_SOFT_RESET_THRESHOLD = 0.50  # Trigger soft reset at 50% - need room for summary!
 
+    # Adaptive inlining: a result may take this share of the remaining context
+    # headroom, within these bounds, scaled by how useful its kind usually is
+    INLINE_HEADROOM_SHARE = 0.25
+    INLINE_MIN_CHARS = 8000
+    INLINE_MAX_CHARS = 120000
+    INLINE_PRIORS = {
+        "read_file": 1.5,  # Asked for explicitly, usually to edit or cite
+        "get_page": 1.25,
+        "get_file_content": 1.25,
+        "bash": 0.75,
+        "search": 0.5,  # Scanned for ids; the preview usually suffices
+        "list": 0.5,
+    }
+
+    # read_file arguments that select a slice (ranged reads bypass the memo)
+    READ_RANGE_KEYS = ("offset", "limit", "start_line", "end_line")
+    # list_directory arguments beyond path/force (non-default values bypass the memo)
+    LIST_OPTION_KEYS = {"depth": 1, "glob": None, "sort": "name", "cursor": None, "page_size": 200, "tree": False}
+
     SYSTEM_PROMPT = """You are an expert documentation engineer helping to create and maintain platform documentation for Natterbox.
 
 You have access to the following tool categories:
 
-1. **Shell Tools** (bash, read_file, write_file, list_directory):
+1. **Shell Tools** (bash, read_file, write_file, write_files, edit_file, list_directory, search_workspace, find_docs):
    - Execute commands in the workspace
    - Create and edit documentation files
+   - Use edit_file for small changes to existing files (a table row, a checkbox) instead of rewriting them with write_file
+   - Use search_workspace rather than grep/find to locate text in the workspace
+   - Use find_docs to see what is already documented about a topic (titles, headings, digests, links) before reading whole docs
+   - Write a set of related files with one write_files call
    - Manage the file system
 
 2. **File Store Tools** (read_from_store, list_store_files):
@@ -1025,7 +3864,12 @@ You have access to the following tool categories:
      -> Call read_from_store(file_id, offset=10000) to get the next chunk
    - Default limit is 10000 chars (~2500 tokens)
 
-3. **MCP Tools** (prefixed with mcp_):
+3. **Research Cache Tools** (recall, remember):
+   - recall(topic) returns facts earlier tasks cached about a topic - call it BEFORE searching Confluence or GitHub
+   - After researching, remember(topic, facts, sources) with short distilled facts and their sources
+   - Facts whose Confluence page or GitHub file has changed since are reported as stale - re-research those
+
+4. **MCP Tools** (prefixed with mcp_):
    - mcp_confluence: Search and read Confluence wiki pages
    - mcp_github: Access GitHub repositories and files
    - mcp_docs360_search: Search Document360 knowledge base
@@ -1035,7 +3879,7 @@ You have access to the following tool categories:
 
 ## Your Workflow
 
-1. **Research Phase**: Use MCP tools to gather information from:
+1. **Research Phase**: Check recall() first, then use MCP tools to gather information from:
    - Confluence for architecture docs, runbooks, processes
    - GitHub for repository structure and code
    - Document360 for customer-facing documentation
@@ -1086,21 +3930,69 @@ If you encounter issues that prevent completion:
     # Continuation file for resuming interrupted tasks
     CONTINUATION_FILE = ".project/continuation.json"
 
-    def __init__(self, config: Config):
+    def __init__(
+        self,
+        config: Config,
+        mcp: Optional[MCPClient] = None,
+        bedrock: Optional[BedrockClient] = None,
+        file_store: Optional[FileStore] = None,
+        research_cache: Optional[ResearchCache] = None,
+    ):
+        """
+        Args:
+            config: Agent configuration
+            mcp, bedrock, file_store, research_cache: Shared instances for agents
+                running side by side (e.g. --tasks-file); each agent creates its
+                own when omitted
+        """
         self.config = config
-        self.shell = ShellTool(config.work_dir, config.shell_timeout)
-        self.mcp = MCPClient(config.natterbox_mcp_url)
-        self.bedrock = BedrockClient(config)
-        self.file_store = FileStore(config.work_dir)  # For caching large results
+        self.mcp = mcp or MCPClient(config.natterbox_mcp_url)
+        self.bedrock = bedrock or BedrockClient(config)
+        self.file_store = file_store or FileStore(config.work_dir)  # For caching large results
+        self.shell = ShellTool(config.work_dir, config.shell_timeout, self.file_store, config.persistent_shell)
+        self.research_cache = research_cache or ResearchCache(self.file_store.store_path)  # Facts that outlive a task
         self.messages: list[dict] = []
         self.tools: list[dict] = []
+        self.usage = {"requests": 0, "input_tokens": 0, "output_tokens": 0}  # Bedrock usage by this agent
 
         # Tracking for loop detection and error handling
-        self._tool_call_history: list[str] = []  # Hashes of recent tool calls
+        self.loop_detector = LoopDetector(self.PATTERN_WINDOW_SIZE, self.MAX_REPEATED_PATTERNS)
         self._consecutive_errors = 0
         self._files_written: set[str] = set()  # Track created files
 
-        # Continuation file path
+        # Incremental history compression: tool results are scanned once and
+        # compacted once, so the per-turn cost does not grow with the session
+        self._tool_result_meta: dict[str, dict] = {}  # tool_use_id -> metadata captured at creation
+        self._history_ref: Optional[list] = None  # The messages list the positions below refer to
+        self._history_scanned = 0  # messages[:n] have been scanned for tool results
+        self._tool_result_positions: list[int] = []  # Indices of user messages holding tool results
+        self._compression_watermark = 0  # _tool_result_positions[:n] are already compacted
+
+        self.result_shaper = ResultShaper()  # Per-tool compaction of MCP results
+        # Per result kind: results returned by reference, and how many the model then fetched
+        self._inline_stats: dict[str, dict[str, int]] = {}
+        self._referenced: dict[str, str] = {}  # file_id returned by reference -> result kind
+
+        # Relevance-ranked context packing (see ContextPacker)
+        self.context_packer = ContextPacker()
+        self._turn = 0
+        self._context_chars = 0  # Context size estimate after fitting, updated each turn
+
+        # Rolling summary of aged-out turns (see RollingSummarizer)
+        self.summarizer = RollingSummarizer(self.bedrock, config.summary_model_id)
+        self._summary_task: Optional[asyncio.Future] = None
+        self._summary_job: Optional[dict] = None  # What the in-flight task covers
+        self._summary_anchor: Optional[dict] = None  # First message the summary is attached to
+        self._summary_base = ""  # That message's original text
+
+        # Append-only session transcript (see SessionTranscript), bound per task
+        self.transcript: Optional[SessionTranscript] = None
+        self._transcript_ref: Optional[list] = None  # The messages list the transcript mirrors
+        self._transcript_len = 0  # messages[:n] are persisted
+        self._transcript_head: Any = None  # Persisted content of messages[0]
+        self._transcript_drops: list[list[int]] = []  # History drops since the last record
+
+        # Legacy continuation file (read for runs interrupted before transcripts existed)
         self._continuation_path = self.config.work_dir / self.CONTINUATION_FILE
 
     def _check_continuation(self) -> Optional[dict]:
@@ -1124,81 +4016,99 @@ If you encounter issues that prevent completion:
         except Exception as e:
             logger.warning(f"Failed to clear continuation file: {e}")
 
-    def _generate_continuation_prompt(self, original_task: str, turns_used: int) -> str:
-        """
-        Ask Claude to generate a continuation prompt capturing current progress.
-        This is called when we run out of turns.
+    def _checkpoint(self, original_task: str, turns_used: int, soft_resets: int, tool_calls: list = (), store_refs: list = ()):
         """
-        logger.info("📝 Generating continuation prompt for next run...")
-
-        # Add a special message asking for a continuation summary
-        continuation_request = """
-IMPORTANT: The task has been interrupted due to reaching the maximum number of turns.
+        Persist the turn just completed to the session transcript.
 
-Please provide a CONTINUATION PROMPT that I can use to resume this task exactly where you left off.
-The continuation prompt should:
-
-1. Briefly summarize what has been accomplished so far
-2. List any files that were created or modified
-3. Clearly state what the NEXT STEPS should be
-4. Include any important context or decisions made during this session
-
-Format your response as a clear, actionable prompt that another instance can use to continue the work.
-Start your response with "CONTINUATION PROMPT:" followed by the prompt text.
-"""
-
-        # Temporarily add this to messages
-        self.messages.append({"role": "user", "content": continuation_request})
+        Appends the messages added since the previous record, plus any history
+        drops and head rewrite; a replaced message list is written as a snapshot.
+        """
+        if self.transcript is None:
+            return
+
+        state = {
+            "original_task": original_task,
+            "turns_used": turns_used,
+            "soft_resets": soft_resets,
+            "files_written": sorted(self._files_written),
+        }
+        head = self.messages[0].get("content") if self.messages else None
+        if self.messages is not self._transcript_ref or self._transcript_len > len(self.messages):
+            record = {"type": "snapshot", "messages": self.messages}
+        else:
+            record = {"type": "turn", "messages": self.messages[self._transcript_len :]}
+            if self._transcript_drops:
+                record["drop"] = self._transcript_drops
+            if head != self._transcript_head:
+                record["head"] = head
+        if record["type"] == "snapshot" or "head" in record:
+            state["summary"] = {
+                "base": self._summary_base if self._summary_anchor is not None else None,
+                "turn_notes": self.summarizer.turn_notes,
+                "phases": self.summarizer.phases,
+                "turns_folded": self.summarizer.turns_folded,
+            }
+        record["state"] = state
+        if tool_calls:
+            record["tool_calls"] = [{"name": name, "input": _brief_input(tool_input)} for name, tool_input, _ in tool_calls]
+        if store_refs:
+            record["store_refs"] = list(store_refs)
 
         try:
-            response = self.bedrock.create_message(
-                messages=self.messages,
-                system=self._get_system_prompt(),
-                tools=[],  # No tools needed for this
-            )
-
-            # Extract the continuation prompt
-            for block in response.get("content", []):
-                if block.get("type") == "text":
-                    text = block.get("text", "")
-                    # Try to extract just the continuation prompt
-                    if "CONTINUATION PROMPT:" in text:
-                        prompt = text.split("CONTINUATION PROMPT:", 1)[1].strip()
-                        return prompt
-                    return text
-
+            self.transcript.append(record)
         except Exception as e:
-            logger.error(f"Failed to generate continuation prompt: {e}")
-            # Fallback: create a basic continuation prompt
-            return f"""Continue the documentation task from where it was interrupted.
-
-Original task: {original_task}
+            logger.warning(f"Failed to write session transcript: {e}")
+            self._transcript_ref = None  # Retry with a full snapshot next turn
+            return
+        self._transcript_ref, self._transcript_len, self._transcript_head = self.messages, len(self.messages), head
+        self._transcript_drops = []
 
-Files created so far: {list(self._files_written)}
-
-The previous run used {turns_used} turns. Please review the project status files 
-(.project/STATUS.md, .project/BACKLOG.md) and continue with the next logical step."""
-
-        return ""
+    def _resume_session(self, session: dict) -> tuple[str, int, int]:
+        """
+        Restore the message list and session state replayed from the transcript.
 
-    def _save_continuation(self, original_task: str, continuation_prompt: str, turns_used: int):
-        """Save continuation data for the next run."""
-        try:
-            self._continuation_path.parent.mkdir(parents=True, exist_ok=True)
-
-            data = {
-                "timestamp": datetime.now().isoformat(),
-                "original_task": original_task,
-                "continuation_prompt": continuation_prompt,
-                "turns_used": turns_used,
-                "files_written": list(self._files_written),
-            }
+        Returns (original_task, turns_used, soft_resets).
+        """
+        state = session["state"]
+        self.messages = session["messages"]
+        self._files_written = set(state.get("files_written", []))
+
+        summary = state.get("summary")
+        if summary:
+            self.summarizer.turn_notes = summary["turn_notes"]
+            self.summarizer.phases = summary["phases"]
+            self.summarizer.turns_folded = summary["turns_folded"]
+            if summary["base"] is not None:
+                self._summary_anchor, self._summary_base = self.messages[0], summary["base"]
+
+        missing = [file_id for file_id in session["store_refs"] if file_id not in self.file_store._index]
+        if missing:
+            logger.warning(f"{len(missing)} file store references from the previous run are missing: {missing[:5]}")
+
+        exit_record = session["exit"]
+        if exit_record and exit_record.get("reason") == "loop":
+            note = (
+                f"NOTE: The previous run stopped because it was repeating itself ({exit_record.get('detail', '')}). "
+                "Do not repeat those calls - use the results you already have or take a different approach."
+            )
+            last = self.messages[-1]
+            if isinstance(last["content"], list):
+                last["content"].append({"type": "text", "text": note})
+            else:
+                last["content"] = f"{last['content']}\n\n{note}"
 
-            self._continuation_path.write_text(json.dumps(data, indent=2))
-            logger.info(f"💾 Saved continuation prompt to: {self._continuation_path}")
+        # Results persisted verbatim - compact everything but the latest before the first request
+        self._compress_historical_messages(keep_recent=3)
+        self._transcript_ref = None  # Start the resumed run with a fresh snapshot
 
-        except Exception as e:
-            logger.error(f"Failed to save continuation: {e}")
+        original_task = state.get("original_task", "")
+        turns_used, soft_resets = state.get("turns_used", 0), state.get("soft_resets", 0)
+        logger.info(f"🔄 Resuming session from {self.transcript.path.name}: {len(self.messages)} messages, {turns_used} turns")
+        print(f"\n📋 RESUMING PREVIOUS SESSION")
+        print(f"   Original: {original_task[:60]}...")
+        print(f"   Turns used previously: {turns_used}")
+        print(f"   Files from previous run: {sorted(self._files_written)}\n")
+        return original_task, turns_used, soft_resets
 
     def _should_soft_reset(self) -> bool:
         """Check if context is large enough to warrant a soft reset."""
@@ -1228,6 +4138,7 @@ The previous run used {turns_used} turns. Please review the project status files
             first_message = self.messages[0]  # Keep original task
             last_messages = self.messages[-6:]  # Keep last 3 exchanges (6 messages)
             self.messages = [first_message] + last_messages
+            self.shell.reset_memo()
             logger.info(f"📦 Truncated messages: {original_message_count} → {len(self.messages)} for summary request")
 
         # Also compress any remaining tool results
@@ -1312,9 +4223,15 @@ Original task: {original_task}"""
         self.tools.extend(self.file_store.get_tool_definitions())
         logger.info(f"Loaded {len(self.file_store.get_tool_definitions())} file store tools")
 
-        # Connect to MCP server
-        if await self.mcp.connect():
-            self.tools.extend(self.mcp.get_tool_definitions())
+        # Initialize research cache tools
+        self.tools.extend(self.research_cache.get_tool_definitions())
+
+        # Connect to MCP server (a shared client may already be connected)
+        if self.mcp.tools or await self.mcp.connect():
+            mcp_tools = self.mcp.get_tool_definitions()
+            if self.config.shape_results:
+                mcp_tools = [self._with_raw_option(tool) for tool in mcp_tools]
+            self.tools.extend(mcp_tools)
             logger.info(f"Loaded {len(self.mcp.get_tool_definitions())} MCP tools")
         else:
             logger.warning("MCP connection failed - continuing with shell tools only")
@@ -1326,44 +4243,17 @@ Original task: {original_task}"""
         """Get the system prompt with current date."""
         return self.SYSTEM_PROMPT.format(date=datetime.now().strftime("%Y-%m-%d"))
 
-    def _get_tool_call_hash(self, tool_name: str, tool_input: dict) -> str:
-        """Generate a hash for a tool call to detect duplicates."""
-        import hashlib
-
-        # Create a normalized representation
-        call_str = f"{tool_name}:{json.dumps(tool_input, sort_keys=True)}"
-        return hashlib.md5(call_str.encode()).hexdigest()[:12]
-
-    def _detect_loop(self, tool_calls: list[tuple[str, dict]]) -> bool:
+    def _detect_loop(self, tool_calls: list[tuple[str, dict, dict]]) -> Optional[str]:
         """
-        Detect if we're in a loop by checking for repeated patterns.
-        Returns True if a loop is detected.
+        Feed this turn's (name, input, result) calls to the streaming loop detector.
+        Returns a description of the loop if one is detected.
         """
-        # Add new tool calls to history
-        for name, inputs in tool_calls:
-            call_hash = self._get_tool_call_hash(name, inputs)
-            self._tool_call_history.append(call_hash)
-
-        # Keep only recent history
-        if len(self._tool_call_history) > self.PATTERN_WINDOW_SIZE * 3:
-            self._tool_call_history = self._tool_call_history[-self.PATTERN_WINDOW_SIZE * 3 :]
-
-        # Check for repeated patterns
-        if len(self._tool_call_history) >= self.PATTERN_WINDOW_SIZE * 2:
-            recent = self._tool_call_history[-self.PATTERN_WINDOW_SIZE :]
-
-            # Count how many times this exact pattern appears
-            pattern_count = 0
-            for i in range(len(self._tool_call_history) - self.PATTERN_WINDOW_SIZE + 1):
-                window = self._tool_call_history[i : i + self.PATTERN_WINDOW_SIZE]
-                if window == recent:
-                    pattern_count += 1
-
-            if pattern_count >= self.MAX_REPEATED_PATTERNS:
-                logger.warning(f"Loop detected: pattern repeated {pattern_count} times")
-                return True
-
-        return False
+        for name, inputs, result in tool_calls:
+            reason = self.loop_detector.observe(name, inputs, result)
+            if reason:
+                logger.warning(f"Loop detected: {reason}")
+                return reason
+        return None
 
     def _check_task_completion(self, response_text: str) -> bool:
         """
@@ -1383,14 +4273,50 @@ Original task: {original_task}"""
         text_lower = response_text.lower()
         return any(indicator in text_lower for indicator in completion_indicators)
 
-    def _truncate_result(self, result: dict, source: str = "unknown") -> dict:
+    def _result_kind(self, tool_name: str, tool_input: dict) -> str:
+        """Key for inlining priors and statistics: tool name, plus the operation for MCP tools."""
+        operation = tool_input.get("operation") if tool_name.startswith("mcp_") else None
+        return f"{tool_name}:{operation}" if operation else tool_name
+
+    def _inline_threshold(self, kind: str) -> tuple[int, str]:
+        """
+        Largest result (chars) to inline for this kind of result right now.
+
+        Starts from a share of the context headroom (the packing budget, or the
+        soft reset point without packing, minus the current context estimate),
+        scaled by a usefulness prior for the kind and by how often results of
+        that kind returned by reference were read back anyway.
+        """
+        soft_limit = int(self.bedrock.CONTEXT_LIMIT_CHARS * self.CONTEXT_SOFT_RESET_THRESHOLD)
+        budget = min(soft_limit, self.config.context_token_budget * 4) if self.config.context_packing else soft_limit
+        headroom = max(0, budget - self._context_chars)
+
+        prior = next((weight for key, weight in self.INLINE_PRIORS.items() if key in kind.split(":")[-1].lower()), 1.0)
+        stats = self._inline_stats.get(kind)
+        fetch_rate = stats["fetched"] / stats["referenced"] if stats and stats["referenced"] >= 2 else 0.5
+        usefulness = prior * (0.5 + fetch_rate)
+
+        threshold = int(min(self.INLINE_MAX_CHARS, max(self.INLINE_MIN_CHARS, headroom * self.INLINE_HEADROOM_SHARE * usefulness)))
+        return threshold, f"headroom={headroom:,} prior={prior} fetch_rate={fetch_rate:.2f}"
+
+    def _note_store_read(self, file_id: str):
+        """Count a read_from_store of a result that was returned by reference (once per result)."""
+        kind = self._referenced.pop(file_id, None)
+        if kind:
+            self._inline_stats[kind]["fetched"] += 1
+
+    def _truncate_result(self, result: dict, source: str = "unknown", kind: Optional[str] = None) -> dict:
         """
         Store ALL tool results and return appropriately sized response.
 
         Strategy:
         - Always store the result in file store (with deduplication)
-        - If < INLINE_THRESHOLD (50K): return full content + file_id reference
-        - If >= INLINE_THRESHOLD: return only the file store reference
+        - If within the inline threshold: return full content + file_id reference
+        - Otherwise: return only the file store reference, with a preview
+        - Near-duplicates of a result still verbatim in context: return the diff against it instead
+
+        The threshold adapts to the remaining context for results with a kind
+        (see _inline_threshold); without one it is FileStore.INLINE_THRESHOLD.
 
         This enables historical compression - older results can be replaced
         with just the reference since they're stored.
@@ -1398,6 +4324,7 @@ Original task: {original_task}"""
         Args:
             result: The tool result dict
             source: Description of the source (tool name)
+            kind: Result kind for the adaptive threshold (see _result_kind)
         """
         # Skip if already a file store reference
         if result.get("stored_in_file_store"):
@@ -1421,33 +4348,174 @@ Original task: {original_task}"""
         store_info = self.file_store.store(content, source, content_type)
         file_id = store_info["file_id"]
 
-        # Check threshold - use FileStore's INLINE_THRESHOLD
-        threshold = FileStore.INLINE_THRESHOLD
+        # Near-duplicate of a result the model still has verbatim - the diff is all that is new.
+        # If the base has been compacted, packed or dropped since, fall through and return the
+        # content as usual (the delta stays the storage format).
+        if store_info.get("near_duplicate_of") and self._result_in_context(store_info["near_duplicate_of"]):
+            base_id, pct = store_info["near_duplicate_of"], int(store_info["similarity"] * 100)
+            return {
+                "stored_in_file_store": True,
+                "file_id": file_id,
+                "size_bytes": store_info["size_bytes"],
+                "lines": store_info["lines"],
+                "source": source,
+                "near_duplicate_of": base_id,
+                "similarity": store_info["similarity"],
+                "diff": store_info["diff"],
+                "message": (
+                    f"This is {pct}% identical to file_id {base_id}; diff above. "
+                    f"Full content via read_from_store(file_id='{file_id}')."
+                ),
+            }
+
+        # Adaptive threshold for known result kinds, FileStore's fixed one otherwise
+        if kind:
+            threshold, why = self._inline_threshold(kind)
+        else:
+            threshold, why = FileStore.INLINE_THRESHOLD, "fixed"
+        inline = result_size <= threshold
+        logger.info(f"📏 inline-decision kind={kind or source} size={result_size:,} threshold={threshold:,} {why} -> {'inline' if inline else 'reference'}")
 
-        if result_size <= threshold:
+        if inline:
             # Small enough - return full content with file_id for reference
             result["_file_store_ref"] = {
                 "file_id": file_id,
                 "size_bytes": store_info["size_bytes"],
                 "lines": store_info["lines"],
             }
-            return result
-
-        # Too large - return only reference
-        logger.info(f"📦 Result too large ({result_size:,} chars > {threshold:,}), returning file store reference...")
-
-        return {
-            "stored_in_file_store": True,
-            "file_id": file_id,
-            "size_bytes": store_info["size_bytes"],
-            "lines": store_info["lines"],
-            "source": source,
-            "message": (
-                f"Result ({store_info['size_bytes']:,} bytes, {store_info['lines']:,} lines) "
-                f"stored in file store. Use read_from_store(file_id='{file_id}') to read. "
-                f"You can specify offset and limit to read in chunks."
-            ),
-        }
+            self._context_chars += result_size  # Later results this turn see the reduced headroom
+            return result
+
+        # Too large - return only reference
+        if kind:
+            self._inline_stats.setdefault(kind, {"referenced": 0, "fetched": 0})["referenced"] += 1
+            self._referenced[file_id] = kind
+
+        return {
+            "stored_in_file_store": True,
+            "file_id": file_id,
+            "size_bytes": store_info["size_bytes"],
+            "lines": store_info["lines"],
+            "source": source,
+            "preview": store_info.get("preview") or FileStore.build_preview(content, content_type),
+            "message": (
+                f"Result ({store_info['size_bytes']:,} bytes, {store_info['lines']:,} lines) "
+                f"stored in file store; its structure is in preview. Use read_from_store(file_id='{file_id}') "
+                f"with offset and limit to read only the part you need."
+            ),
+        }
+
+    def _result_in_context(self, file_id: str) -> bool:
+        """Whether a stored result is still in the message history verbatim (inlined, not compacted or packed)."""
+        needle = json.dumps({"_file_store_ref": {"file_id": file_id}})[1:-2]  # '"_file_store_ref": {"file_id": "<id>"'
+        for msg in reversed(self.messages):
+            if msg.get("role") != "user" or not isinstance(msg.get("content"), list):
+                continue
+            for item in msg["content"]:
+                if isinstance(item, dict) and item.get("type") == "tool_result" and isinstance(item.get("content"), str) and needle in item["content"]:
+                    return True
+        return False
+
+    RAW_OPTION = {
+        "type": "boolean",
+        "description": "Return the unshaped result (full Confluence storage HTML, every REST field). Only when the shaped result lacks something you need.",
+    }
+
+    def _with_raw_option(self, tool: dict) -> dict:
+        """Copy of an MCP tool definition with the agent-side raw argument added to its schema."""
+        schema = tool.get("input_schema") or {}
+        return {**tool, "input_schema": {**schema, "type": "object", "properties": {**schema.get("properties", {}), "raw": self.RAW_OPTION}}}
+
+    def _shape_result(self, tool_name: str, result: dict) -> dict:
+        """
+        Run an MCP result through the ResultShaper. The raw result is not kept:
+        the model repeats the call with raw=true when it needs it, which the
+        MCP response cache usually answers without a request.
+        """
+        if not self.config.shape_results or not result.get("success"):
+            return result
+        try:
+            shaped = self.result_shaper.shape(tool_name, result)
+        except Exception as e:
+            logger.warning(f"Result shaping failed for {tool_name}: {e}")
+            return result
+        if shaped is None:
+            return result
+
+        shaped["shaped"] = "Compacted for context; repeat the call with raw=true for the unshaped result"
+        raw_size, size = len(json.dumps(result["result"])), len(json.dumps(shaped["result"]))
+        logger.info(f"✂️  Shaped {tool_name} result: {raw_size:,} -> {size:,} chars")
+        return shaped
+
+    def _tool_result_metadata(self, result: dict, content: str) -> dict:
+        """Capture what history compression needs from a tool result, so it never re-parses it."""
+        return {
+            "file_ref": result.get("_file_store_ref"),
+            "stored": bool(result.get("stored_in_file_store")),
+            "size": len(content),
+            "compacted": False,
+        }
+
+    def _parse_tool_result_metadata(self, item: dict) -> dict:
+        """Fallback for tool results created outside run_task: parse the content once."""
+        result_content = item.get("content", "{}")
+        try:
+            result_data = json.loads(result_content) if isinstance(result_content, str) else result_content
+            meta = self._tool_result_metadata(result_data, result_content if isinstance(result_content, str) else json.dumps(result_content))
+        except (json.JSONDecodeError, TypeError, AttributeError):
+            # Keep original if we can't parse
+            meta = {"file_ref": None, "stored": False, "size": 0, "compacted": True}
+        self._tool_result_meta[item.get("tool_use_id", "")] = meta
+        return meta
+
+    def _sync_history_positions(self):
+        """Scan only messages appended since the last call for tool result messages."""
+        if self.messages is not self._history_ref or len(self.messages) < self._history_scanned:
+            # History was replaced (soft reset, new iteration) - start over
+            self._history_ref = self.messages
+            self._history_scanned = 0
+            self._tool_result_positions = []
+            self._compression_watermark = 0
+            self.context_packer.forget()
+
+        for i in range(self._history_scanned, len(self.messages)):
+            msg = self.messages[i]
+            content = msg.get("content", [])
+            if msg.get("role") == "user" and isinstance(content, list):
+                if any(isinstance(item, dict) and item.get("type") == "tool_result" for item in content):
+                    self._tool_result_positions.append(i)
+        self._history_scanned = len(self.messages)
+
+    def _compact_tool_result(self, item: dict) -> bool:
+        """Replace one tool result's content with a file store reference. Returns True if compacted."""
+        meta = self._tool_result_meta.get(item.get("tool_use_id", ""))
+        if meta is None:
+            meta = self._parse_tool_result_metadata(item)
+        if meta["compacted"]:
+            return False
+        meta["compacted"] = True
+
+        file_ref = meta["file_ref"]
+        if file_ref:
+            # Replace with compact reference
+            store_info = file_ref
+        elif meta["stored"] or meta["size"] <= 1000:
+            # Already a reference, or small enough to keep as is
+            return False
+        else:
+            # No file store ref but large - store it now for future reference
+            store_info = self.file_store.store(item.get("content", ""), "historical_compression", "json")
+
+        item["content"] = json.dumps(
+            {
+                "stored_in_file_store": True,
+                "file_id": store_info["file_id"],
+                "size_bytes": store_info["size_bytes"],
+                "lines": store_info["lines"],
+                "note": "Historical result - use read_from_store if needed",
+            }
+        )
+        return True
 
     def _compress_historical_messages(self, keep_recent: int = 2) -> None:
         """
@@ -1457,84 +4525,186 @@ Original task: {original_task}"""
         since the LLM has already processed this data and can retrieve it
         if needed.
 
+        Work is incremental: new messages are scanned once, a watermark records
+        which tool result messages are already compacted, and the metadata
+        captured when each result was created avoids re-parsing its JSON. Only
+        results that aged out since the last call are touched.
+
         Args:
             keep_recent: Number of recent tool result messages to keep full
         """
-        # Find all user messages with tool_result content
-        tool_result_indices = []
-        for i, msg in enumerate(self.messages):
-            if msg.get("role") == "user":
-                content = msg.get("content", [])
-                if isinstance(content, list):
-                    for item in content:
-                        if isinstance(item, dict) and item.get("type") == "tool_result":
-                            tool_result_indices.append(i)
-                            break
+        self._sync_history_positions()
 
         # Keep the most recent ones full, compress the rest
-        if len(tool_result_indices) <= keep_recent:
-            return  # Nothing to compress
+        end = len(self._tool_result_positions) - keep_recent
+        if end <= self._compression_watermark:
+            return  # Nothing newly aged out
 
-        indices_to_compress = tool_result_indices[:-keep_recent]
         compressed_count = 0
+        for msg_idx in self._tool_result_positions[self._compression_watermark : end]:
+            for item in self.messages[msg_idx].get("content", []):
+                if isinstance(item, dict) and item.get("type") == "tool_result" and self._compact_tool_result(item):
+                    compressed_count += 1
+        self._compression_watermark = end
 
-        for msg_idx in indices_to_compress:
-            msg = self.messages[msg_idx]
-            content = msg.get("content", [])
+        if compressed_count > 0:
+            logger.info(f"📦 Compressed {compressed_count} historical tool results")
 
-            if not isinstance(content, list):
-                continue
+    def _pack_context(self, keep_recent: int = 3) -> None:
+        """
+        Fit the history to config.context_token_budget with the ContextPacker.
 
-            new_content = []
-            for item in content:
-                if isinstance(item, dict) and item.get("type") == "tool_result":
-                    # Parse the tool result content
-                    try:
-                        result_content = item.get("content", "{}")
-                        if isinstance(result_content, str):
-                            result_data = json.loads(result_content)
-                        else:
-                            result_data = result_content
-
-                        # Check if it has a file store reference
-                        file_ref = result_data.get("_file_store_ref")
-                        if file_ref:
-                            # Replace with compact reference
-                            compact = {
-                                "stored_in_file_store": True,
-                                "file_id": file_ref["file_id"],
-                                "size_bytes": file_ref["size_bytes"],
-                                "lines": file_ref["lines"],
-                                "note": "Historical result - use read_from_store if needed",
-                            }
-                            item["content"] = json.dumps(compact)
-                            compressed_count += 1
-                        elif result_data.get("stored_in_file_store"):
-                            # Already a reference, keep as is
-                            pass
-                        else:
-                            # No file store ref - check if content is large
-                            if len(result_content) > 1000:
-                                # Store it now for future reference
-                                store_info = self.file_store.store(result_content, "historical_compression", "json")
-                                compact = {
-                                    "stored_in_file_store": True,
-                                    "file_id": store_info["file_id"],
-                                    "size_bytes": store_info["size_bytes"],
-                                    "lines": store_info["lines"],
-                                    "note": "Historical result - use read_from_store if needed",
-                                }
-                                item["content"] = json.dumps(compact)
-                                compressed_count += 1
-                    except (json.JSONDecodeError, TypeError):
-                        pass  # Keep original if we can't parse
-
-                new_content.append(item)
-
-            msg["content"] = new_content
+        The last keep_recent tool result messages stay verbatim; older results
+        and write_file inputs are kept verbatim, summarized or replaced by
+        store references according to their relevance score.
+        """
+        self._sync_history_positions()
+        if not self.context_packer.units:
+            self._context_chars = self.bedrock.estimate_context_size(self.messages, self._get_system_prompt(), self.tools)
+            return
+
+        pinned: set[str] = set()
+        for msg_idx in self._tool_result_positions[-keep_recent:] if keep_recent else []:
+            for item in self.messages[msg_idx].get("content", []):
+                if isinstance(item, dict) and item.get("tool_use_id"):
+                    pinned.add(item["tool_use_id"])
+
+        context_chars = self.bedrock.estimate_context_size(self.messages, self._get_system_prompt(), self.tools)
+        budget_chars = self.config.context_token_budget * 4  # ~4 chars per token
+        stats = self.context_packer.pack(self._turn, context_chars, budget_chars, self._files_written, pinned)
+        self._context_chars = context_chars + stats["chars_delta"]
+        if stats["changed"]:
+            logger.info(
+                f"🧮 Packed context (budget ~{self.config.context_token_budget:,} tokens): "
+                f"{stats['verbatim']} verbatim, {stats['summary']} summarized, {stats['reference']} referenced ({stats['changed']} changed)"
+            )
 
-        if compressed_count > 0:
-            logger.info(f"📦 Compressed {compressed_count} historical tool results")
+    def _drop_history(self, start: int, count: int) -> list[dict]:
+        """Remove messages[start:start+count] in place, keeping compression and packing state aligned."""
+        self._sync_history_positions()
+        removed = self.messages[start : start + count]
+        del self.messages[start : start + count]
+
+        positions, dropped_compacted = [], 0
+        for n, pos in enumerate(self._tool_result_positions):
+            if start <= pos < start + count:
+                dropped_compacted += n < self._compression_watermark
+            else:
+                positions.append(pos - count if pos >= start + count else pos)
+        self._tool_result_positions = positions
+        self._compression_watermark -= dropped_compacted
+        self._history_scanned -= count
+
+        if self.messages is self._transcript_ref:
+            if start + count <= self._transcript_len:
+                self._transcript_drops.append([start, count])
+                self._transcript_len -= count
+            else:
+                self._transcript_ref = None  # Unpersisted messages dropped - snapshot instead
+
+        keys = set()
+        for msg in removed:
+            for block in msg.get("content", []) if isinstance(msg.get("content"), list) else []:
+                if isinstance(block, dict):
+                    key = block.get("tool_use_id") or block.get("id")
+                    if key:
+                        keys.update((key, f"{key}:input"))
+        self.context_packer.discard(keys)
+        self.shell.forget_results(keys)  # "Unchanged since turn N" must not point at a dropped turn
+        return removed
+
+    def _schedule_rolling_summary(self):
+        """
+        Start a background summary when the fitted context is near budget.
+
+        The oldest complete turns beyond the summary_keep_turns window are
+        rendered to text and summarized on the small model in a worker thread;
+        once enough turn notes pile up they are folded into a phase summary.
+        """
+        if self._summary_task is not None:
+            return
+
+        if len(self.summarizer.turn_notes) > RollingSummarizer.PHASE_SIZE:
+            notes = self.summarizer.turn_notes[: RollingSummarizer.PHASE_SIZE]
+            self._summary_job = {"kind": "phase", "notes": len(notes)}
+            self._summary_task = asyncio.ensure_future(asyncio.to_thread(self.summarizer.fold_phase, notes))
+            return
+
+        if self._context_chars < self.config.context_token_budget * 4 * 0.9:
+            return  # Still comfortably inside the budget - keep full detail
+
+        # Complete turns are (assistant, user tool_result) pairs after the first message
+        turns = []
+        i = 1
+        while i + 1 < len(self.messages) and self.messages[i].get("role") == "assistant" and self.messages[i + 1].get("role") == "user":
+            turns.append((self.messages[i], self.messages[i + 1]))
+            i += 2
+        foldable = len(turns) - self.config.summary_keep_turns
+        if foldable < 1 or not isinstance(self.messages[0].get("content"), str):
+            return
+
+        chunk = turns[: min(foldable, RollingSummarizer.FOLD_TURNS)]
+        transcript, fallbacks = self.summarizer.render_transcript(chunk)
+        self._summary_job = {"kind": "turns", "messages": [m for pair in chunk for m in pair]}
+        self._summary_task = asyncio.ensure_future(asyncio.to_thread(self.summarizer.summarize_turns, transcript, fallbacks))
+        logger.info(f"🗜️  Summarizing {len(chunk)} aged-out turns in the background")
+
+    def _apply_rolling_summary(self):
+        """Fold a finished background summary into the history head."""
+        if self._summary_task is None or not self._summary_task.done():
+            return
+        task, job = self._summary_task, self._summary_job
+        self._summary_task = self._summary_job = None
+        try:
+            output = task.result()
+        except Exception as e:
+            logger.warning(f"Rolling summary failed: {e}")
+            return
+
+        if job["kind"] == "phase":
+            self.summarizer.phases.append(output)
+            del self.summarizer.turn_notes[: job["notes"]]
+        else:
+            # Only fold if the summarized turns are still where we left them
+            messages = job["messages"]
+            current = self.messages[1 : 1 + len(messages)]
+            if len(current) != len(messages) or any(a is not b for a, b in zip(current, messages)):
+                return
+            self._drop_history(1, len(messages))
+            self.summarizer.turn_notes.extend(output)
+            self.summarizer.turns_folded += len(messages) // 2
+            logger.info(f"🗜️  Folded {len(messages) // 2} turns into the running summary ({self.summarizer.turns_folded} total)")
+
+        head = self.messages[0]
+        if head is not self._summary_anchor:
+            self._summary_anchor, self._summary_base = head, head["content"]
+        head["content"] = f"{self._summary_base}\n\n{self.summarizer.render()}"
+
+    def _cancel_rolling_summary(self):
+        """Drop any in-flight summary and the running summary itself (new task)."""
+        if self._summary_task is not None:
+            self._summary_task.cancel()
+        self._summary_task = self._summary_job = None
+        self._summary_anchor = None
+        self.summarizer.reset()
+
+    async def _verify_research(self, topic: str):
+        """Read the current version of the cached sources for a topic not yet seen this run."""
+        pending = [ResearchCache.check_call(source) for source in self.research_cache.pending_checks(topic)]
+        pending = [(name, arguments) for name, arguments in pending if name in self.mcp.tools]
+        if not pending:
+            return
+
+        async def check(name: str, arguments: dict):
+            try:
+                result = await self.mcp.call_tool(name, arguments)
+            except Exception as e:
+                logger.warning(f"Could not re-check research source ({name} {arguments}): {e}")
+                return
+            self.research_cache.observe(name, arguments, result)
+
+        logger.info(f"🧠 recall '{topic}': re-checking {len(pending)} source(s)")
+        await asyncio.gather(*(check(name, arguments) for name, arguments in pending))
 
     def _format_mcp_call_details(self, tool_name: str, tool_input: dict) -> str:
         """Format MCP tool call details for human-readable logging."""
@@ -1601,28 +4771,52 @@ Original task: {original_task}"""
         tool_name = tool_use["name"]
         tool_input = tool_use.get("input", {})
 
-        # Handle shell tools
+        # Handle shell tools (commands run as asyncio subprocesses, blocking file
+        # I/O in a worker thread, so independent calls in the same turn can overlap)
         if tool_name == "bash":
             cmd = tool_input.get("command", "")
             desc = tool_input.get("description", "")
             logger.info(f"🔧 bash: {desc or cmd[:80]}")
-            result = self.shell.execute(cmd, desc)
+            result = await self.shell.execute_async(cmd, desc)
 
         elif tool_name == "read_file":
             path = tool_input.get("path", "")
             logger.info(f"📖 read_file: {path}")
-            result = self.shell.read_file(path)
+            ranges = {key: int(tool_input[key]) for key in self.READ_RANGE_KEYS if tool_input.get(key) is not None}
+            result = await asyncio.to_thread(self.shell.read_file, path, bool(tool_input.get("force", False)), **ranges)
 
         elif tool_name == "write_file":
             path = tool_input.get("path", "")
             content_len = len(tool_input.get("content", ""))
             logger.info(f"📝 write_file: {path} ({content_len} chars)")
-            result = self.shell.write_file(path, tool_input.get("content", ""))
+            result = await asyncio.to_thread(self.shell.write_file, path, tool_input.get("content", ""))
+
+        elif tool_name == "write_files":
+            files = tool_input.get("files") or []
+            logger.info(f"📝 write_files: {len(files)} files ({sum(len(f.get('content', '')) for f in files if isinstance(f, dict))} chars)")
+            result = await asyncio.to_thread(self.shell.write_files, files)
+
+        elif tool_name == "edit_file":
+            path = tool_input.get("path", "")
+            logger.info(f"✏️  edit_file: {path} ({len(tool_input.get('edits') or [])} edits{', patch' if tool_input.get('patch') else ''})")
+            result = await asyncio.to_thread(self.shell.edit_file, path, tool_input.get("edits"), tool_input.get("patch"))
 
         elif tool_name == "list_directory":
             path = tool_input.get("path", ".")
             logger.info(f"📁 list_directory: {path}")
-            result = self.shell.list_directory(path)
+            options = {key: tool_input[key] for key in self.LIST_OPTION_KEYS if tool_input.get(key) is not None}
+            result = await asyncio.to_thread(self.shell.list_directory, path, bool(tool_input.get("force", False)), **options)
+
+        elif tool_name == "find_docs":
+            logger.info(f"📚 find_docs: {tool_input.get('query') or tool_input.get('path') or '(all)'}")
+            result = await asyncio.to_thread(self.shell.find_docs, tool_input.get("query"), tool_input.get("path"), int(tool_input.get("max_results", 10)))
+
+        elif tool_name == "search_workspace":
+            pattern = tool_input.get("pattern", "")
+            logger.info(f"🔎 search_workspace: {pattern!r} {tool_input.get('glob') or ''}")
+            result = await asyncio.to_thread(
+                self.shell.search_workspace, pattern, tool_input.get("glob"), int(tool_input.get("max_results", 30)), int(tool_input.get("context_lines", 0))
+            )
 
         # Handle file store tools
         elif tool_name == "read_from_store":
@@ -1630,18 +4824,32 @@ Original task: {original_task}"""
             offset = tool_input.get("offset", 0)
             limit = tool_input.get("limit", 50)  # Default to 50 lines (smaller chunks)
             logger.info(f"📦 read_from_store: {file_id} (offset={offset}, limit={limit})")
-            result = self.file_store.read(file_id, offset, limit)
+            self._note_store_read(file_id)
+            result = await asyncio.to_thread(self.file_store.read, file_id, offset, limit)
 
         elif tool_name == "list_store_files":
             logger.info(f"📦 list_store_files")
             result = self.file_store.list_files()
 
+        # Handle research cache tools
+        elif tool_name == "recall":
+            if tool_input.get("topic"):
+                await self._verify_research(tool_input["topic"])
+            result = self.research_cache.recall(tool_input.get("topic"))
+
+        elif tool_name == "remember":
+            topic = tool_input.get("topic", "")
+            logger.info(f"🧠 remember: {topic} ({len(tool_input.get('facts') or [])} facts)")
+            result = self.research_cache.remember(topic, tool_input.get("facts") or [], tool_input.get("sources") or [], bool(tool_input.get("replace", False)))
+
         # Handle MCP tools
         elif tool_name.startswith("mcp_"):
             mcp_tool_name = tool_name[4:]  # Remove "mcp_" prefix
-            details = self._format_mcp_call_details(mcp_tool_name, tool_input)
+            arguments = {key: value for key, value in tool_input.items() if key != "raw"}  # raw is ours, not the server's
+            details = self._format_mcp_call_details(mcp_tool_name, arguments)
             logger.info(f"🌐 mcp_{mcp_tool_name}: {details}")
-            result = await self.mcp.call_tool(mcp_tool_name, tool_input)
+            result = await self.mcp.call_tool(mcp_tool_name, arguments)
+            self.research_cache.observe(mcp_tool_name, arguments, result)
 
         else:
             logger.warning(f"❓ Unknown tool: {tool_name}")
@@ -1649,6 +4857,92 @@ Original task: {original_task}"""
 
         return result
 
+    # Resource key for tools that may touch anything in the workspace
+    WORKSPACE_KEY = "*"
+    # Resource key shared by MCP calls that may have side effects (run in order)
+    MCP_WRITE_KEY = "mcp:write"
+
+    def _tool_resource_keys(self, tool_name: str, tool_input: dict) -> frozenset[str]:
+        """
+        Return the workspace resources a tool call touches, for ordering.
+
+        Calls with overlapping keys run in their original order; calls with no
+        keys (read-only MCP, file store) are independent of everything.
+        """
+        if tool_name == "bash":
+            return frozenset([self.WORKSPACE_KEY])
+        if tool_name in ("read_file", "write_file", "edit_file", "list_directory"):
+            resolved, _ = self.shell._resolve_safe_path(tool_input.get("path", "."))
+            return frozenset([str(resolved)])
+        if tool_name in ("search_workspace", "find_docs"):
+            return frozenset([str(self.shell.work_dir)])
+        if tool_name == "write_files":
+            return frozenset(str(self.shell._resolve_safe_path(f.get("path", "."))[0]) for f in tool_input.get("files") or [] if isinstance(f, dict))
+        if tool_name.startswith("mcp_") and not self.mcp.is_read_only(tool_name[4:], tool_input):
+            return frozenset([self.MCP_WRITE_KEY])
+        return frozenset()
+
+    def _resources_conflict(self, a: frozenset[str], b: frozenset[str]) -> bool:
+        """Check whether two key sets overlap (same path, or one path contains the other)."""
+        if not a or not b:
+            return False
+        if self.WORKSPACE_KEY in a or self.WORKSPACE_KEY in b:
+            return True
+        if self.MCP_WRITE_KEY in a or self.MCP_WRITE_KEY in b:
+            return self.MCP_WRITE_KEY in a and self.MCP_WRITE_KEY in b
+        for x in a:
+            for y in b:
+                if x == y or x.startswith(y.rstrip("/") + "/") or y.startswith(x.rstrip("/") + "/"):
+                    return True
+        return False
+
+    async def _execute_tool_calls(self, blocks: list[dict]) -> list[dict]:
+        """
+        Execute the tool_use blocks of one response concurrently.
+
+        Independent calls run in parallel (up to config.max_parallel_tools);
+        calls that touch the same path, any call after a bash command, and MCP
+        calls with side effects wait for the earlier conflicting calls to
+        finish. Results are returned in the original block order; a call that
+        raises gets an error result, so every tool_use still gets its
+        tool_result.
+        """
+        if len(blocks) <= 1:
+            return [await self._run_tool_safely(block) for block in blocks]
+
+        limit = max(1, self.config.max_parallel_tools)
+        logger.info(f"⚡ Executing {len(blocks)} tool calls (max {limit} concurrent)")
+        semaphore = asyncio.Semaphore(limit)
+        scheduled: list[tuple[frozenset[str], asyncio.Task]] = []
+
+        async def run_after(block: dict, deps: list[asyncio.Task]) -> dict:
+            if deps:
+                await asyncio.wait(deps)
+            async with semaphore:
+                return await self._run_tool_safely(block)
+
+        for block in blocks:
+            keys = self._tool_resource_keys(block.get("name", ""), block.get("input", {}))
+            deps = [task for other, task in scheduled if self._resources_conflict(keys, other)]
+            scheduled.append((keys, asyncio.ensure_future(run_after(block, deps))))
+
+        results = await asyncio.gather(*(task for _, task in scheduled), return_exceptions=True)
+        return [self._tool_error(block, r) if isinstance(r, BaseException) else r for block, r in zip(blocks, results)]
+
+    async def _run_tool_safely(self, block: dict) -> dict:
+        """Run one tool call, turning an exception into an error result."""
+        try:
+            return await self._handle_tool_use(block)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            return self._tool_error(block, e)
+
+    @staticmethod
+    def _tool_error(block: dict, error: BaseException) -> dict:
+        logger.error(f"❌ Tool {block.get('name', '')} raised: {error!r}")
+        return {"success": False, "error": f"{type(error).__name__}: {error}"}
+
     async def run_task(self, task: str) -> str:
         """
         Run a documentation task.
@@ -1666,14 +4960,27 @@ Original task: {original_task}"""
             - Too many consecutive errors
 
         Continuation:
-            - If a previous run was interrupted, automatically resumes from there
-            - On interruption, generates and saves a continuation prompt for next run
+            - Every turn is appended to a session transcript in the file store
+            - If a previous run of the same task was interrupted, resumes exactly
+              where it stopped from the transcript
         """
-        # Check for continuation from previous interrupted run
-        continuation = self._check_continuation()
+        # Reset tracking for new task
+        self.loop_detector.reset()
+        self._consecutive_errors = 0
+        self._cancel_rolling_summary()
+        self.shell.reset_memo()
+
+        # Check for an interrupted run of this task (or a legacy continuation file)
+        self.transcript = SessionTranscript(self.file_store.store_path, task)
+        session = self.transcript.load()
+        continuation = None if session else self._check_continuation()
         original_task = task  # Keep original for logging
+        turns_before = soft_resets = 0
 
-        if continuation:
+        if session:
+            original_task, turns_before, soft_resets = self._resume_session(session)
+            original_task = original_task or task
+        elif continuation:
             # Use continuation prompt instead of original task
             continuation_prompt = continuation.get("continuation_prompt", "")
             if continuation_prompt:
@@ -1694,27 +5001,40 @@ If the task appears to be complete based on the progress summary, verify this an
 """
                 # Pre-populate files written from previous run
                 self._files_written = set(continuation.get("files_written", []))
-
-        logger.info(f"Starting task: {task[:100]}...")
-
-        # Reset tracking for new task (but keep files_written if continuing)
-        self._tool_call_history = []
-        self._consecutive_errors = 0
-        if not continuation:
+        else:
             self._files_written = set()
 
-        # Add user message
-        self.messages.append({"role": "user", "content": task})
+        if not session:
+            logger.info(f"Starting task: {task[:100]}...")
+            self.messages.append({"role": "user", "content": task})
+            self._checkpoint(original_task, turns_before, soft_resets)
 
         turns = 0
-        soft_resets = 0
         max_soft_resets = 3  # Limit soft resets to prevent infinite loops
 
         while turns < self.config.max_turns:
             turns += 1
+            self._turn = turns
+            self.shell.current_turn = turns
             logger.info(f"Turn {turns}/{self.config.max_turns}")
 
-            # Check if context is getting too large and needs a soft reset
+            # Fold any finished background summary of aged-out turns
+            if self.config.rolling_summary:
+                self._apply_rolling_summary()
+
+            # Fit history to the context budget: relevance-ranked packing, or
+            # plain compression of aged-out tool results
+            if self.config.context_packing:
+                self._pack_context(keep_recent=3)
+            else:
+                self._compress_historical_messages(keep_recent=3)
+                self._context_chars = self.bedrock.estimate_context_size(self.messages, self._get_system_prompt(), self.tools)
+
+            # Summarize the oldest turns in the background when nearing the budget
+            if self.config.rolling_summary:
+                self._schedule_rolling_summary()
+
+            # Check if context is still too large and needs a soft reset
             if soft_resets < max_soft_resets and self._should_soft_reset():
                 soft_resets += 1
                 logger.warning(f"⚠️ Context size threshold reached - performing soft reset ({soft_resets}/{max_soft_resets})")
@@ -1723,6 +5043,7 @@ If the task appears to be complete based on the progress summary, verify this an
                 continuation_prompt = self._perform_soft_reset(original_task, turns)
 
                 # Clear messages and start fresh with continuation
+                self.shell.reset_memo()
                 self.messages = [
                     {
                         "role": "user",
@@ -1737,19 +5058,29 @@ Please continue from where you left off. Files in the file store are still acces
                     }
                 ]
 
+                # Carry the running summary of earlier turns into the fresh context
+                if self._summary_task is not None:
+                    self._summary_task.cancel()
+                    self._summary_task = self._summary_job = None
+                self._summary_anchor, self._summary_base = self.messages[0], self.messages[0]["content"]
+                if self.summarizer.render():
+                    self.messages[0]["content"] = f"{self._summary_base}\n\n{self.summarizer.render()}"
+
                 logger.info(f"🔄 Soft reset complete - context cleared, continuing with {len(continuation_prompt)} char summary")
                 print(f"\n✅ Soft reset complete - continuing with fresh context\n")
 
-            # Compress historical tool results to save context space
-            self._compress_historical_messages(keep_recent=3)
-
             try:
-                # Get Claude's response
-                response = self.bedrock.create_message(
+                # Get Claude's response (in a worker thread so other agents and
+                # background summaries keep running)
+                response = await asyncio.to_thread(
+                    self.bedrock.create_message,
                     messages=self.messages,
                     system=self._get_system_prompt(),
                     tools=self.tools,
                 )
+                self.usage["requests"] += 1
+                for key in ("input_tokens", "output_tokens"):
+                    self.usage[key] += response.get("usage", {}).get(key, 0)
 
                 # Reset error counter on successful API call
                 self._consecutive_errors = 0
@@ -1762,8 +5093,6 @@ Please continue from where you left off. Files in the file store are still acces
                     return f"Task aborted: {self.MAX_CONSECUTIVE_ERRORS} consecutive API errors. Last error: {e}"
 
                 # Wait before retrying
-                import asyncio
-
                 await asyncio.sleep(2**self._consecutive_errors)  # Exponential backoff
                 continue
 
@@ -1773,6 +5102,7 @@ Please continue from where you left off. Files in the file store are still acces
 
             # Add assistant response to history
             self.messages.append({"role": "assistant", "content": content})
+            self.context_packer.note_turn(turns, content)
 
             # Extract and display text from response (Claude's thinking/reasoning)
             response_text = ""
@@ -1800,7 +5130,8 @@ Please continue from where you left off. Files in the file store are still acces
             if stop_reason == "end_turn":
                 logger.info("✅ Task completed (end_turn)")
 
-                # Clear continuation file on successful completion
+                # Clear the transcript (and any legacy continuation file) on successful completion
+                self.transcript.clear()
                 self._clear_continuation()
 
                 # Print summary if files were created
@@ -1815,49 +5146,82 @@ Please continue from where you left off. Files in the file store are still acces
             if stop_reason == "tool_use":
                 tool_calls_this_turn = []
                 tool_results = []
+                store_refs = []
                 tool_errors = 0
 
-                for block in content:
-                    if block.get("type") == "tool_use":
-                        tool_id = block.get("id")
-                        tool_name = block.get("name", "")
-                        tool_input = block.get("input", {})
-
-                        # Track tool call for loop detection
-                        tool_calls_this_turn.append((tool_name, tool_input))
-
-                        # Execute tool
-                        result = await self._handle_tool_use(block)
-
-                        # Track file writes
-                        if tool_name == "write_file" and result.get("success"):
-                            self._files_written.add(tool_input.get("path", "unknown"))
-
-                        # Count errors
-                        if not result.get("success", True) or result.get("error"):
-                            tool_errors += 1
-
-                        # Store large results in file store to prevent context overflow
-                        # (but don't re-store results from file store reads)
-                        if tool_name not in ("read_from_store", "list_store_files"):
-                            result = self._truncate_result(result, source=tool_name)
-
-                        tool_results.append({"type": "tool_result", "tool_use_id": tool_id, "content": json.dumps(result)})
+                # Execute tools (independent calls concurrently, results in original order)
+                tool_blocks = [block for block in content if block.get("type") == "tool_use"]
+                results = await self._execute_tool_calls(tool_blocks)
+
+                for block, result in zip(tool_blocks, results):
+                    tool_id = block.get("id")
+                    tool_name = block.get("name", "")
+                    tool_input = block.get("input", {})
+
+                    # Track tool call for loop detection
+                    tool_calls_this_turn.append((tool_name, tool_input, result))
+
+                    # Track file writes
+                    if tool_name in ("write_file", "edit_file") and result.get("success"):
+                        self._files_written.add(tool_input.get("path", "unknown"))
+                    elif tool_name == "write_files" and result.get("success"):
+                        self._files_written.update(f.get("path", "unknown") for f in tool_input.get("files", []))
+
+                    # Count errors
+                    if not result.get("success", True) or result.get("error"):
+                        tool_errors += 1
+
+                    # Compact MCP payloads (Confluence HTML, REST boilerplate, GitHub trees) unless asked for raw
+                    raw = tool_name.startswith("mcp_") and bool(tool_input.get("raw"))
+                    if tool_name.startswith("mcp_") and not raw:
+                        result = self._shape_result(tool_name, result)
+
+                    # Store large results in file store to prevent context overflow
+                    # (but don't re-store results from file store reads)
+                    if tool_name not in ("read_from_store", "list_store_files"):
+                        source = f"{tool_name} (raw)" if raw else tool_name
+                        result = self._truncate_result(result, source=source, kind=self._result_kind(tool_name, tool_input))
+
+                    # Let the shell memo point repeat reads at this stored result
+                    if tool_name == "read_file":
+                        plain = all(tool_input.get(key) is None for key in self.READ_RANGE_KEYS)
+                    else:
+                        plain = all(tool_input.get(key) in (None, default) for key, default in self.LIST_OPTION_KEYS.items()) and not result.get("next_cursor")
+                    if tool_name in ("read_file", "list_directory") and result.get("success", True) and not result.get("unchanged") and plain:
+                        file_id = (result.get("_file_store_ref") or result).get("file_id")
+                        if file_id:
+                            self.shell.remember_result(tool_name, tool_input.get("path", "."), file_id, tool_id)
+
+                    result_content = json.dumps(result)
+                    self._tool_result_meta[tool_id] = self._tool_result_metadata(result, result_content)
+                    tool_result = {"type": "tool_result", "tool_use_id": tool_id, "content": result_content}
+                    tool_results.append(tool_result)
+
+                    # Register with the context packer (results need a store copy to be downgradable)
+                    store_ref = result.get("_file_store_ref")
+                    if store_ref is None and not result.get("stored_in_file_store") and len(result_content) >= ContextPacker.MIN_PACKABLE_CHARS:
+                        store_ref = self.file_store.store(result_content, tool_name, "json")
+                    if (store_ref or result).get("file_id"):
+                        store_refs.append((store_ref or result)["file_id"])
+                    if store_ref:
+                        self.context_packer.add_tool_result(tool_id, turns, tool_name, tool_input, tool_result, result, store_ref)
+                    if tool_name in ("write_file", "write_files") and result.get("success"):
+                        self.context_packer.add_write_input(tool_id, turns, block)
+
+                # Add tool results to messages and persist the completed turn
+                self.messages.append({"role": "user", "content": tool_results})
+                self._checkpoint(original_task, turns_before + turns, soft_resets, tool_calls_this_turn, store_refs)
 
                 # Check for loop
-                if self._detect_loop(tool_calls_this_turn):
+                loop_reason = self._detect_loop(tool_calls_this_turn)
+                if loop_reason:
                     logger.error("⚠️  Exiting due to detected loop in tool calls")
-
-                    # Generate and save continuation for next run
-                    continuation_prompt = self._generate_continuation_prompt(original_task, turns)
-                    self._save_continuation(original_task, continuation_prompt, turns)
+                    self.transcript.append({"type": "exit", "reason": "loop", "detail": loop_reason})
 
                     return (
-                        f"Task interrupted: Loop detected in tool calls. "
-                        f"The same pattern of {self.PATTERN_WINDOW_SIZE} tool calls "
-                        f"repeated {self.MAX_REPEATED_PATTERNS} times.\n\n"
+                        f"Task interrupted: Loop detected in tool calls ({loop_reason}).\n\n"
                         f"Files created: {list(self._files_written)}\n\n"
-                        f"A continuation file has been saved. Run the agent again to resume."
+                        f"Session saved to {self.transcript.path}. Run the agent again to resume."
                     )
 
                 # Check for too many tool errors
@@ -1870,32 +5234,28 @@ Please continue from where you left off. Files in the file store are still acces
                     # Reset on successful tools
                     self._consecutive_errors = 0
 
-                # Add tool results to messages
-                self.messages.append({"role": "user", "content": tool_results})
-
             else:
                 logger.warning(f"Unexpected stop reason: {stop_reason}")
                 break
 
         logger.warning(f"⏱️  Reached maximum turns ({self.config.max_turns})")
 
-        # Generate and save continuation for next run
-        continuation_prompt = self._generate_continuation_prompt(original_task, turns)
-        self._save_continuation(original_task, continuation_prompt, turns)
+        # The transcript already holds every completed turn - just mark why we stopped
+        self.transcript.append({"type": "exit", "reason": "max_turns"})
 
         print(f"\n{'=' * 60}")
-        print("TASK INTERRUPTED - CONTINUATION SAVED")
+        print("TASK INTERRUPTED - SESSION SAVED")
         print(f"{'=' * 60}")
         print(f"Turns used: {turns}/{self.config.max_turns}")
         print(f"Files created: {list(self._files_written)}")
         print(f"\nRun the agent again to continue from where it left off.")
-        print(f"Continuation file: {self._continuation_path}")
+        print(f"Session transcript: {self.transcript.path}")
         print(f"{'=' * 60}\n")
 
         return (
             f"Task incomplete - reached maximum {self.config.max_turns} turns.\n\n"
             f"Files created: {list(self._files_written)}\n\n"
-            f"A continuation file has been saved to {self._continuation_path}\n"
+            f"The session has been saved to {self.transcript.path}\n"
             f"Run the agent again to resume from where it left off."
         )
 
@@ -1923,6 +5283,7 @@ Please continue from where you left off. Files in the file store are still acces
 
                 # Clear messages for next task (optional - remove to keep context)
                 self.messages = []
+                self.shell.reset_memo()
 
             except KeyboardInterrupt:
                 print("\n\nInterrupted. Goodbye!")
@@ -1932,6 +5293,692 @@ Please continue from where you left off. Files in the file store are still acces
                 print(f"\nError: {e}")
 
 
+# =============================================================================
+# Git Worktrees - Isolated checkouts, local merges and batched pushes
+# =============================================================================
+
+
+class GitWorkspace:
+    """
+    Git operations for continuous mode.
+
+    Each parallel worker gets its own worktree (branch agent/<name>) under
+    .agent-worktrees/, so workers never see each other's half-written files.
+    Finished work is rebased onto the main branch and fast-forwarded into it
+    locally; the remote is contacted only every push_every local commits and
+    at the end of a run.
+
+    Methods are blocking; call them via asyncio.to_thread from the event loop.
+    """
+
+    WORKTREE_DIR = ".agent-worktrees"
+
+    def __init__(self, root: Path, push_every: int = 1):
+        self.root = Path(root).resolve()
+        self.push_every = max(1, push_every)
+        self.unpushed = 0  # Local commits on the main branch not yet pushed
+        self.pushes = 0
+
+    def _git(self, *args: str, cwd: Optional[Path] = None) -> subprocess.CompletedProcess:
+        return subprocess.run(["git", *args], cwd=cwd or self.root, capture_output=True, text=True)
+
+    def is_repo(self) -> bool:
+        result = self._git("rev-parse", "--is-inside-work-tree")
+        return result.returncode == 0 and result.stdout.strip() == "true"
+
+    def worktree_path(self, name: str) -> Path:
+        return self.root / self.WORKTREE_DIR / name
+
+    def _exclude_worktrees(self):
+        """Keep .agent-worktrees/ out of `git add -A` in the main checkout."""
+        exclude = self._git("rev-parse", "--git-path", "info/exclude").stdout.strip()
+        if not exclude:
+            return
+        exclude_path = (self.root / exclude).resolve()
+        entry = f"/{self.WORKTREE_DIR}/"
+        existing = exclude_path.read_text() if exclude_path.exists() else ""
+        if entry not in existing.splitlines():
+            exclude_path.parent.mkdir(parents=True, exist_ok=True)
+            exclude_path.write_text(f"{existing.rstrip()}\n{entry}\n".lstrip())
+
+    def add_worktree(self, name: str) -> Optional[Path]:
+        """Create (or reuse, for resumed work) the worktree for name at the current HEAD."""
+        path = self.worktree_path(name)
+        if path.exists():
+            return path
+        self._exclude_worktrees()
+        result = self._git("worktree", "add", "-B", f"agent/{name}", str(path), "HEAD")
+        if result.returncode != 0:
+            logger.error(f"git worktree add failed: {result.stderr.strip()}")
+            return None
+        return path
+
+    def remove_worktree(self, name: str):
+        self._git("worktree", "remove", "--force", str(self.worktree_path(name)))
+        self._git("branch", "-D", f"agent/{name}")
+
+    def commit(self, message: str, paths: Optional[list[str]] = None, cwd: Optional[Path] = None) -> bool:
+        """Stage paths (everything if None) and commit. Returns False on error; nothing to commit is not an error."""
+        cwd = cwd or self.root
+        add_result = self._git("add", "-A", "--", *(paths or []), cwd=cwd)
+        if add_result.returncode != 0:
+            logger.error(f"git add failed: {add_result.stderr}")
+            return False
+
+        commit_result = self._git("commit", "-m", message, cwd=cwd)
+        if commit_result.returncode != 0:
+            if "nothing to commit" in commit_result.stdout:
+                logger.info("Nothing to commit")
+                return True
+            logger.error(f"git commit failed: {commit_result.stderr}")
+            return False
+
+        logger.info(f"Committed: {commit_result.stdout.strip().splitlines()[0]}")
+        if Path(cwd).resolve() == self.root:
+            self.unpushed += 1
+        return True
+
+    def merge_worktree(self, name: str) -> bool:
+        """Rebase agent/<name> onto the main branch and fast-forward the main branch to it."""
+        main = self._git("rev-parse", "--abbrev-ref", "HEAD").stdout.strip()
+        branch = f"agent/{name}"
+
+        rebase = self._git("rebase", main, cwd=self.worktree_path(name))
+        if rebase.returncode != 0:
+            self._git("rebase", "--abort", cwd=self.worktree_path(name))
+            logger.error(f"Rebase of {branch} onto {main} failed - left in {self.worktree_path(name)}: {rebase.stdout.strip() or rebase.stderr.strip()}")
+            return False
+
+        commits = int(self._git("rev-list", "--count", f"{main}..{branch}").stdout.strip() or 0)
+        merge = self._git("merge", "--ff-only", branch)
+        if merge.returncode != 0:
+            logger.error(f"Fast-forward of {main} to {branch} failed: {merge.stderr.strip()}")
+            return False
+        self.unpushed += commits
+        return True
+
+    def push(self, force: bool = False) -> bool:
+        """Push if push_every local commits have piled up (or force and anything is unpushed)."""
+        if not self.unpushed or (not force and self.unpushed < self.push_every):
+            return True
+        result = self._git("push")
+        if result.returncode != 0:
+            logger.error(f"git push failed: {result.stderr}")
+            return False
+        logger.info(f"Pushed {self.unpushed} commit(s) to remote")
+        self.pushes += 1
+        self.unpushed = 0
+        return True
+
+
+# =============================================================================
+# Backlog Work Queue
+# =============================================================================
+
+
+@dataclass(order=True)
+class BacklogItem:
+    """An unchecked '- [ ]' line of .project/BACKLOG.md, ordered by rank."""
+
+    rank: tuple = field(init=False, repr=False)
+    priority: int = field(compare=False)  # N of the enclosing "## Priority N" section (99 if none)
+    line_no: int = field(compare=False)
+    text: str = field(compare=False)  # The line without its checkbox
+    section: str = field(compare=False)  # Enclosing "###" heading (or "##" if none)
+    path: Optional[str] = field(default=None, compare=False)  # First `backticked` path
+    deferred: bool = field(default=False, compare=False)  # deferred / complex / large scope
+    next_up: bool = field(default=False, compare=False)  # Section or line marked NEXT UP
+    after: list[str] = field(default_factory=list, compare=False)  # Sections or paths that must finish first
+
+    def __post_init__(self):
+        self.rank = (self.deferred, bool(self.after), not self.next_up, self.priority, self.line_no)
+
+
+class BacklogQueue:
+    """
+    Priority queue over the unchecked items of .project/BACKLOG.md.
+
+    Items are ranked: not deferred before deferred/complex, NEXT UP before the
+    rest, then by priority section and file order. An "after X" marker in a
+    heading or item ("### CI/CD (NEXT UP after Permissions)") holds the item
+    back until every item whose section or path matches X has finished; held
+    items wait outside the heap and are put back by finish() once their last
+    blocker finishes.
+    """
+
+    PRIORITY_RE = re.compile(r"^##\s+Priority\s+(\d+)", re.IGNORECASE)
+    AFTER_RE = re.compile(r"\b(?:after|depends on)\s+`?([^`)]+?)`?\s*(?:\)|$)", re.IGNORECASE)
+    DEFERRED_RE = re.compile(r"\b(deferred|complex|large scope)\b", re.IGNORECASE)
+
+    def __init__(self, items: list[BacklogItem]):
+        self.items = items
+        self._heap = list(items)
+        heapq.heapify(self._heap)
+        self._finished: set[int] = set()  # line_no of items completed or given up on
+        self._taken: set[int] = set()
+        self._waiting: dict[int, BacklogItem] = {}  # line_no -> item held back by an unfinished dependency
+
+    @classmethod
+    def parse(cls, text: str) -> list[BacklogItem]:
+        items = []
+        priority, heading, heading_after, heading_next = 99, "", [], False
+        for line_no, line in enumerate(text.splitlines()):
+            stripped = line.strip()
+            match = cls.PRIORITY_RE.match(stripped)
+            if match or stripped.startswith("## "):
+                priority = int(match.group(1)) if match else 99
+                heading, heading_after, heading_next = stripped.lstrip("#").strip(), [], False
+            elif stripped.startswith("### "):
+                heading = stripped.lstrip("#").strip()
+                heading_after = cls.AFTER_RE.findall(heading)
+                heading_next = "next up" in heading.lower()
+                heading = re.sub(r"\s*\(.*\)\s*", " ", heading).strip()
+            if not stripped.startswith("- [ ]"):
+                continue
+
+            body = stripped[len("- [ ]") :].strip()
+            path = re.search(r"`([^`]+)`", body)
+            items.append(
+                BacklogItem(
+                    priority=priority,
+                    line_no=line_no,
+                    text=body,
+                    section=heading,
+                    path=path.group(1) if path else None,
+                    deferred=bool(cls.DEFERRED_RE.search(body)),
+                    next_up=heading_next or "next up" in body.lower(),
+                    after=heading_after + [dep for dep in cls.AFTER_RE.findall(body) if dep != (path.group(1) if path else None)],
+                )
+            )
+        return items
+
+    @classmethod
+    def load(cls, path: Path) -> "BacklogQueue":
+        return cls(cls.parse(Path(path).read_text()))
+
+    def blockers(self, item: BacklogItem) -> list[BacklogItem]:
+        """Unfinished items this item must wait for."""
+        found = []
+        for dep in item.after:
+            dep_lower = dep.lower()
+            for other in self.items:
+                if other is item or other.line_no in self._finished or other in found:
+                    continue
+                if dep_lower in other.section.lower() or (other.path and dep_lower in other.path.lower()):
+                    found.append(other)
+        return found
+
+    def _blocked(self, item: BacklogItem) -> bool:
+        return bool(self.blockers(item))
+
+    def pop_ready(self, include_deferred: bool = False) -> Optional[BacklogItem]:
+        """Remove and return the best-ranked item whose dependencies have finished."""
+        held = []
+        found = None
+        while self._heap:
+            item = heapq.heappop(self._heap)
+            if item.line_no in self._taken:
+                continue
+            if item.deferred and not include_deferred:
+                held.append(item)
+                continue
+            if self._blocked(item):
+                self._waiting[item.line_no] = item
+                continue
+            found = item
+            self._taken.add(item.line_no)
+            break
+        for item in held:
+            heapq.heappush(self._heap, item)
+        return found
+
+    def requeue(self, item: BacklogItem):
+        self._taken.discard(item.line_no)
+        heapq.heappush(self._heap, item)
+
+    def finish(self, item: BacklogItem) -> list[BacklogItem]:
+        """
+        Mark an item as no longer blocking its dependents (done or given up on).
+
+        Returns the waiting items this unblocked, which are back in the queue.
+        """
+        self._finished.add(item.line_no)
+        released = [other for other in self._waiting.values() if not self._blocked(other)]
+        for other in released:
+            del self._waiting[other.line_no]
+            heapq.heappush(self._heap, other)
+        return released
+
+    def waiting(self) -> list[BacklogItem]:
+        """Items still held back by an unfinished dependency, in rank order."""
+        return sorted(self._waiting.values())
+
+    def remaining(self, include_deferred: bool = False) -> list[BacklogItem]:
+        """Unfinished items in rank order."""
+        return sorted(item for item in self.items if item.line_no not in self._finished and (include_deferred or not item.deferred))
+
+
+async def run_backlog_workers(agent: "DocumentationAgent", workers: int = 2, max_items: int = 10, git: Optional[GitWorkspace] = None) -> list[str]:
+    """
+    Work through BACKLOG.md with several agents at once.
+
+    The coordinator pops the best ready item from a BacklogQueue and hands it
+    to a worker agent (sharing MCP, Bedrock and FileStore) with a prompt for
+    that item only; each worker has its own session transcript, so an
+    interrupted item resumes when it is dispatched again. Workers never touch
+    .project/.
+
+    In a git work dir each item gets its own worktree (see GitWorkspace). The
+    worker's changes are committed there, and the coordinator alone, one item
+    at a time, rebases them onto the main branch, fast-forwards it, ticks the
+    item in BACKLOG.md and STATUS.md and commits that. Pushes follow
+    git.push_every; the caller pushes the remainder.
+
+    Returns the files written.
+    """
+    import hashlib
+
+    root = agent.config.work_dir
+    project_dir = root / ".project"
+    queue = BacklogQueue.load(project_dir / "BACKLOG.md")
+    git = git or GitWorkspace(root, agent.config.push_every)
+    use_worktrees = await asyncio.to_thread(git.is_repo)
+    if not use_worktrees:
+        logger.warning("Work dir is not a git repository - workers share it and nothing is committed")
+
+    lock = asyncio.Lock()
+    attempts: dict[int, int] = {}
+    total_files: list[str] = []
+    running: dict[asyncio.Task, BacklogItem] = {}
+    dispatched = 0
+
+    async def work(item: BacklogItem, number: int) -> tuple[str, set[str], Optional[str]]:
+        config, name = agent.config, None
+        if use_worktrees:
+            # Line number too: two items with the same text must not share a branch
+            name = f"item-{hashlib.sha1(f'{item.line_no}:{item.text}'.encode()).hexdigest()[:10]}"
+            path = await asyncio.to_thread(git.add_worktree, name)
+            if path is None:
+                return "failed", set(), None
+            output_dir = path / config.output_dir.relative_to(root) if config.output_dir.is_relative_to(root) else config.output_dir
+            config = replace(config, work_dir=path, output_dir=output_dir)
+
+        worker = DocumentationAgent(config, mcp=agent.mcp, bedrock=agent.bedrock, file_store=agent.file_store, research_cache=agent.research_cache)
+        await worker.initialize()
+        try:
+            await worker.run_task(BACKLOG_ITEM_TASK.format(item=item.text, section=item.section))
+        finally:
+            await worker.shell.close()
+        status = "incomplete" if worker.transcript.exists() else "completed"
+        files = worker._files_written
+
+        if status == "completed" and files and name:
+            message = await _generate_commit_message(agent, sorted(files), number)
+            if not await asyncio.to_thread(git.commit, message, None, config.work_dir):
+                status = "failed"
+        return status, files, name
+
+    while True:
+        while len(running) < workers and dispatched < max_items:
+            item = queue.pop_ready()
+            if item is None:
+                break
+            dispatched += 1
+            attempts[item.line_no] = attempts.get(item.line_no, 0) + 1
+            print(f"\n▶️  [{dispatched}/{max_items}] {item.text}", flush=True)
+            running[asyncio.create_task(work(item, dispatched))] = item
+        if not running:
+            break
+
+        finished, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+        for task in finished:
+            item = running.pop(task)
+            try:
+                status, files, name = task.result()
+            except Exception as e:
+                logger.error(f"Backlog worker failed on '{item.text}': {e}")
+                status, files, name = "failed", set(), None
+
+            if status == "completed" and files:
+                async with lock:
+                    merged = not name or await asyncio.to_thread(git.merge_worktree, name)
+                    if merged:
+                        _record_backlog_progress(project_dir, item, sorted(files))
+                        if name:
+                            await asyncio.to_thread(git.commit, f"docs: mark {item.path or item.text[:60]} done in backlog", [".project"])
+                            await asyncio.to_thread(git.remove_worktree, name)
+                            await asyncio.to_thread(git.push)
+                released = queue.finish(item)
+                if merged:
+                    total_files.extend(files)
+                    print(f"✅ {item.text} ({len(files)} files)", flush=True)
+                else:
+                    print(f"⚠️  {item.text}: could not rebase onto the main branch - left in {git.worktree_path(name)}", flush=True)
+                for other in released:
+                    logger.info(f"Dependencies done, queueing: {other.text}")
+            elif status == "incomplete" and attempts[item.line_no] < 2:
+                logger.info(f"Re-queueing interrupted item: {item.text}")
+                queue.requeue(item)
+            else:
+                logger.warning(f"Giving up on backlog item ({status}, no files written): {item.text}")
+                for other in queue.finish(item):
+                    logger.info(f"Dependencies given up on, queueing: {other.text}")
+                if name:
+                    await asyncio.to_thread(git.remove_worktree, name)
+
+    # Items still waiting depend on something this run never dispatched (deferred, or past max_items)
+    for item in queue.waiting():
+        blockers = ", ".join(other.text[:60] for other in queue.blockers(item))
+        logger.warning(f"Not dispatched, still waiting on: {blockers} - {item.text}")
+    return total_files
+
+
+def _record_backlog_progress(project_dir: Path, item: BacklogItem, files: list[str]):
+    """Tick an item in BACKLOG.md and list it under STATUS.md's completed section (coordinator only)."""
+    today = datetime.now().strftime("%Y-%m-%d")
+
+    backlog_path = project_dir / "BACKLOG.md"
+    lines = backlog_path.read_text().split("\n")
+    for i, line in enumerate(lines):
+        if line.strip() == f"- [ ] {item.text}":
+            lines[i] = line.replace("- [ ]", "- [x]", 1) + " ✅"
+            break
+    backlog = re.sub(r"(\*\*Last Updated:\*\*)\s*\S+", rf"\1 {today}", "\n".join(lines), count=1)
+    backlog_path.write_text(backlog)
+
+    status_path = project_dir / "STATUS.md"
+    if not status_path.exists():
+        return
+    status = status_path.read_text()
+    entry = f"- [x] **{item.text}** ✅ ({', '.join(files)})"
+    heading = re.search(r"^## .*Complete.*$", status, re.MULTILINE)
+    if heading:
+        # Append to the end of the completed list
+        section_end = status.find("\n## ", heading.end())
+        section_end = len(status) if section_end == -1 else section_end
+        body = status[heading.end() : section_end].rstrip()
+        status = f"{status[: heading.end()]}{body}\n{entry}\n{status[section_end:]}"
+    else:
+        status = f"{status.rstrip()}\n\n## Completed\n\n{entry}\n"
+    status_path.write_text(re.sub(r"(\*\*Last Updated:\*\*)\s*\S+", rf"\1 {today}", status, count=1))
+
+
+# =============================================================================
+# Task File Scheduler
+# =============================================================================
+
+
+def load_tasks(path: Path) -> dict[str, dict]:
+    """
+    Parse a tasks.yaml file into {task_id: {"description", "task", "depends_on"}}.
+
+    Tasks nested under a category get the id "category.key"; top-level tasks
+    use their key. depends_on may name a task by full id or, when unambiguous,
+    by its key alone. Raises ValueError on unknown dependencies or cycles.
+    """
+    try:
+        import yaml
+    except ImportError:
+        raise RuntimeError("--tasks-file requires PyYAML (pip install pyyaml)")
+
+    data = yaml.safe_load(Path(path).read_text()) or {}
+    raw: dict[str, dict] = {}
+    for key, value in data.items():
+        if not isinstance(value, dict):
+            continue
+        if "task" in value:
+            raw[key] = value
+        else:
+            for sub_key, sub in value.items():
+                if isinstance(sub, dict) and "task" in sub:
+                    raw[f"{key}.{sub_key}"] = sub
+
+    by_key: dict[str, list[str]] = {}
+    for task_id in raw:
+        by_key.setdefault(task_id.rsplit(".", 1)[-1], []).append(task_id)
+
+    tasks = {}
+    for task_id, spec in raw.items():
+        deps = spec.get("depends_on") or []
+        dep_ids = []
+        for dep in [deps] if isinstance(deps, str) else deps:
+            if dep in raw:
+                dep_ids.append(dep)
+            elif len(by_key.get(dep, [])) == 1:
+                dep_ids.append(by_key[dep][0])
+            else:
+                raise ValueError(f"Task '{task_id}' depends on unknown or ambiguous task '{dep}'")
+        tasks[task_id] = {"description": spec.get("description", task_id), "task": spec["task"], "depends_on": dep_ids}
+
+    # Reject dependency cycles
+    done: set[str] = set()
+
+    def visit(task_id: str, chain: list[str]):
+        if task_id in done:
+            return
+        if task_id in chain:
+            raise ValueError(f"Dependency cycle: {' -> '.join(chain + [task_id])}")
+        for dep in tasks[task_id]["depends_on"]:
+            visit(dep, chain + [task_id])
+        done.add(task_id)
+
+    for task_id in tasks:
+        visit(task_id, [])
+    return tasks
+
+
+def select_tasks(tasks: dict[str, dict], only: Optional[list[str]]) -> dict[str, dict]:
+    """Restrict tasks to those named in only (task ids, keys or categories) plus their dependencies."""
+    if not only:
+        return tasks
+
+    stack = []
+    for name in only:
+        matches = [t for t in tasks if name in (t, t.split(".")[0], t.rsplit(".", 1)[-1])]
+        if not matches:
+            raise ValueError(f"No task or category named '{name}'")
+        stack.extend(matches)
+
+    selected: set[str] = set()
+    while stack:
+        task_id = stack.pop()
+        if task_id not in selected:
+            selected.add(task_id)
+            stack.extend(tasks[task_id]["depends_on"])
+    return {task_id: spec for task_id, spec in tasks.items() if task_id in selected}
+
+
+async def run_task_file(agent: "DocumentationAgent", tasks: dict[str, dict], max_concurrent: int = 3) -> dict:
+    """
+    Run tasks concurrently, each in its own DocumentationAgent session, once their dependencies complete.
+
+    The sessions share the given agent's MCP client (connection pool and
+    response cache), Bedrock client and FileStore; at most max_concurrent run
+    at a time. A task whose dependency did not complete is skipped.
+
+    Returns a report with timing, turns, token usage and files written per task.
+    """
+    import time
+
+    semaphore = asyncio.Semaphore(max(1, max_concurrent))
+    started = time.perf_counter()
+    report: dict[str, dict] = {}
+    runs: dict[str, asyncio.Task] = {}
+
+    async def run_one(task_id: str, spec: dict) -> bool:
+        entry = report[task_id] = {"description": spec["description"], "depends_on": spec["depends_on"], "status": "waiting"}
+        if spec["depends_on"] and not all(await asyncio.gather(*(runs[dep] for dep in spec["depends_on"]))):
+            entry["status"] = "skipped"
+            logger.warning(f"Skipping {task_id}: a dependency did not complete")
+            return False
+
+        ready = time.perf_counter()
+        async with semaphore:
+            begin = time.perf_counter()
+            entry.update(status="running", start_s=round(begin - started, 3), queued_s=round(begin - ready, 3))
+            print(f"\n▶️  [{task_id}] {spec['description']}", flush=True)
+            worker = None
+            try:
+                # Inside the try: a session that cannot start fails its task (and skips its dependents) only
+                worker = DocumentationAgent(agent.config, mcp=agent.mcp, bedrock=agent.bedrock, file_store=agent.file_store, research_cache=agent.research_cache)
+                await worker.initialize()
+                result = await worker.run_task(spec["task"])
+                # The transcript is only cleared when the task ran to completion
+                entry["status"] = "incomplete" if worker.transcript.exists() else "completed"
+                entry["result"] = result[:500]
+                summary = _extract_summary(result)
+                if summary is not None:
+                    entry["summary"] = summary
+            except Exception as e:
+                logger.error(f"Task {task_id} failed: {e}")
+                entry.update(status="failed", error=str(e))
+            finally:
+                if worker is not None:
+                    await worker.shell.close()
+            entry["wall_s"] = round(time.perf_counter() - begin, 3)
+            if worker is not None:
+                entry.update(turns=worker._turn, **worker.usage, files_written=sorted(worker._files_written))
+            print(f"{'✅' if entry['status'] == 'completed' else '⚠️ '} [{task_id}] {entry['status']} in {entry['wall_s']:.1f}s", flush=True)
+        return entry["status"] == "completed"
+
+    for task_id, spec in tasks.items():
+        runs[task_id] = asyncio.create_task(run_one(task_id, spec))
+    await asyncio.gather(*runs.values())
+
+    totals = {key: sum(entry.get(key, 0) for entry in report.values()) for key in ("turns", "requests", "input_tokens", "output_tokens")}
+    return {
+        "wall_s": round(time.perf_counter() - started, 3),
+        "max_concurrent": max_concurrent,
+        "mcp_cache_hits": agent.mcp.cache_hits,
+        "totals": totals,
+        "tasks": {task_id: report[task_id] for task_id in tasks},
+    }
+
+
+SUMMARY_MARKER = "SUMMARY:"
+
+
+def _extract_summary(text: str) -> Optional[dict]:
+    """Return the JSON object following the last SUMMARY: marker in a final response, if any."""
+    at = text.rfind(SUMMARY_MARKER)
+    if at == -1:
+        return None
+    body = text[at + len(SUMMARY_MARKER):]
+    start = body.find("{")
+    if start == -1:
+        return None
+    try:
+        summary, _ = json.JSONDecoder().raw_decode(body[start:])
+    except json.JSONDecodeError:
+        return None
+    return summary if isinstance(summary, dict) else None
+
+
+# =============================================================================
+# Planner Mode
+# =============================================================================
+
+PLANNER_PROMPT = """Split this documentation task into at most {max_subtasks} sub-tasks that separate agents can work on concurrently, each with a fresh context:
+
+{task}
+
+Each sub-task must be self-contained: name the component, the sources to research (Confluence spaces, GitHub repositories) and the exact file path(s) to write. Sub-tasks must not write the same files. Use depends_on only when a sub-task needs another's output; it may only name sub-tasks listed before it. Leave indexes, overviews and cross-linking to the integration step that follows.
+
+Reply with ONLY a JSON object:
+{{"subtasks": [{{"id": "short-slug", "description": "one line", "task": "full instructions", "depends_on": []}}]}}"""
+
+SUBTASK_TEMPLATE = """You are one of several agents working concurrently on: {parent}
+
+Your sub-task ({task_id}): {task}
+
+Other agents are handling: {others}. Do not write their files, and do not edit .project/STATUS.md or .project/BACKLOG.md.
+
+End your final message with a one-line summary for the coordinator, exactly in this form:
+SUMMARY: {{"files": ["paths written"], "summary": "two or three sentences", "facts": ["facts other documents may need to reference"], "open_questions": []}}"""
+
+INTEGRATION_TASK = """Concurrent sub-agents have finished the parts of this task:
+
+{parent}
+
+Their results (status, files written and summaries):
+{results}
+
+Integrate the work: create or update the overview/index pages that tie these documents together, fix cross-references between them, and fill gaps left by sub-tasks that did not complete. Read the written files only where you need to; do not repeat research the summaries already cover."""
+
+
+async def plan_subtasks(agent: "DocumentationAgent", task: str, max_subtasks: int = 6) -> dict[str, dict]:
+    """
+    Ask the model to split a task into concurrent sub-tasks.
+
+    Returns {subtask_id: {"description", "task", "depends_on"}} in the format
+    run_task_file expects, or an empty dict if the plan could not be parsed or
+    has fewer than two sub-tasks.
+    """
+    text = ""
+    try:
+        response = await asyncio.to_thread(
+            agent.bedrock.create_message,
+            messages=[{"role": "user", "content": PLANNER_PROMPT.format(task=task, max_subtasks=max_subtasks)}],
+            system=agent._get_system_prompt(),
+            tools=[],
+        )
+        text = "".join(block.get("text", "") for block in response.get("content", []) if block.get("type") == "text")
+        start = text.find("{")
+        plan, _ = json.JSONDecoder().raw_decode(text[start:]) if start != -1 else ({}, 0)
+    except Exception as e:
+        logger.warning(f"Planning failed: {e}")
+        return {}
+
+    subtasks: dict[str, dict] = {}
+    for i, spec in enumerate(plan.get("subtasks", [])[:max_subtasks] if isinstance(plan, dict) else []):
+        if not isinstance(spec, dict) or not spec.get("task"):
+            continue
+        task_id = re.sub(r"[^a-z0-9-]+", "-", str(spec.get("id") or f"part-{i + 1}").lower()).strip("-") or f"part-{i + 1}"
+        while task_id in subtasks:
+            task_id += "-2"
+        deps = spec.get("depends_on") or []
+        subtasks[task_id] = {
+            "description": str(spec.get("description") or task_id),
+            "task": str(spec["task"]),
+            # Only earlier sub-tasks, which keeps the graph acyclic
+            "depends_on": [dep for dep in ([deps] if isinstance(deps, str) else deps) if dep in subtasks],
+        }
+    return subtasks if len(subtasks) > 1 else {}
+
+
+async def run_planned(agent: "DocumentationAgent", task: str, max_subtasks: int = 6, max_concurrent: int = 3) -> tuple[str, dict]:
+    """
+    Run a broad task as concurrent sub-agents followed by an integration turn.
+
+    The agent plans sub-tasks, each runs in a child DocumentationAgent with a
+    fresh context (via run_task_file), and their compact SUMMARY blocks are
+    handed to a final run_task on the parent agent. Falls back to a single
+    run_task when the task does not split. Returns (result, report).
+    """
+    print(f"\n🗺️  Planning: {task[:100]}{'...' if len(task) > 100 else ''}", flush=True)
+    subtasks = await plan_subtasks(agent, task, max_subtasks)
+    if not subtasks:
+        print("   Task did not split into sub-tasks; running it directly", flush=True)
+        return await agent.run_task(task), {}
+
+    for task_id, spec in subtasks.items():
+        print(f"   • {task_id}: {spec['description']}" + (f" (after {', '.join(spec['depends_on'])})" if spec["depends_on"] else ""))
+        others = "; ".join(f"{other} ({s['description']})" for other, s in subtasks.items() if other != task_id)
+        spec["task"] = SUBTASK_TEMPLATE.format(parent=task, task_id=task_id, task=spec["task"], others=others)
+
+    report = await run_task_file(agent, subtasks, max_concurrent)
+
+    results = {}
+    for task_id, entry in report["tasks"].items():
+        # Sub-tasks that ended without a SUMMARY block fall back to their truncated result
+        summary = entry.get("summary") or {"result": entry.get("result", entry.get("error", ""))[:300]}
+        results[task_id] = {**summary, "status": entry["status"], "files": entry.get("files_written") or summary.get("files", [])}
+    print(f"\n🧩 Integrating {len(results)} sub-task results", flush=True)
+    result = await agent.run_task(INTEGRATION_TASK.format(parent=task, results=json.dumps(results, indent=1)))
+    report["integration"] = {"turns": agent._turn, **agent.usage, "files_written": sorted(agent._files_written)}
+    return result, report
+
+
 # =============================================================================
 # Main Entry Point
 # =============================================================================
@@ -1940,23 +5987,44 @@ DEFAULT_CONTINUOUS_TASK = """Read .project/STATUS.md and .project/BACKLOG.md to
 Choose the single highest-priority incomplete item and create documentation for it.
 PRIORITIZATION: Work on items NOT marked as 'deferred' or 'complex' first. 
 Leave 'deferred' and 'complex' items until all other work is complete.
-Use Confluence (mcp_confluence) and GitHub (mcp_github) to research.
+Check recall() for research cached by earlier iterations, then use Confluence (mcp_confluence) and GitHub (mcp_github) to research.
+remember() what you learn so later iterations do not repeat the research.
 Write the documentation to the appropriate location in the repository.
 Update .project/STATUS.md and .project/BACKLOG.md to reflect your progress."""
 
+# Per-item task for parallel backlog workers (see run_backlog_workers)
+BACKLOG_ITEM_TASK = """Create the documentation for this backlog item (section: {section}):
+
+{item}
+
+Read .project/STATUS.md for context. Check recall() for cached research, then use Confluence (mcp_confluence) and GitHub (mcp_github) to research.
+Write the documentation to the path given in the item, or the appropriate location in the repository.
+Do NOT edit .project/STATUS.md or .project/BACKLOG.md: other agents are working on the backlog in
+parallel, and your progress is recorded there for you when you finish."""
 
-async def run_continuous(agent: "DocumentationAgent", task: str, max_iterations: int = 10):
+
+async def run_continuous(agent: "DocumentationAgent", task: str, max_iterations: int = 10, workers: int = 1):
     """
     Run the agent continuously until no more work to do.
 
     Each iteration:
     1. Run the task
-    2. If files were written, generate commit message and commit/push
+    2. If files were written, generate commit message and commit
+       (pushing every config.push_every commits)
     3. Check if more work remains
     4. If no files written or task complete, stop
+
+    With workers > 1 the backlog items are dispatched to that many concurrent
+    worker agents instead (see run_backlog_workers); task is not used.
+    Unpushed commits are pushed when the run ends either way.
     """
     iteration = 0
     total_files = []
+    git = GitWorkspace(agent.config.work_dir, agent.config.push_every)
+
+    if workers > 1:
+        total_files = await run_backlog_workers(agent, workers, max_iterations, git)
+        iteration = max_iterations
 
     while iteration < max_iterations:
         iteration += 1
@@ -1966,7 +6034,8 @@ async def run_continuous(agent: "DocumentationAgent", task: str, max_iterations:
 
         # Reset agent state for new iteration
         agent.messages = []
-        agent._tool_call_history = []
+        agent.shell.reset_memo()
+        agent.loop_detector.reset()
         agent._consecutive_errors = 0
         files_before = set(agent._files_written)
 
@@ -1985,7 +6054,7 @@ async def run_continuous(agent: "DocumentationAgent", task: str, max_iterations:
         print(f"\n📁 Files modified this iteration: {list(files_this_iteration)}")
 
         # Generate commit message using the agent
-        commit_result = await _generate_and_commit(agent, list(files_this_iteration), iteration)
+        commit_result = await _generate_and_commit(agent, list(files_this_iteration), iteration, git)
         if not commit_result:
             print("⚠️  Commit failed, stopping continuous mode")
             break
@@ -1998,21 +6067,28 @@ async def run_continuous(agent: "DocumentationAgent", task: str, max_iterations:
 
         print(f"\n🔄 More work available, continuing to iteration {iteration + 1}...")
 
+    # Push whatever the cadence held back
+    if git.unpushed:
+        print(f"\n⬆️  Pushing {git.unpushed} commit(s)...")
+        if await asyncio.to_thread(git.push, True):
+            print("✅ Pushed to remote")
+
     # Final summary
     print(f"\n{'=' * 70}")
     print(f"  CONTINUOUS RUN COMPLETE")
     print(f"{'=' * 70}")
-    print(f"  Iterations: {iteration}")
+    if workers > 1:
+        print(f"  Workers: {workers}")
+    else:
+        print(f"  Iterations: {iteration}")
     print(f"  Total files modified: {len(total_files)}")
     for f in sorted(set(total_files)):
         print(f"    - {f}")
     print(f"{'=' * 70}\n")
 
 
-async def _generate_and_commit(agent: "DocumentationAgent", files: list[str], iteration: int) -> bool:
-    """Generate a commit message and commit/push the changes."""
-
-    # Ask agent to generate commit message
+async def _generate_commit_message(agent: "DocumentationAgent", files: list[str], iteration: int) -> str:
+    """Ask the model for a one-line commit message for these files (with a fallback)."""
     commit_prompt = f"""Generate a concise git commit message for these documentation changes:
     
 Files modified: {files}
@@ -2024,59 +6100,47 @@ The commit message should:
 
 Reply with ONLY the commit message, nothing else."""
 
-    agent.messages = [{"role": "user", "content": commit_prompt}]
-
+    commit_msg = ""
     try:
-        response = agent.bedrock.create_message(
-            messages=agent.messages,
+        response = await asyncio.to_thread(
+            agent.bedrock.create_message,
+            messages=[{"role": "user", "content": commit_prompt}],
             system="You are a helpful assistant that generates concise git commit messages.",
             tools=[],
         )
-
-        commit_msg = ""
         for block in response.get("content", []):
             if block.get("type") == "text":
                 commit_msg = block.get("text", "").strip()
                 break
+    except Exception as e:
+        logger.error(f"Commit message generation failed: {e}")
 
-        if not commit_msg:
-            commit_msg = f"docs: iteration {iteration} - update documentation"
-
-        # Truncate if too long
-        lines = commit_msg.split("\n")
-        if len(lines[0]) > 72:
-            lines[0] = lines[0][:69] + "..."
-        commit_msg = "\n".join(lines)
+    if not commit_msg:
+        commit_msg = f"docs: iteration {iteration} - update documentation"
 
-        print(f"\n📝 Commit message:\n{commit_msg}")
+    # Truncate if too long
+    lines = commit_msg.split("\n")
+    if len(lines[0]) > 72:
+        lines[0] = lines[0][:69] + "..."
+    return "\n".join(lines)
 
-        # Execute git commands
-        work_dir = agent.config.work_dir
 
-        # git add
-        add_result = subprocess.run(["git", "add", "-A"], cwd=work_dir, capture_output=True, text=True)
-        if add_result.returncode != 0:
-            logger.error(f"git add failed: {add_result.stderr}")
-            return False
+async def _generate_and_commit(agent: "DocumentationAgent", files: list[str], iteration: int, git: Optional[GitWorkspace] = None) -> bool:
+    """Generate a commit message, commit in the work dir and push when the push cadence is due."""
+    git = git or GitWorkspace(agent.config.work_dir)
+    try:
+        commit_msg = await _generate_commit_message(agent, files, iteration)
+        print(f"\n📝 Commit message:\n{commit_msg}")
 
-        # git commit
-        commit_result = subprocess.run(["git", "commit", "-m", commit_msg], cwd=work_dir, capture_output=True, text=True)
-        if commit_result.returncode != 0:
-            if "nothing to commit" in commit_result.stdout:
-                print("ℹ️  Nothing to commit")
-                return True
-            logger.error(f"git commit failed: {commit_result.stderr}")
+        if not await asyncio.to_thread(git.commit, commit_msg):
             return False
+        print(f"✅ Committed")
 
-        print(f"✅ Committed: {commit_result.stdout.strip()}")
-
-        # git push
-        push_result = subprocess.run(["git", "push"], cwd=work_dir, capture_output=True, text=True)
-        if push_result.returncode != 0:
-            logger.error(f"git push failed: {push_result.stderr}")
+        pushes = git.pushes
+        if not await asyncio.to_thread(git.push):
             return False
-
-        print(f"✅ Pushed to remote")
+        if git.pushes > pushes:
+            print(f"✅ Pushed to remote")
         return True
 
     except Exception as e:
@@ -2091,21 +6155,13 @@ async def _check_more_work(agent: "DocumentationAgent") -> bool:
     try:
         backlog_path = agent.config.work_dir / ".project" / "BACKLOG.md"
         if backlog_path.exists():
-            backlog = backlog_path.read_text()
-
-            # Count unchecked items (not deferred/complex)
-            unchecked = 0
-            for line in backlog.split("\n"):
-                line_lower = line.lower()
-                # Look for unchecked markdown checkboxes
-                if "- [ ]" in line:
-                    # Skip deferred or complex items
-                    if "deferred" not in line_lower and "complex" not in line_lower:
-                        unchecked += 1
-                        logger.info(f"📋 Remaining work: {line.strip()}")
-
-            if unchecked > 0:
-                logger.info(f"📊 Found {unchecked} unchecked items in backlog (excluding deferred/complex)")
+            # Unchecked items, excluding deferred/complex
+            remaining = BacklogQueue.load(backlog_path).remaining()
+            for item in remaining:
+                logger.info(f"📋 Remaining work: {item.text}")
+
+            if remaining:
+                logger.info(f"📊 Found {len(remaining)} unchecked items in backlog (excluding deferred/complex)")
                 return True
             else:
                 logger.info("📊 No more unchecked items found in backlog (or all remaining are deferred/complex)")
@@ -2178,6 +6234,9 @@ Examples:
     
     # Continuous mode - run until done
     python agent.py --continuous
+
+    # Run tasks.yaml (or part of it) concurrently, respecting depends_on
+    python agent.py --tasks-file tasks.yaml --only runbooks onboarding.developer
     
     # Custom configuration
     python agent.py --task "..." --region us-west-2 --model anthropic.claude-3-opus-20240229-v1:0
@@ -2188,11 +6247,26 @@ Examples:
     parser.add_argument("--interactive", "-i", action="store_true", help="Run in interactive mode")
     parser.add_argument("--continuous", "-c", action="store_true", help="Run continuously until no more work (commits after each iteration)")
     parser.add_argument("--max-iterations", type=int, default=10, help="Maximum iterations for continuous mode (default: 10)")
+    parser.add_argument("--workers", type=int, default=1, help="Continuous mode: backlog items worked on concurrently, each in its own git worktree (default: 1)")
+    parser.add_argument("--push-every", type=int, default=5, help="Continuous mode: push after this many local commits; always pushes at the end (default: 5)")
+    parser.add_argument("--tasks-file", type=str, help="Run the tasks defined in a tasks.yaml file concurrently")
+    parser.add_argument("--only", nargs="+", metavar="TASK", help="With --tasks-file: run only these task ids, keys or categories (plus dependencies)")
+    parser.add_argument("--plan", action="store_true", help="With --task: split the task into sub-tasks run concurrently by child agents, then integrate")
+    parser.add_argument("--max-subtasks", type=int, default=6, help="With --plan: maximum number of sub-tasks (default: 6)")
+    parser.add_argument("--max-concurrent-tasks", type=int, default=3, help="With --tasks-file or --plan: maximum tasks running at once (default: 3)")
+    parser.add_argument("--report", type=str, help="With --tasks-file or --plan: also write the JSON report to this path")
     parser.add_argument("--region", type=str, default="us-east-1", help="AWS region for Bedrock (default: us-east-1)")
     parser.add_argument("--model", type=str, default="anthropic.claude-sonnet-4-20250514-v1:0", help="Bedrock model ID")
     parser.add_argument("--mcp-url", type=str, default="https://avatar.natterbox-dev03.net/mcp/sse", help="Natterbox MCP server URL")
     parser.add_argument("--work-dir", type=str, default="/workspace", help="Working directory for the agent")
     parser.add_argument("--output-dir", type=str, default="/workspace/output", help="Output directory for generated documentation")
+    parser.add_argument("--context-budget", type=int, default=60000, help="Token budget for relevance-ranked context packing (default: 60000)")
+    parser.add_argument("--no-context-packing", action="store_true", help="Disable context packing; compress all but the last 3 tool results instead")
+    parser.add_argument("--no-rolling-summary", action="store_true", help="Disable background summarization of aged-out turns")
+    parser.add_argument("--summary-model", type=str, default=None, help="Bedrock model ID for rolling summaries (default: $SUMMARY_MODEL_ID or Claude 3.5 Haiku)")
+    parser.add_argument("--no-result-shaping", action="store_true", help="Pass MCP results through as returned instead of converting Confluence HTML and stripping boilerplate")
+    parser.add_argument("--persistent-shell", action="store_true", help="Run bash commands in one long-lived shell per agent session (cd and exports persist)")
+    parser.add_argument("--max-parallel-tools", type=int, default=4, help="Maximum concurrent tool calls within one turn (default: 4, 1 = sequential)")
 
     args = parser.parse_args()
 
@@ -2203,7 +6277,16 @@ Examples:
         natterbox_mcp_url=args.mcp_url,
         work_dir=Path(args.work_dir),
         output_dir=Path(args.output_dir),
+        max_parallel_tools=args.max_parallel_tools,
+        persistent_shell=args.persistent_shell,
+        shape_results=not args.no_result_shaping,
+        context_packing=not args.no_context_packing,
+        context_token_budget=args.context_budget,
+        rolling_summary=not args.no_rolling_summary,
+        push_every=args.push_every,
     )
+    if args.summary_model:
+        config.summary_model_id = args.summary_model
 
     # Create and initialize agent
     agent = DocumentationAgent(config)
@@ -2215,13 +6298,29 @@ Examples:
     elif args.continuous:
         # Continuous mode - run until done
         task = args.task or DEFAULT_CONTINUOUS_TASK
-        await run_continuous(agent, task, args.max_iterations)
+        await run_continuous(agent, task, args.max_iterations, args.workers)
+    elif args.tasks_file:
+        tasks = select_tasks(load_tasks(Path(args.tasks_file)), args.only)
+        report = await run_task_file(agent, tasks, args.max_concurrent_tasks)
+        print(json.dumps(report, indent=2))
+        if args.report:
+            Path(args.report).write_text(json.dumps(report, indent=2))
+    elif args.task and args.plan:
+        result, report = await run_planned(agent, args.task, args.max_subtasks, args.max_concurrent_tasks)
+        print(result)
+        if report:
+            print(json.dumps(report, indent=2))
+            if args.report:
+                Path(args.report).write_text(json.dumps(report, indent=2))
     elif args.task:
         result = await agent.run_task(args.task)
         print(result)
     else:
         parser.print_help()
 
+    await agent.shell.close()
+    await agent.mcp.close()
+
 
 if __name__ == "__main__":
     asyncio.run(main())
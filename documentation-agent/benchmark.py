@@ -0,0 +1,603 @@
+#!/usr/bin/env python3
+"""
+Offline benchmark suite for the documentation agent loop.
+
+Drives DocumentationAgent.run_task and run_continuous against local stand-ins
+for Bedrock, the MCP server and the git remote. Sessions are synthetic but use
+realistic tool-result size distributions, so the numbers reflect the cost of
+the agent's own hot loop (history compression, file store I/O, request
+serialization) rather than network or model latency.
+
+Each scenario runs in a fresh child process so peak RSS is per-scenario.
+Results are emitted as JSON.
+
+Usage:
+    python benchmark.py                              # default scenarios, JSON to stdout
+    python benchmark.py --turns 10 100 500 --output bench.json
+    python benchmark.py --compare baseline.json      # exit 1 on regression
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import logging
+import math
+import multiprocessing
+import os
+import platform
+import random
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Any, Callable, Optional
+
+BENCH_DIR = Path(__file__).resolve().parent
+
+# Metrics compared by --compare (dotted paths into a scenario result).
+# Lower is better for all of them.
+REGRESSION_METRICS = [
+    "agent_overhead_ms.p50",
+    "agent_overhead_ms.p95",
+    "compression_ms.total",
+    "file_store.io_ms",
+    "bytes_sent_per_request.mean",
+    "peak_rss_kb",
+]
+
+
+# =============================================================================
+# Synthetic content
+# =============================================================================
+
+WORDS = (
+    "voice routing platform freeswitch dialplan sip trunk carrier failover region "
+    "salesforce omnichannel gateway terraform module deploy release runbook alert "
+    "queue cdr billing tenant policy latency replica cluster service api webhook"
+).split()
+
+
+def _sentence(rng: random.Random, n: int = 12) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(n)).capitalize() + "."
+
+
+def _result_size(rng: random.Random) -> int:
+    """Draw a tool-result size (chars) from a log-normal fit of real sessions."""
+    return int(min(max(rng.lognormvariate(math.log(6000), 1.1), 300), 250_000))
+
+
+def confluence_page(rng: random.Random, page_id: int, size: int) -> str:
+    """Build a Confluence get_page payload with storage-format HTML of ~size chars."""
+    parts = [f"<h1>Page {page_id}</h1>", '<ac:structured-macro ac:name="toc"/>']
+    while sum(len(p) for p in parts) < size:
+        roll = rng.random()
+        if roll < 0.1:
+            parts.append(f"<h2>{_sentence(rng, 4)}</h2>")
+        elif roll < 0.2:
+            rows = "".join(f"<tr><td>{rng.choice(WORDS)}</td><td>{_sentence(rng, 6)}</td></tr>" for _ in range(5))
+            parts.append(f"<table><tbody>{rows}</tbody></table>")
+        elif roll < 0.25:
+            parts.append(
+                '<ac:structured-macro ac:name="code"><ac:parameter ac:name="language">bash</ac:parameter>'
+                f"<ac:plain-text-body><![CDATA[{rng.choice(WORDS)} --region eu-west-2]]></ac:plain-text-body></ac:structured-macro>"
+            )
+        else:
+            parts.append(f"<p>{_sentence(rng, 25)}</p>")
+    page = {
+        "id": str(page_id),
+        "title": f"Page {page_id}",
+        "version": {"number": rng.randint(1, 40), "when": "2025-11-02T10:00:00.000Z"},
+        "body": {"storage": {"value": "".join(parts), "representation": "storage"}},
+        "_links": {"webui": f"/spaces/A/pages/{page_id}", "self": f"https://example.atlassian.net/wiki/rest/api/content/{page_id}"},
+        "_expandable": {"children": "", "descendants": "", "space": "/rest/api/space/A"},
+    }
+    return json.dumps(page)
+
+
+def github_file(rng: random.Random, path: str, size: int) -> str:
+    """Build a GitHub get_file_content payload of ~size chars."""
+    lines = []
+    while sum(len(line) + 1 for line in lines) < size:
+        lines.append(f"    {rng.choice(WORDS)}_{rng.randint(0, 999)} = '{_sentence(rng, 6)}'")
+    return json.dumps({"path": path, "sha": f"{rng.getrandbits(160):040x}", "encoding": "utf-8", "content": "\n".join(lines)})
+
+
+def markdown_doc(rng: random.Random, title: str, size: int) -> str:
+    """Build a markdown document of ~size chars, as the model would write it."""
+    parts = [f"# {title}\n\n**Last Updated:** 2026-01-20\n"]
+    while sum(len(p) for p in parts) < size:
+        if rng.random() < 0.15:
+            parts.append(f"\n## {_sentence(rng, 4)}\n")
+        parts.append(f"\n{_sentence(rng, 30)}\n")
+    return "".join(parts)
+
+
+# =============================================================================
+# Local stand-ins
+# =============================================================================
+
+
+class FakeBedrockRuntime:
+    """
+    Stands in for the boto3 bedrock-runtime client.
+
+    Requests with tools get the next step of the scripted session; requests
+    without tools (commit messages, summaries) get a short text reply. With a
+    session_factory, each conversation (keyed on its task text) gets its own
+    scripted session, for concurrent agents sharing one client.
+    """
+
+    exceptions = SimpleNamespace(ModelTimeoutException=type("ModelTimeoutException", (Exception,), {}))
+
+    def __init__(self, session: "ScriptedSession", latency: float, session_factory: Optional[Callable[[int], "ScriptedSession"]] = None):
+        self.session = session
+        self.session_factory = session_factory
+        self.sessions: dict[str, ScriptedSession] = {}
+        self.latency = latency
+        self.bytes_sent: list[int] = []
+        self.model_seconds = 0.0
+        self.turn_starts: list[float] = []
+
+    def invoke_model(self, modelId: str, body: str, contentType: str, accept: str) -> dict:
+        started = time.perf_counter()
+        self.bytes_sent.append(len(body))
+        request = json.loads(body)
+
+        if request.get("tools"):
+            self.turn_starts.append(started)
+            response = self._session_for(request["messages"]).next_response(request["messages"])
+        else:
+            text = "docs: update documentation" if "commit" in request.get("system", "") else "CONTINUATION: resume with the next page."
+            response = {"content": [{"type": "text", "text": text}], "stop_reason": "end_turn"}
+
+        response.setdefault("usage", {"input_tokens": len(body) // 4, "output_tokens": len(json.dumps(response["content"])) // 4})
+        if self.latency:
+            time.sleep(self.latency)
+        self.model_seconds += time.perf_counter() - started
+        return {"body": io.BytesIO(json.dumps(response).encode())}
+
+    def _session_for(self, messages: list[dict]) -> "ScriptedSession":
+        if self.session_factory is None:
+            return self.session
+        first = messages[0].get("content") if messages else ""
+        first = first if isinstance(first, str) else ""
+        if first.startswith("SOFT RESET"):
+            first = first.split("Previous task: ", 1)[-1]
+        key = first[:300]
+        if key not in self.sessions:
+            self.sessions[key] = self.session_factory(len(self.sessions))
+        return self.sessions[key]
+
+
+class ScriptedSession:
+    """
+    Produces a synthetic session of `turns` model responses.
+
+    Tool mix and result sizes follow what real documentation runs look like:
+    mostly MCP research, some file writes and reads, occasional bash and
+    read_from_store follow-ups on stored results.
+    """
+
+    def __init__(self, turns: int, seed: int):
+        self.turns = turns
+        self.rng = random.Random(seed)
+        self.turn = 0
+        self.session_id = 0
+        self.written: list[str] = []
+
+    def restart(self):
+        self.turn = 0
+        self.session_id += 1
+
+    def _last_file_id(self, messages: list[dict]) -> Optional[str]:
+        last = messages[-1].get("content") if messages else None
+        if isinstance(last, list):
+            for item in last:
+                if isinstance(item, dict) and "file_id" in str(item.get("content", "")):
+                    try:
+                        data = json.loads(item["content"])
+                    except (TypeError, ValueError):
+                        continue
+                    ref = data.get("_file_store_ref") or data
+                    if ref.get("file_id"):
+                        return ref["file_id"]
+        return None
+
+    def _tool_call(self, index: int, messages: list[dict]) -> dict:
+        rng = self.rng
+        call_id = f"toolu_{self.session_id}_{self.turn}_{index}"
+        roll = rng.random()
+        page = self.session_id * 100_000 + self.turn * 10 + index
+
+        if roll < 0.35:
+            return {"type": "tool_use", "id": call_id, "name": "mcp_confluence", "input": {"operation": "get_page", "pageId": str(page)}}
+        if roll < 0.50:
+            return {"type": "tool_use", "id": call_id, "name": "mcp_github", "input": {"operation": "get_file_content", "owner": "redmatter", "repo": "platform", "path": f"src/mod{page}.py"}}
+        if roll < 0.70:
+            path = f"docs/bench/page-{self.session_id}-{self.turn}-{index}.md"
+            self.written.append(path)
+            content = markdown_doc(rng, f"Page {page}", int(min(max(rng.lognormvariate(math.log(3000), 0.6), 500), 20_000)))
+            return {"type": "tool_use", "id": call_id, "name": "write_file", "input": {"path": path, "content": content}}
+        if roll < 0.82 and self.written:
+            return {"type": "tool_use", "id": call_id, "name": "read_file", "input": {"path": rng.choice(self.written)}}
+        if roll < 0.92:
+            return {"type": "tool_use", "id": call_id, "name": "bash", "input": {"command": f"ls docs/bench | wc -l  # {page}", "description": "Count bench pages"}}
+        file_id = self._last_file_id(messages)
+        if file_id:
+            return {"type": "tool_use", "id": call_id, "name": "read_from_store", "input": {"file_id": file_id, "offset": 0, "limit": 10000}}
+        return {"type": "tool_use", "id": call_id, "name": "mcp_confluence", "input": {"operation": "search_pages", "query": f"{rng.choice(WORDS)} {page}"}}
+
+    def next_response(self, messages: list[dict]) -> dict:
+        first = messages[0].get("content") if messages else ""
+        if len(messages) == 1 and isinstance(first, str) and not first.startswith("SOFT RESET"):
+            self.restart()
+
+        self.turn += 1
+        if self.turn >= self.turns:
+            return {"content": [{"type": "text", "text": "All pages written. Task complete."}], "stop_reason": "end_turn"}
+
+        calls = [self._tool_call(i, messages) for i in range(self.rng.choice((1, 1, 2, 3)))]
+        text = {"type": "text", "text": f"Turn {self.turn}: {_sentence(self.rng, 10)}"}
+        return {"content": [text] + calls, "stop_reason": "tool_use"}
+
+
+def make_fake_mcp(agent_module, rng: random.Random, latency: float):
+    """Build an MCPClient stand-in that serves synthetic Confluence/GitHub payloads."""
+
+    class FakeMCPClient(agent_module.MCPClient):
+        def __init__(self):
+            super().__init__("http://mcp.invalid/sse", token_file=Path(os.devnull))
+            self.tool_seconds = 0.0
+
+        async def connect(self) -> bool:
+            for name in ("confluence", "github"):
+                self.tools[name] = {"name": name, "description": f"Synthetic {name}", "inputSchema": {"type": "object", "properties": {"operation": {"type": "string"}}}}
+            return True
+
+        async def call_tool(self, name: str, arguments: dict) -> dict[str, Any]:
+            started = time.perf_counter()
+            if latency:
+                await asyncio.sleep(latency)
+            size = _result_size(rng)
+            if name == "confluence" and arguments.get("operation") == "get_page":
+                text = confluence_page(rng, int(arguments.get("pageId", 0)), size)
+            elif name == "github":
+                text = github_file(rng, arguments.get("path", ""), size)
+            else:
+                text = json.dumps({"results": [{"id": str(rng.randint(1, 10**6)), "title": _sentence(rng, 5), "excerpt": _sentence(rng, 20)} for _ in range(max(1, size // 400))]})
+            self.tool_seconds += time.perf_counter() - started
+            return {"success": True, "result": {"content": [{"type": "text", "text": text}]}}
+
+    return FakeMCPClient()
+
+
+# =============================================================================
+# Instrumentation
+# =============================================================================
+
+
+class Timer:
+    """Accumulates call count and wall time for a wrapped method."""
+
+    def __init__(self):
+        self.calls = 0
+        self.seconds = 0.0
+
+    def wrap(self, obj: Any, name: str):
+        original = getattr(obj, name, None)
+        if original is None:
+            return
+        timer = self
+
+        def timed(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return original(*args, **kwargs)
+            finally:
+                timer.calls += 1
+                timer.seconds += time.perf_counter() - started
+
+        setattr(obj, name, timed)
+
+
+def _stats_ms(values: list[float]) -> dict:
+    if not values:
+        return {"count": 0}
+    ordered = sorted(values)
+    return {
+        "count": len(ordered),
+        "mean": round(statistics.fmean(ordered) * 1000, 3),
+        "p50": round(ordered[len(ordered) // 2] * 1000, 3),
+        "p95": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000, 3),
+        "max": round(ordered[-1] * 1000, 3),
+    }
+
+
+def _stats_bytes(values: list[int]) -> dict:
+    if not values:
+        return {"count": 0}
+    ordered = sorted(values)
+    return {
+        "count": len(ordered),
+        "mean": int(statistics.fmean(ordered)),
+        "p95": ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))],
+        "max": ordered[-1],
+        "total": sum(ordered),
+    }
+
+
+def _dir_bytes(path: Path) -> int:
+    return sum(p.stat().st_size for p in path.rglob("*") if p.is_file())
+
+
+# =============================================================================
+# Scenarios
+# =============================================================================
+
+
+def _init_git_workspace(root: Path) -> Path:
+    """Create a local bare 'remote' and a clone of it to act as the work dir."""
+    remote = root / "remote.git"
+    work = root / "work"
+    git = lambda *args, cwd=root: subprocess.run(["git", *args], cwd=cwd, check=True, capture_output=True, text=True)
+    git("init", "--bare", "-b", "main", str(remote))
+    hook = remote / "hooks" / "post-receive"  # Counts pushes
+    hook.write_text('#!/bin/sh\necho push >> "$GIT_DIR/pushes.log"\n')
+    hook.chmod(0o755)
+    git("clone", str(remote), str(work))
+    git("config", "user.name", "bench", cwd=work)
+    git("config", "user.email", "bench@localhost", cwd=work)
+    git("checkout", "-B", "main", cwd=work)
+    return work
+
+
+def _write_backlog(work: Path, items: int):
+    lines = ["# Documentation Backlog", "", "## Priority 1: Bench", ""]
+    lines += [f"- [ ] `docs/bench/item-{i}.md` - Bench item {i}" for i in range(items)]
+    (work / ".project").mkdir(parents=True, exist_ok=True)
+    (work / ".project" / "BACKLOG.md").write_text("\n".join(lines) + "\n")
+    (work / ".project" / "STATUS.md").write_text("# Status\n\n## Next Up\n\nBench items.\n")
+
+
+def run_scenario(spec: dict) -> dict:
+    """Run one scenario in the current process and return its metrics."""
+    sys.path.insert(0, str(BENCH_DIR))
+    logging.disable(logging.CRITICAL)
+    import agent as agent_module
+
+    rss_after_import = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    with tempfile.TemporaryDirectory(prefix="agent-bench-") as tmp:
+        root = Path(tmp)
+        work = _init_git_workspace(root) if spec["mode"] == "continuous" else root / "work"
+        config = agent_module.Config(
+            bedrock_model_id="bench-model",
+            natterbox_mcp_url="http://mcp.invalid/sse",
+            work_dir=work,
+            output_dir=work / "output",
+        )
+        config.max_turns = spec["turns"] + 5
+
+        # Compression is timed on the class, so worker agents created by the run are measured too
+        agent_timer, compress_timer = Timer(), Timer()
+        agent_timer.wrap(agent_module.DocumentationAgent, "__init__")
+        compress_timer.wrap(agent_module.DocumentationAgent, "_compress_historical_messages")
+        compress_timer.wrap(agent_module.DocumentationAgent, "_pack_context")
+
+        session = ScriptedSession(spec["turns"], seed=spec["seed"])
+        agent = agent_module.DocumentationAgent(config)
+        factory = None
+        if spec.get("workers", 1) > 1:
+
+            def factory(n: int) -> ScriptedSession:
+                worker_session = ScriptedSession(spec["turns"], seed=spec["seed"] + n)
+                worker_session.session_id = 1000 * (n + 1)  # Distinct page paths per worker
+                return worker_session
+        runtime = FakeBedrockRuntime(session, spec["model_latency"], factory)
+        agent.bedrock.client = runtime
+        agent.mcp = make_fake_mcp(agent_module, random.Random(spec["seed"] + 1), spec["tool_latency"])
+
+        # Worker agents share the main agent's file store, so instance wrappers cover them
+        store_timer, read_timer, index_timer = Timer(), Timer(), Timer()
+        store_timer.wrap(agent.file_store, "store")
+        read_timer.wrap(agent.file_store, "read")
+        index_timer.wrap(agent.file_store, "_append_index")
+        index_bytes = [0]
+        append_index = agent.file_store._append_index
+
+        def counting_append_index(file_id):
+            index_path = agent.file_store._index_path()
+            before = index_path.stat().st_size if index_path.exists() else 0
+            append_index(file_id)
+            if index_path.exists():
+                index_bytes[0] += index_path.stat().st_size - before
+
+        agent.file_store._append_index = counting_append_index
+
+        async def drive():
+            await agent.initialize()
+            if spec["mode"] == "continuous":
+                _write_backlog(work, spec["iterations"])
+                subprocess.run(["git", "add", "-A"], cwd=work, check=True, capture_output=True)
+                subprocess.run(["git", "commit", "-m", "bench: seed backlog"], cwd=work, check=True, capture_output=True)
+                subprocess.run(["git", "push", "-u", "origin", "main"], cwd=work, check=True, capture_output=True)
+                config.push_every = spec["push_every"]
+                await agent_module.run_continuous(agent, agent_module.DEFAULT_CONTINUOUS_TASK, spec["iterations"], spec["workers"])
+                return None
+            return await agent.run_task(f"Benchmark session of {spec['turns']} turns")
+
+        started = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            final = asyncio.run(drive())
+        wall = time.perf_counter() - started
+
+        # Per-turn wall time: gaps between successive tool-enabled model calls
+        starts = runtime.turn_starts
+        turn_walls = [b - a for a, b in zip(starts, starts[1:])]
+        model_total = runtime.model_seconds
+        tool_total = agent.mcp.tool_seconds
+        overhead_total = max(wall - model_total - tool_total, 0.0)
+        per_turn_overhead = [max(w - spec["model_latency"] - spec["tool_latency"], 0.0) for w in turn_walls]
+
+        store_dir = work / agent_module.FileStore.STORE_DIR
+        result = {
+            "name": spec["name"],
+            "mode": spec["mode"],
+            "agents": agent_timer.calls,
+            "turns": len(starts),
+            "completed": final is None or "complete" in str(final).lower(),
+            "wall_s": round(wall, 4),
+            "wall_per_turn_ms": _stats_ms(turn_walls),
+            "agent_overhead_ms": {**_stats_ms(per_turn_overhead), "total": round(overhead_total * 1000, 3)},
+            "model_s": round(model_total, 4),
+            "tool_latency_s": round(tool_total, 4),
+            "peak_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+            "rss_after_import_kb": rss_after_import,
+            "file_store": {
+                "store_calls": store_timer.calls,
+                "store_ms": round(store_timer.seconds * 1000, 3),
+                "read_calls": read_timer.calls,
+                "read_ms": round(read_timer.seconds * 1000, 3),
+                "index_saves": index_timer.calls,
+                "index_save_ms": round(index_timer.seconds * 1000, 3),
+                "index_bytes_written": index_bytes[0],
+                "io_ms": round((store_timer.seconds + read_timer.seconds) * 1000, 3),
+                "disk_bytes": _dir_bytes(store_dir) if store_dir.exists() else 0,
+            },
+            "compression_ms": {"calls": compress_timer.calls, "total": round(compress_timer.seconds * 1000, 3)},
+            "bytes_sent_per_request": _stats_bytes(runtime.bytes_sent),
+        }
+        if spec["mode"] == "continuous":
+            log = subprocess.run(["git", "rev-list", "--count", "origin/main"], cwd=work, capture_output=True, text=True)
+            result["remote_commits"] = int(log.stdout.strip() or 0)
+            pushes_log = root / "remote.git" / "pushes.log"
+            result["remote_pushes"] = len(pushes_log.read_text().splitlines()) if pushes_log.exists() else 0
+        return result
+
+
+def _child(spec: dict, queue):
+    try:
+        queue.put(run_scenario(spec))
+    except Exception as e:  # report, don't hang the parent
+        queue.put({"name": spec["name"], "error": f"{type(e).__name__}: {e}"})
+
+
+def run_isolated(spec: dict) -> dict:
+    """Run a scenario in a spawned child process so peak RSS is per-scenario."""
+    ctx = multiprocessing.get_context("spawn")
+    queue = ctx.Queue()
+    proc = ctx.Process(target=_child, args=(spec, queue))
+    proc.start()
+    result = queue.get()
+    proc.join()
+    return result
+
+
+def build_specs(args) -> list[dict]:
+    specs = [
+        {"name": f"run_task_{turns}", "mode": "task", "turns": turns, "seed": args.seed, "model_latency": args.model_latency, "tool_latency": args.tool_latency}
+        for turns in args.turns
+    ]
+    if args.iterations:
+        specs.append(
+            {
+                "name": f"run_continuous_{args.iterations}x{args.continuous_turns}" + (f"_w{args.workers}" if args.workers > 1 else ""),
+                "mode": "continuous",
+                "turns": args.continuous_turns,
+                "iterations": args.iterations,
+                "workers": args.workers,
+                "push_every": args.push_every,
+                "seed": args.seed,
+                "model_latency": args.model_latency,
+                "tool_latency": args.tool_latency,
+            }
+        )
+    return specs
+
+
+# =============================================================================
+# Regression comparison
+# =============================================================================
+
+
+def _lookup(result: dict, dotted: str) -> Optional[float]:
+    value: Any = result
+    for key in dotted.split("."):
+        if not isinstance(value, dict) or key not in value:
+            return None
+        value = value[key]
+    return value if isinstance(value, (int, float)) else None
+
+
+def compare(current: dict, baseline: dict, tolerance: float) -> list[str]:
+    """Return a list of regressions (metric grew by more than tolerance)."""
+    regressions = []
+    base_by_name = {s["name"]: s for s in baseline.get("scenarios", [])}
+    for scenario in current["scenarios"]:
+        base = base_by_name.get(scenario["name"])
+        if not base:
+            continue
+        for metric in REGRESSION_METRICS:
+            now, then = _lookup(scenario, metric), _lookup(base, metric)
+            if now is None or then is None or then <= 0:
+                continue
+            if now > then * (1 + tolerance):
+                regressions.append(f"{scenario['name']}: {metric} {then} -> {now} (+{(now / then - 1) * 100:.0f}%)")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmark for the documentation agent loop")
+    parser.add_argument("--turns", type=int, nargs="*", default=[10, 50, 200, 500], help="Session lengths for run_task scenarios (default: 10 50 200 500; none to skip)")
+    parser.add_argument("--iterations", type=int, default=3, help="Backlog iterations for the run_continuous scenario (0 to skip, default: 3)")
+    parser.add_argument("--continuous-turns", type=int, default=20, help="Turns per run_continuous iteration (default: 20)")
+    parser.add_argument("--workers", type=int, default=1, help="Concurrent backlog workers (git worktrees) in the run_continuous scenario (default: 1)")
+    parser.add_argument("--push-every", type=int, default=5, help="Local commits per push in the run_continuous scenario (default: 5)")
+    parser.add_argument("--model-latency", type=float, default=0.0, help="Simulated model latency per request in seconds (default: 0)")
+    parser.add_argument("--tool-latency", type=float, default=0.0, help="Simulated MCP latency per call in seconds (default: 0)")
+    parser.add_argument("--seed", type=int, default=1234, help="Random seed for synthetic sessions")
+    parser.add_argument("--output", type=str, help="Write JSON results to this file instead of stdout")
+    parser.add_argument("--compare", type=str, help="Baseline JSON to compare against; exits 1 on regression")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed relative growth before a metric counts as regressed (default: 0.25)")
+    args = parser.parse_args()
+
+    results = {
+        "meta": {
+            "timestamp": datetime.now().isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "args": vars(args),
+        },
+        "scenarios": [run_isolated(spec) for spec in build_specs(args)],
+    }
+
+    payload = json.dumps(results, indent=2)
+    if args.output:
+        Path(args.output).write_text(payload + "\n")
+    else:
+        print(payload)
+
+    failed = [s for s in results["scenarios"] if "error" in s]
+    for s in failed:
+        print(f"Scenario {s['name']} failed: {s['error']}", file=sys.stderr)
+
+    if args.compare:
+        regressions = compare(results, json.loads(Path(args.compare).read_text()), args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+    if failed:
+        sys.exit(2)
+
+
+if __name__ == "__main__":
+    main()
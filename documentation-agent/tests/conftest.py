@@ -0,0 +1,63 @@
+"""Shared fixtures: agent.py is a script, so tests import it from the parent directory."""
+
+import logging
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import agent as agent_module  # noqa: E402
+
+logging.disable(logging.CRITICAL)
+
+
+@pytest.fixture
+def work_dir(tmp_path: Path) -> Path:
+    path = tmp_path / "work"
+    path.mkdir()
+    return path
+
+
+@pytest.fixture
+def shell(work_dir: Path) -> agent_module.ShellTool:
+    return agent_module.ShellTool(work_dir)
+
+
+@pytest.fixture
+def file_store(work_dir: Path) -> agent_module.FileStore:
+    return agent_module.FileStore(work_dir)
+
+
+@pytest.fixture
+def agent(work_dir: Path) -> agent_module.DocumentationAgent:
+    """An agent with no network: Bedrock and MCP are never contacted unless a test calls them."""
+    config = agent_module.Config(
+        bedrock_model_id="test-model",
+        natterbox_mcp_url="http://mcp.invalid/sse",
+        work_dir=work_dir,
+        output_dir=work_dir / "output",
+    )
+    return agent_module.DocumentationAgent(config)
+
+
+@pytest.fixture
+def git_remote(tmp_path: Path) -> tuple[Path, Path]:
+    """A local bare repository acting as the remote, and a clone of it with one commit on main."""
+    remote, clone = tmp_path / "remote.git", tmp_path / "clone"
+
+    def git(*args: str, cwd: Path = tmp_path):
+        subprocess.run(["git", *args], cwd=cwd, check=True, capture_output=True, text=True)
+
+    git("init", "--bare", "-b", "main", str(remote))
+    git("clone", str(remote), str(clone))
+    git("config", "user.name", "test", cwd=clone)
+    git("config", "user.email", "test@localhost", cwd=clone)
+    git("checkout", "-B", "main", cwd=clone)
+    (clone / "README.md").write_text("# Docs\n")
+    git("add", "README.md", cwd=clone)
+    git("commit", "-m", "initial", cwd=clone)
+    git("push", "-u", "origin", "main", cwd=clone)
+    return remote, clone
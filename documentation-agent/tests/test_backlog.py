@@ -0,0 +1,71 @@
+"""BACKLOG.md parsing and the backlog priority queue."""
+
+from agent import BacklogQueue
+
+BACKLOG = """# Documentation Backlog
+
+## Priority 1: Core
+
+### Permissions
+- [x] Write `security/roles.md` ✅
+- [ ] Write `security/permissions.md`
+- [ ] Write `security/audit.md` (deferred)
+
+### CI/CD (NEXT UP after Permissions)
+- [ ] Write `cicd/pipeline.md`
+
+## Priority 2: Later
+
+- [ ] Write `services/inventory.md`
+- [ ] Write `services/billing.md` (after `services/inventory.md`)
+"""
+
+
+class TestBacklogQueue:
+    def test_parse(self):
+        items = BacklogQueue.parse(BACKLOG)
+        assert [item.path for item in sorted(items)] == [
+            "security/permissions.md",
+            "services/inventory.md",
+            "cicd/pipeline.md",
+            "services/billing.md",
+            "security/audit.md",
+        ]
+        pipeline = next(item for item in items if item.path == "cicd/pipeline.md")
+        assert pipeline.section == "CI/CD"
+        assert pipeline.next_up and pipeline.after == ["Permissions"]
+        assert pipeline.priority == 1
+        billing = next(item for item in items if item.path == "services/billing.md")
+        assert billing.after == ["services/inventory.md"] and billing.priority == 2
+        assert next(item for item in items if item.path == "security/audit.md").deferred
+
+    def test_blocked_items_wait_and_are_released(self):
+        queue = BacklogQueue(BacklogQueue.parse(BACKLOG))
+        permissions = queue.pop_ready()
+        inventory = queue.pop_ready()
+        assert (permissions.path, inventory.path) == ("security/permissions.md", "services/inventory.md")
+        assert queue.pop_ready() is None
+        assert [item.path for item in queue.waiting()] == ["cicd/pipeline.md", "services/billing.md"]
+
+        assert [item.path for item in queue.finish(inventory)] == ["services/billing.md"]
+        assert queue.pop_ready().path == "services/billing.md"
+
+        # CI/CD also waits on the deferred audit item of the Permissions section
+        assert queue.finish(permissions) == []
+        assert [other.path for other in queue.blockers(queue.waiting()[0])] == ["security/audit.md"]
+        assert [item.path for item in queue.finish(next(item for item in queue.items if item.deferred))] == ["cicd/pipeline.md"]
+        assert queue.waiting() == []
+        assert queue.pop_ready().path == "cicd/pipeline.md"
+
+    def test_deferred_items_only_on_request(self):
+        queue = BacklogQueue(BacklogQueue.parse("- [ ] Big rewrite (complex)\n"))
+        assert queue.pop_ready() is None
+        assert queue.pop_ready(include_deferred=True).text == "Big rewrite (complex)"
+
+    def test_requeue_and_remaining(self):
+        queue = BacklogQueue(BacklogQueue.parse("- [ ] one\n- [ ] two\n"))
+        first = queue.pop_ready()
+        queue.requeue(first)
+        assert queue.pop_ready() is first
+        queue.finish(first)
+        assert [item.text for item in queue.remaining()] == ["two"]
@@ -0,0 +1,269 @@
+"""Context management: incremental compression, relevance-ranked packing, rolling summaries and adaptive inlining."""
+
+import asyncio
+import json
+
+from agent import ContextPacker, PackedUnit, RollingSummarizer
+
+
+def tool_turn(n: int, size: int = 3000):
+    return [
+        {"role": "assistant", "content": [{"type": "tool_use", "id": f"toolu_{n}", "name": "bash", "input": {"command": f"echo {n}"}}]},
+        {"role": "user", "content": [{"type": "tool_result", "tool_use_id": f"toolu_{n}", "content": json.dumps({"output": str(n % 10) * size})}]},
+    ]
+
+
+class TestHistoryCompression:
+    def test_watermark_compacts_each_result_once(self, agent):
+        agent.messages = [{"role": "user", "content": "task"}]
+        for n in range(1, 5):
+            agent.messages.extend(tool_turn(n))
+        agent._compress_historical_messages(keep_recent=2)
+        assert agent._compression_watermark == 2
+        compacted = [json.loads(m["content"][0]["content"]) for m in agent.messages[2::2]]
+        assert [c.get("stored_in_file_store", False) for c in compacted] == [True, True, False, False]
+
+        stored_id = compacted[0]["file_id"]
+        assert json.loads(agent.file_store.read(stored_id, 0, 10**6)["content"])["output"] == "1" * 3000
+
+        agent.messages.extend(tool_turn(5))
+        agent._compress_historical_messages(keep_recent=2)
+        assert agent._compression_watermark == 3
+        assert agent.messages[6]["content"][0]["content"].startswith('{"stored_in_file_store"')
+
+    def test_small_results_are_left_alone(self, agent):
+        agent.messages = [{"role": "user", "content": "task"}, *tool_turn(1, size=10), *tool_turn(2, size=10)]
+        agent._compress_historical_messages(keep_recent=0)
+        assert json.loads(agent.messages[2]["content"][0]["content"]) == {"output": "1" * 10}
+        assert agent._compression_watermark == 2
+
+    def test_replaced_history_restarts_the_scan(self, agent):
+        agent.messages = [{"role": "user", "content": "task"}, *tool_turn(1), *tool_turn(2), *tool_turn(3)]
+        agent._compress_historical_messages(keep_recent=1)
+        agent.messages = [{"role": "user", "content": "fresh"}, *tool_turn(7)]
+        agent._compress_historical_messages(keep_recent=1)
+        assert agent._tool_result_positions == [2] and agent._compression_watermark == 0
+
+
+def unit(packer, key, turn, verbatim_chars=4000, paths=()):
+    target = {"content": "v" * verbatim_chars}
+    packer._add(
+        PackedUnit(
+            key=key,
+            turn=turn,
+            target=target,
+            field="content",
+            variants={"verbatim": "v" * verbatim_chars, "summary": "s" * 600, "reference": "r" * 100},
+            identifiers={key},
+            paths=set(paths),
+        )
+    )
+    return target
+
+
+class TestContextPacker:
+    def test_everything_fits(self):
+        packer = ContextPacker()
+        for n in range(3):
+            unit(packer, f"u{n}", n)
+        stats = packer.pack(turn=3, context_chars=12000, budget_chars=50000, files_written=set(), pinned=set())
+        assert (stats["verbatim"], stats["changed"]) == (3, 0)
+
+    def test_tiers_under_a_tight_budget(self):
+        packer = ContextPacker()
+        targets = {n: unit(packer, f"u{n}", n) for n in range(10)}
+        # 10 x 4000 verbatim plus 1000 fixed; the budget holds two verbatim units and a few summaries.
+        stats = packer.pack(turn=10, context_chars=41000, budget_chars=12000, files_written=set(), pinned={"u0"})
+        assert stats["verbatim"] + stats["summary"] + stats["reference"] == 10
+        assert stats["reference"] > 0 and stats["summary"] > 0
+        assert targets[0]["content"].startswith("v")  # Pinned stays verbatim however old
+        assert targets[9]["content"].startswith("v")  # Most recent scores highest
+        assert targets[1]["content"].startswith("r")
+        packed = sum(len(t["content"]) for t in targets.values())
+        assert 1000 + packed <= 12000
+
+    def test_written_files_and_references_raise_scores(self):
+        packer = ContextPacker()
+        old_but_used = unit(packer, "used", 0, paths={"docs/a.md"})
+        unit(packer, "other", 1)
+        packer.pack(turn=30, context_chars=8000, budget_chars=4500, files_written={"docs/a.md"}, pinned=set())
+        assert old_but_used["content"].startswith("v")
+
+    def test_later_mentions_count_as_references(self):
+        packer = ContextPacker()
+        item = {"type": "tool_result", "tool_use_id": "toolu_1", "content": "x" * 2000}
+        store_info = {"file_id": "abc123", "size_bytes": 2000, "lines": 1}
+        packer.add_tool_result("toolu_1", 1, "read_file", {"path": "docs/a.md"}, item, {"content": "x" * 2000}, store_info)
+        packer.add_tool_result("toolu_2", 1, "bash", {"command": "ls"}, {"content": "y" * 2000}, {"stdout": "y" * 2000}, {**store_info, "file_id": "def456"})
+        assert packer.units["toolu_1"].variants["reference"].startswith('{"stored_in_file_store": true, "file_id": "abc123"')
+
+        packer.note_turn(5, [{"type": "text", "text": "Looking again at docs/a.md."}])
+        assert packer.units["toolu_1"].last_ref_turn == 5 and packer.units["toolu_2"].last_ref_turn == -1
+        assert packer.score(packer.units["toolu_1"], 6, set()) > packer.score(packer.units["toolu_2"], 6, set())
+
+    def test_small_results_are_not_packable(self):
+        packer = ContextPacker()
+        packer.add_tool_result("t", 1, "bash", {}, {"content": "short"}, {}, {"file_id": "f", "size_bytes": 5, "lines": 1})
+        assert packer.units == {}
+
+
+class FakeSummaryModel:
+    """Stands in for BedrockClient.create_message on the summary model."""
+
+    def __init__(self, reply=None, error=None):
+        self.reply, self.error, self.prompts = reply, error, []
+
+    def create_message(self, messages, system, tools, model_id=None, max_tokens=None):
+        self.prompts.append(messages[0]["content"])
+        if self.error:
+            raise self.error
+        reply = self.reply(messages[0]["content"]) if callable(self.reply) else self.reply
+        return {"content": [{"type": "text", "text": reply}]}
+
+
+def numbered_notes(prompt: str) -> str:
+    turns = [line.split(":")[0] for line in prompt.splitlines() if line.startswith("Turn ")]
+    return "\n".join(f"{turn}: did things" for turn in turns)
+
+
+class TestRollingSummarizer:
+    TURNS = [
+        (
+            {"role": "assistant", "content": [{"type": "text", "text": f"Reading page {n}"}, {"type": "tool_use", "name": "read_file", "input": {"path": f"doc{n}.md"}}]},
+            {"role": "user", "content": [{"type": "tool_result", "content": f"content of doc{n}"}]},
+        )
+        for n in range(1, 4)
+    ]
+
+    def test_one_note_per_turn(self):
+        summarizer = RollingSummarizer(FakeSummaryModel(numbered_notes), "small-model")
+        transcript, fallbacks = summarizer.render_transcript(self.TURNS)
+        assert "Turn 2:" in transcript and "content of doc2" in transcript
+        assert fallbacks[0] == 'Turn 1: Reading page 1 [read_file({"path": "doc1.md"})]'
+        assert summarizer.summarize_turns(transcript, fallbacks) == ["Turn 1: did things", "Turn 2: did things", "Turn 3: did things"]
+
+    def test_turn_numbers_continue_after_a_fold(self):
+        summarizer = RollingSummarizer(FakeSummaryModel("x"), "small-model")
+        summarizer.turns_folded = 10
+        assert summarizer.render_transcript(self.TURNS[:1])[1][0].startswith("Turn 11:")
+
+    def test_unexpected_reply_is_kept_whole(self):
+        summarizer = RollingSummarizer(FakeSummaryModel("One paragraph about all three turns."), "small-model")
+        assert summarizer.summarize_turns(*summarizer.render_transcript(self.TURNS)) == ["One paragraph about all three turns."]
+
+    def test_model_failure_falls_back_to_extracts_once(self):
+        model = FakeSummaryModel(error=RuntimeError("throttled"))
+        summarizer = RollingSummarizer(model, "small-model")
+        transcript, fallbacks = summarizer.render_transcript(self.TURNS)
+        assert summarizer.summarize_turns(transcript, fallbacks) == fallbacks
+        assert summarizer.fold_phase(["Turn 1: a", "Turn 2: b"]) == "Turn 1: a Turn 2: b"
+        assert len(model.prompts) == 1  # No retry against a failing model
+
+    def test_render(self):
+        summarizer = RollingSummarizer(FakeSummaryModel("x"), "small-model")
+        assert summarizer.render() == ""
+        summarizer.phases, summarizer.turn_notes = ["Researched billing."], ["Turn 9: wrote billing.md"]
+        rendered = summarizer.render()
+        assert "### Phase 1\nResearched billing." in rendered and "- Turn 9: wrote billing.md" in rendered
+
+
+class TestRollingSummaryInTheAgent:
+    def test_aged_turns_are_folded_into_the_head(self, agent):
+        agent.summarizer = RollingSummarizer(FakeSummaryModel(numbered_notes), "small-model")
+        agent.config.summary_keep_turns = 2
+        agent.messages = [{"role": "user", "content": "task"}]
+        for n in range(1, 6):
+            agent.messages.extend(tool_turn(n))
+        agent._context_chars = agent.config.context_token_budget * 4  # At the budget
+
+        async def fold():
+            agent._schedule_rolling_summary()
+            await agent._summary_task
+            agent._apply_rolling_summary()
+
+        asyncio.run(fold())
+        assert len(agent.messages) == 1 + 2 * 2  # Head plus the kept turns
+        assert agent.messages[1]["content"][0]["id"] == "toolu_4"
+        assert agent.summarizer.turns_folded == 3
+        assert agent.messages[0]["content"].startswith("task\n\n## Progress so far")
+        assert "Turn 3: did things" in agent.messages[0]["content"]
+
+    def test_fold_is_dropped_if_history_moved(self, agent):
+        agent.summarizer = RollingSummarizer(FakeSummaryModel(numbered_notes), "small-model")
+        agent.config.summary_keep_turns = 1
+        agent.messages = [{"role": "user", "content": "task"}, *tool_turn(1), *tool_turn(2)]
+        agent._context_chars = agent.config.context_token_budget * 4
+
+        async def fold():
+            agent._schedule_rolling_summary()
+            await agent._summary_task
+            agent.messages = [{"role": "user", "content": "new task"}]  # Soft reset meanwhile
+            agent._apply_rolling_summary()
+
+        asyncio.run(fold())
+        assert agent.messages == [{"role": "user", "content": "new task"}]
+        assert agent.summarizer.turns_folded == 0
+
+    def test_dropping_history_forgets_memoized_reads(self, agent, work_dir):
+        (work_dir / "a.md").write_text("hello")
+        agent.shell.read_file("a.md")
+        agent.shell.remember_result("read_file", "a.md", "fid", "toolu_1")
+        agent.messages = [{"role": "user", "content": "task"}, *tool_turn(1), *tool_turn(2)]
+        agent._drop_history(1, 2)
+        assert agent.shell.read_file("a.md")["content"] == "hello"
+
+
+class TestAdaptiveInlining:
+    def test_threshold_follows_the_kind_prior(self, agent):
+        read, _ = agent._inline_threshold(agent._result_kind("read_file", {"path": "a.md"}))
+        search, _ = agent._inline_threshold(agent._result_kind("mcp_confluence", {"operation": "search"}))
+        page, _ = agent._inline_threshold(agent._result_kind("mcp_confluence", {"operation": "get_page"}))
+        assert search < page < read <= agent.INLINE_MAX_CHARS
+
+    def test_threshold_shrinks_with_headroom(self, agent):
+        roomy, _ = agent._inline_threshold("bash")
+        agent._context_chars = agent.config.context_token_budget * 4 - 1000
+        tight, why = agent._inline_threshold("bash")
+        assert tight == agent.INLINE_MIN_CHARS < roomy
+        assert "headroom=1,000" in why
+
+    def test_fetched_references_raise_the_threshold(self, agent):
+        kind = "mcp_confluence:search"
+        before, _ = agent._inline_threshold(kind)
+        big = {"output": "x" * (before + 1000)}
+        ids = [agent._truncate_result(dict(big, n=i), "mcp_confluence", kind)["file_id"] for i in range(2)]
+        assert agent._inline_stats[kind] == {"referenced": 2, "fetched": 0}
+        lowered, _ = agent._inline_threshold(kind)
+
+        for file_id in ids * 2:  # Repeat reads of one result count once
+            agent._note_store_read(file_id)
+        assert agent._inline_stats[kind] == {"referenced": 2, "fetched": 2}
+        raised, _ = agent._inline_threshold(kind)
+        assert lowered < before < raised
+
+    def test_inlined_results_use_up_headroom(self, agent):
+        result = agent._truncate_result({"output": "y" * 20000}, "bash", "bash")
+        assert "_file_store_ref" in result
+        assert agent._context_chars > 20000
+
+    def test_results_without_a_kind_use_the_fixed_threshold(self, agent):
+        agent._context_chars = agent.config.context_token_budget * 4  # No headroom left
+        result = agent._truncate_result({"output": "z" * 20000}, "bash")
+        assert "_file_store_ref" in result
+
+
+class TestNearDuplicateResults:
+    DOC = "\n".join(f"Line {i}: the service handles request {i} with the standard retry policy." for i in range(120))
+
+    def test_near_duplicate_diff_only_while_base_is_in_context(self, agent):
+        first = agent._truncate_result({"success": True, "content": self.DOC}, "read_file")
+        agent.messages = [{"role": "user", "content": [{"type": "tool_result", "tool_use_id": "t1", "content": json.dumps(first)}]}]
+
+        edited = self.DOC.replace("Line 60: the", "Line 60: EDITED the")
+        reply = agent._truncate_result({"success": True, "content": edited}, "read_file")
+        assert reply["near_duplicate_of"] == first["_file_store_ref"]["file_id"]
+        assert "content" not in reply and "+Line 60: EDITED" in reply["diff"]
+
+        agent.messages = []  # Base packed or dropped since
+        again = agent._truncate_result({"success": True, "content": edited.replace("EDITED", "AGAIN")}, "read_file")
+        assert again["content"].startswith("Line 0") and "near_duplicate_of" not in again
@@ -0,0 +1,132 @@
+"""FileStore: deduplication, near-duplicate deltas and skeleton previews of oversized content."""
+
+import json
+
+from agent import FileStore
+
+
+def document(changes: dict[int, str] = {}, lines: int = 300) -> str:
+    rows = [f"Line {i}: the service handles request {i} with the standard retry policy and logging." for i in range(lines)]
+    for at, text in changes.items():
+        rows[at] = text
+    return "\n".join(rows)
+
+
+class TestDedup:
+    def test_identical_content_shares_an_id(self, file_store):
+        first = file_store.store("same content", "a")
+        again = file_store.store("same content", "b")
+        assert again["file_id"] == first["file_id"] and again["deduplicated"]
+        assert len(file_store.list_files()["files"]) == 1
+
+
+class TestNearDuplicates:
+    def test_delta_round_trip(self, file_store):
+        base = file_store.store(document(), "mcp_confluence")
+        edited = document({50: "Line 50: CHANGED", 120: "a replaced line"})
+        stored = file_store.store(edited, "mcp_confluence")
+
+        assert stored["near_duplicate_of"] == base["file_id"]
+        assert 0.9 < stored["similarity"] < 1
+        assert "+Line 50: CHANGED" in stored["diff"]
+        assert (file_store.store_path / f"{stored['file_id']}.delta.json").exists()
+        assert not (file_store.store_path / f"{stored['file_id']}.txt").exists()
+        assert file_store.read(stored["file_id"], 0, 10**6)["content"] == edited
+
+    def test_delta_survives_reload_and_chains(self, file_store, work_dir):
+        file_store.store(document(), "x")
+        second = document({10: "second edit"})
+        second_id = file_store.store(second, "x")["file_id"]
+
+        reloaded = FileStore(work_dir)
+        third = document({10: "second edit", 200: "third edit"})
+        third_info = reloaded.store(third, "x")
+        assert third_info.get("near_duplicate_of")  # Deltas are only taken against full entries
+        assert reloaded.read(second_id, 0, 10**6)["content"] == second
+        assert reloaded.read(third_info["file_id"], 0, 10**6)["content"] == third
+
+    def test_unrelated_and_small_content_are_stored_whole(self, file_store):
+        file_store.store(document(), "x")
+        unrelated = "\n".join(f"completely different text {i} about billing exports" for i in range(300))
+        assert "near_duplicate_of" not in file_store.store(unrelated, "x")
+        file_store.store("short " * 50, "x")
+        assert "near_duplicate_of" not in file_store.store("short " * 49 + "long", "x")
+
+    def test_raw_copies_are_never_bases(self, file_store):
+        file_store.store(document(), "mcp_confluence (raw)")
+        assert "near_duplicate_of" not in file_store.store(document({5: "edit"}), "mcp_confluence")
+
+
+class TestPreviews:
+    def test_preview_for_oversized_json(self, file_store):
+        payload = {"results": [{"id": str(i), "title": f"Page {i}", "body": "text " * 400} for i in range(30)]}
+        info = file_store.store(json.dumps(payload), "mcp_confluence", "json")
+        assert info["size_bytes"] > FileStore.INLINE_THRESHOLD
+        assert "results" in info["preview"] and len(info["preview"]) <= FileStore.PREVIEW_CHARS + 100
+
+    def test_mcp_text_parts_are_unwrapped(self):
+        page = {"title": "Billing", "body": "# Overview\n" + "detail " * 500}
+        wrapped = json.dumps({"content": [{"type": "text", "text": json.dumps(page)}]})
+        preview = FileStore.build_preview(wrapped, "json")
+        assert 'title: str(7) "Billing"' in preview
+        assert "# Overview" in preview
+
+    def test_text_preview_has_outline_and_first_paragraph(self):
+        text = "# Title\n\nThe first paragraph.\n\n## Section\n\nMore text.\n"
+        preview = FileStore.build_preview(text)
+        assert "Outline:\n# Title\n## Section" in preview
+        assert "First paragraph:\nThe first paragraph." in preview
+
+    def test_small_content_has_no_preview(self, file_store):
+        assert "preview" not in file_store.store("small", "t")
+
+    def test_duplicate_of_oversized_content_carries_the_preview(self, file_store, work_dir):
+        text = "# Heading\n\n" + "word " * 20000
+        first = file_store.store(text, "t")
+        again = FileStore(work_dir).store(text, "t")
+        assert again["deduplicated"] and again["preview"] == first["preview"]
+
+    def test_preview_is_kept_beside_the_content(self, file_store):
+        text = "# Heading\n\n" + "word " * 20000
+        info = file_store.store(text, "t")
+        assert file_store._preview_path(info["file_id"]).read_text() == info["preview"]
+        assert "preview" not in file_store._index[info["file_id"]]
+
+    def test_unknown_id(self, file_store):
+        assert "error" in file_store.read("nope")
+
+
+class TestIndex:
+    def test_each_store_appends_one_compact_line(self, file_store, work_dir):
+        ids = [file_store.store(f"content {i} " * 1000, "t")["file_id"] for i in range(3)]
+        lines = file_store._index_path().read_text().splitlines()
+        assert [json.loads(line)["file_id"] for line in lines] == ids
+        assert all(": " not in line and "preview" not in line for line in lines)
+
+        file_store.store("content 0 " * 1000, "t")  # A duplicate adds nothing
+        assert len(file_store._index_path().read_text().splitlines()) == 3
+        assert FileStore(work_dir).read(ids[1], 0, 10)["content"] == "content 1 "
+
+    def test_torn_last_line_is_skipped(self, file_store, work_dir):
+        file_id = file_store.store("kept", "t")["file_id"]
+        with file_store._index_path().open("a") as f:
+            f.write('{"file_id":"half')
+        assert [entry["file_id"] for entry in FileStore(work_dir).list_files()["files"]] == [file_id]
+
+    def test_legacy_index_is_migrated(self, work_dir):
+        store_path = work_dir / FileStore.STORE_DIR
+        store_path.mkdir()
+        (store_path / "abc.txt").write_text("old content")
+        meta = {"source": "t", "content_type": "text", "content_hash": "h", "size": 11, "lines": 1, "created": "2026-01-01", "path": ".agent-store/abc.txt", "preview": "P"}
+        (store_path / "index.json").write_text(json.dumps({"abc": meta}, indent=2))
+
+        store = FileStore(work_dir)
+        assert store.read("abc")["content"] == "old content"
+        assert (store_path / "abc.preview.txt").read_text() == "P"
+        assert not (store_path / "index.json").exists() and store._index_path().exists()
+
+    def test_clear_empties_the_index(self, file_store, work_dir):
+        info = file_store.store("# Big\n\n" + "word " * 20000, "t")
+        file_store.clear()
+        assert not file_store._preview_path(info["file_id"]).exists()
+        assert FileStore(work_dir).list_files()["files"] == []
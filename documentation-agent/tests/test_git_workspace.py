@@ -0,0 +1,89 @@
+"""GitWorkspace against a local bare remote: worktrees, fast-forward merges and batched pushes."""
+
+import subprocess
+
+from agent import GitWorkspace
+
+
+def remote_log(remote) -> list[str]:
+    out = subprocess.run(["git", "log", "--format=%s", "main"], cwd=remote, capture_output=True, text=True, check=True)
+    return out.stdout.split("\n")[:-1]
+
+
+def test_is_repo(git_remote, tmp_path):
+    _, clone = git_remote
+    assert GitWorkspace(clone).is_repo()
+    assert not GitWorkspace(tmp_path).is_repo()
+
+
+def test_pushes_are_batched(git_remote):
+    remote, clone = git_remote
+    workspace = GitWorkspace(clone, push_every=3)
+    for n in range(2):
+        (clone / f"doc{n}.md").write_text(str(n))
+        assert workspace.commit(f"doc {n}")
+        assert workspace.push()
+    assert workspace.unpushed == 2 and workspace.pushes == 0
+    assert remote_log(remote) == ["initial"]
+
+    (clone / "doc2.md").write_text("2")
+    workspace.commit("doc 2")
+    assert workspace.push()
+    assert (workspace.unpushed, workspace.pushes) == (0, 1)
+    assert remote_log(remote) == ["doc 2", "doc 1", "doc 0", "initial"]
+
+
+def test_force_push_flushes_remainder(git_remote):
+    remote, clone = git_remote
+    workspace = GitWorkspace(clone, push_every=10)
+    (clone / "a.md").write_text("a")
+    workspace.commit("a")
+    assert workspace.push(force=True)
+    assert remote_log(remote)[0] == "a"
+    assert workspace.push(force=True) and workspace.pushes == 1  # Nothing left, no second push
+
+
+def test_nothing_to_commit_is_not_counted(git_remote):
+    _, clone = git_remote
+    workspace = GitWorkspace(clone)
+    assert workspace.commit("empty")
+    assert workspace.unpushed == 0
+
+
+def test_worktree_merges_by_fast_forward(git_remote):
+    remote, clone = git_remote
+    workspace = GitWorkspace(clone, push_every=5)
+    first, second = workspace.add_worktree("item-a"), workspace.add_worktree("item-b")
+    assert first == clone / ".agent-worktrees" / "item-a"
+    assert workspace.add_worktree("item-a") == first  # Reused when resuming
+
+    (first / "a.md").write_text("a")
+    workspace.commit("item a", cwd=first)
+    (second / "b.md").write_text("b")
+    workspace.commit("item b", cwd=second)
+    assert workspace.unpushed == 0  # Worktree commits are not on main yet
+
+    assert workspace.merge_worktree("item-a") and workspace.merge_worktree("item-b")
+    assert workspace.unpushed == 2
+    assert (clone / "a.md").exists() and (clone / "b.md").exists()
+    status = subprocess.run(["git", "status", "--porcelain"], cwd=clone, capture_output=True, text=True).stdout
+    assert ".agent-worktrees" not in status  # Excluded from the main checkout
+
+    workspace.remove_worktree("item-a")
+    assert not first.exists()
+    assert workspace.push(force=True)
+    assert remote_log(remote)[:2] == ["item b", "item a"]
+
+
+def test_conflicting_worktree_is_left_alone(git_remote):
+    _, clone = git_remote
+    workspace = GitWorkspace(clone)
+    path = workspace.add_worktree("item-c")
+    (path / "README.md").write_text("worktree\n")
+    workspace.commit("worktree edit", cwd=path)
+    (clone / "README.md").write_text("main\n")
+    workspace.commit("main edit")
+
+    assert not workspace.merge_worktree("item-c")
+    assert (clone / "README.md").read_text() == "main\n"
+    assert (path / "README.md").read_text() == "worktree\n"
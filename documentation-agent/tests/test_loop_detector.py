@@ -0,0 +1,55 @@
+"""Streaming loop detection and the file store access log it relies on."""
+
+from agent import LoopDetector
+
+
+def feed(detector, calls):
+    reasons = [detector.observe(name, tool_input, result) for name, tool_input, result in calls]
+    return next((r for r in reasons if r), None), reasons
+
+
+class TestLoopDetector:
+    def test_exact_period_one(self):
+        detector = LoopDetector(max_period=5, repeats=3)
+        reason, reasons = feed(detector, [("bash", {"command": "ls"}, {"output": "same"})] * 6)
+        assert reason == "the same 1-call pattern repeated 6 times"
+        assert reasons.index(reason) == 5  # Needs max_period matching calls before it triggers
+
+    def test_exact_period_two(self):
+        detector = LoopDetector(max_period=5, repeats=3)
+        calls = [("read_file", {"path": "a.md"}, {"c": 1}), ("bash", {"command": "ls"}, {"c": 2})] * 4
+        reason, _ = feed(detector, calls)
+        assert reason and "2-call pattern" in reason
+
+    def test_fuzzy_period_needs_stale_results(self):
+        detector = LoopDetector(max_period=5, repeats=3)
+        stale = [("read_from_store", {"file_id": "f", "offset": 100 * i}, {"content": "same"}) for i in range(8)]
+        reason, _ = feed(detector, stale)
+        assert reason and reason.startswith("a near-identical 1-call pattern")
+
+        detector.reset()
+        fresh = [("read_from_store", {"file_id": "f", "offset": 100 * i}, {"content": f"chunk {i}"}) for i in range(8)]
+        assert feed(detector, fresh)[0] is None  # Advancing offsets over new data is progress
+
+    def test_rereads_of_stored_data(self):
+        detector = LoopDetector(max_rereads=4)
+        calls = [("read_from_store", {"file_id": f"f{i}"}, {"content": str(i), "previously_read_pct": 100}) for i in range(4)]
+        reason, _ = feed(detector, calls)
+        assert reason == "4 consecutive re-reads of file store data already read"
+
+    def test_a_new_read_resets_the_reread_count(self):
+        detector = LoopDetector(max_rereads=3)
+        calls = [("read_from_store", {"file_id": f"f{i}"}, {"content": str(i), "previously_read_pct": 0 if i == 2 else 95}) for i in range(5)]
+        assert feed(detector, calls)[0] is None
+
+    def test_varied_calls_never_trigger(self):
+        detector = LoopDetector()
+        calls = [("read_file", {"path": f"doc{i}.md"}, {"content": str(i)}) for i in range(50)]
+        assert feed(detector, calls)[0] is None
+
+
+def test_previously_read_pct(file_store):
+    file_id = file_store.store("x" * 1000, "t")["file_id"]
+    assert "previously_read_pct" not in file_store.read(file_id, 0, 500)
+    assert file_store.read(file_id, 250, 500)["previously_read_pct"] == 50
+    assert file_store.read(file_id, 0, 1000)["previously_read_pct"] == 75
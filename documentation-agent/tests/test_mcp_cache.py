@@ -0,0 +1,65 @@
+"""MCPClient response cache: read-only calls are cached, writes invalidate them."""
+
+import asyncio
+
+import pytest
+
+from agent import MCPClient
+
+
+@pytest.fixture
+def client(monkeypatch, tmp_path):
+    """A client whose requests are counted instead of sent; a call with delay=True yields before answering."""
+    mcp = MCPClient("http://mcp.invalid/sse", token_file=tmp_path / "tokens.json")
+    mcp.sent = []
+
+    async def fake_call(name: str, arguments: dict) -> dict:
+        mcp.sent.append((name, arguments.get("operation")))
+        if arguments.get("delay"):
+            await asyncio.sleep(0.02)
+        return {"success": not arguments.get("fail"), "n": len(mcp.sent)}
+
+    monkeypatch.setattr(mcp, "_call_tool_uncached", fake_call)
+    return mcp
+
+
+def test_read_only_calls_are_cached(client):
+    async def run():
+        first = await client.call_tool("confluence", {"operation": "get_page", "page_id": "1"})
+        again = await client.call_tool("confluence", {"operation": "get_page", "page_id": "1"})
+        return first, again
+
+    first, again = asyncio.run(run())
+    assert first == again and len(client.sent) == 1 and client.cache_hits == 1
+
+
+def test_successful_write_drops_that_tools_responses(client):
+    async def run():
+        await client.call_tool("confluence", {"operation": "get_page", "page_id": "1"})
+        await client.call_tool("github", {"operation": "get_file_content", "path": "a.md"})
+        await client.call_tool("confluence", {"operation": "update_page", "page_id": "1", "fail": True})
+        await client.call_tool("confluence", {"operation": "get_page", "page_id": "1"})  # Failed write: still cached
+        await client.call_tool("confluence", {"operation": "update_page", "page_id": "1"})
+        await client.call_tool("confluence", {"operation": "get_page", "page_id": "1"})
+        await client.call_tool("github", {"operation": "get_file_content", "path": "a.md"})
+
+    asyncio.run(run())
+    assert client.sent == [
+        ("confluence", "get_page"),
+        ("github", "get_file_content"),
+        ("confluence", "update_page"),
+        ("confluence", "update_page"),
+        ("confluence", "get_page"),
+    ]
+
+
+def test_read_racing_a_write_is_not_cached(client):
+    async def run():
+        await asyncio.gather(
+            client.call_tool("confluence", {"operation": "get_page", "page_id": "1", "delay": True}),
+            client.call_tool("confluence", {"operation": "update_page", "page_id": "1"}),
+        )
+        await client.call_tool("confluence", {"operation": "get_page", "page_id": "1", "delay": True})
+
+    asyncio.run(run())
+    assert [operation for _, operation in client.sent].count("get_page") == 2
@@ -0,0 +1,83 @@
+"""Plan mode: splitting a task into sub-tasks and integrating their SUMMARY blocks."""
+
+import asyncio
+import json
+
+import agent as agent_module
+from agent import SessionTranscript, _extract_summary, plan_subtasks, run_planned
+
+
+class FakePlanner:
+    def __init__(self, reply=None, error=None):
+        self.reply, self.error = reply, error
+
+    def create_message(self, messages, system, tools, **kwargs):
+        if self.error:
+            raise self.error
+        return {"content": [{"type": "text", "text": self.reply}]}
+
+
+def plan(*subtasks) -> str:
+    return "Here is the plan:\n" + json.dumps({"subtasks": list(subtasks)}) + "\nGood luck."
+
+
+class TestPlanSubtasks:
+    def test_ids_are_slugged_and_dependencies_point_backwards(self, agent):
+        agent.bedrock = FakePlanner(
+            plan(
+                {"id": "Call Recording", "description": "Recording docs", "task": "write recording.md", "depends_on": ["billing"]},
+                {"id": "billing", "task": "write billing.md", "depends_on": "call-recording"},
+                {"id": "billing", "task": "write billing-faq.md"},
+                {"id": "no-task"},
+            )
+        )
+        subtasks = asyncio.run(plan_subtasks(agent, "document the platform"))
+        assert list(subtasks) == ["call-recording", "billing", "billing-2"]
+        assert subtasks["call-recording"]["depends_on"] == []  # Forward reference dropped
+        assert subtasks["billing"] == {"description": "billing", "task": "write billing.md", "depends_on": ["call-recording"]}
+
+    def test_max_subtasks(self, agent):
+        agent.bedrock = FakePlanner(plan(*({"id": f"p{i}", "task": f"t{i}"} for i in range(10))))
+        assert len(asyncio.run(plan_subtasks(agent, "task", max_subtasks=3))) == 3
+
+    def test_no_split(self, agent):
+        agent.bedrock = FakePlanner(plan({"id": "only", "task": "everything"}))
+        assert asyncio.run(plan_subtasks(agent, "task")) == {}
+        agent.bedrock = FakePlanner("I would rather not.")
+        assert asyncio.run(plan_subtasks(agent, "task")) == {}
+        agent.bedrock = FakePlanner(error=RuntimeError("throttled"))
+        assert asyncio.run(plan_subtasks(agent, "task")) == {}
+
+
+def test_extract_summary():
+    text = 'Done.\n\nSUMMARY: {"files": ["a.md"], "notes": "ok"}'
+    assert _extract_summary(text) == {"files": ["a.md"], "notes": "ok"}
+    assert _extract_summary("no summary here") is None
+    assert _extract_summary("SUMMARY: {broken") is None
+
+
+def test_run_planned_hands_summaries_to_the_integration_turn(agent, monkeypatch):
+    agent.bedrock = FakePlanner(plan({"id": "a", "task": "write a.md"}, {"id": "b", "task": "write b.md", "depends_on": ["a"]}))
+    prompts: list[str] = []
+
+    async def fake_initialize(self):
+        return True
+
+    async def fake_run_task(self, task: str) -> str:
+        self.transcript = SessionTranscript(self.file_store.store_path, task)
+        prompts.append(task)
+        if task.startswith("You are one of several agents"):
+            part = "a" if "Your sub-task (a)" in task else "b"
+            return f'Finished.\nSUMMARY: {{"files": ["{part}.md"], "summary": "wrote {part}"}}'
+        return "integrated"
+
+    monkeypatch.setattr(agent_module.DocumentationAgent, "initialize", fake_initialize)
+    monkeypatch.setattr(agent_module.DocumentationAgent, "run_task", fake_run_task)
+    result, report = asyncio.run(run_planned(agent, "document the platform"))
+
+    assert result == "integrated"
+    assert "Other agents are handling: b (b)" in prompts[0]
+    integration = prompts[-1]
+    assert integration.startswith("Concurrent sub-agents have finished")
+    assert '"summary": "wrote a"' in integration and '"summary": "wrote b"' in integration
+    assert set(report["tasks"]) == {"a", "b"} and "integration" in report
@@ -0,0 +1,138 @@
+"""ResearchCache: version pinning from MCP results, invalidation, re-checks and recall."""
+
+import asyncio
+import json
+
+import pytest
+
+from agent import ResearchCache
+
+
+def mcp_result(payload) -> dict:
+    return {"success": True, "result": {"content": [{"type": "text", "text": json.dumps(payload)}]}}
+
+
+def confluence_page(page_id: str, version: int) -> dict:
+    return mcp_result({"id": page_id, "title": "Recording", "version": {"number": version}})
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return ResearchCache(tmp_path)
+
+
+class TestVersions:
+    def test_confluence_and_github_versions(self, cache):
+        cache.observe("confluence", {"operation": "search"}, mcp_result({"results": [{"id": "12", "version": {"number": 3}}]}))
+        cache.observe("github", {"owner": "acme", "repo": "svc"}, mcp_result({"tree": [{"path": "README.md", "sha": "abc"}]}))
+        assert cache.versions == {"confluence:12": "3", "github:acme/svc:README.md": "abc"}
+
+    def test_failed_results_are_ignored(self, cache):
+        cache.observe("confluence", {}, {"success": False, "error": "boom"})
+        cache.observe("confluence", {}, {"success": True, "result": {"content": [{"type": "text", "text": "not json"}]}})
+        assert cache.versions == {}
+
+    def test_change_invalidates(self, cache):
+        cache.observe("confluence", {}, confluence_page("12", 3))
+        cache.remember("recording", ["Stored in S3"], ["confluence:12"])
+        cache.observe("confluence", {}, confluence_page("12", 3))
+        assert cache.recall("recording")["results"][0]["facts"] == ["Stored in S3"]
+
+        cache.observe("confluence", {}, confluence_page("12", 4))
+        result = cache.recall("recording")["results"][0]
+        assert "facts" not in result and result["stale"] == ["confluence:12 changed (3 -> 4)"]
+
+    def test_unversioned_source_goes_stale_when_seen(self, cache):
+        result = cache.remember("recording", ["Stored in S3"], ["confluence:12"])
+        assert result["unversioned_sources"] == ["confluence:12"]
+        cache.observe("confluence", {}, confluence_page("12", 1))
+        assert cache.recall("recording")["results"][0]["stale"] == ["confluence:12 was unversioned when remembered, now at 1"]
+
+    def test_remembering_a_stale_topic_starts_over(self, cache):
+        cache.observe("confluence", {}, confluence_page("12", 3))
+        cache.remember("recording", ["old fact"], ["confluence:12"])
+        cache.observe("confluence", {}, confluence_page("12", 4))
+        cache.remember("recording", ["new fact"], ["confluence:12"])
+        result = cache.recall("recording")["results"][0]
+        assert result["facts"] == ["new fact"] and result["sources"][0]["version"] == "4"
+
+
+class TestRememberAndRecall:
+    def test_bad_sources_and_empty_facts_are_rejected(self, cache):
+        assert not cache.remember("x", ["fact"], ["https://wiki/page/12"])["success"]
+        assert not cache.remember("x", [], ["confluence:12"])["success"]
+        assert cache.entries == {}
+
+    def test_facts_accumulate_without_duplicates(self, cache):
+        cache.remember("Call Recording", ["a", "b"], [])
+        cache.remember("call recording!", ["b", "c"], [])
+        assert cache.recall("CALL RECORDING")["results"][0]["facts"] == ["a", "b", "c"]
+        cache.remember("call recording", ["d"], [], replace=True)
+        assert cache.recall("call recording")["results"][0]["facts"] == ["d"]
+
+    def test_fuzzy_recall_and_listing(self, cache):
+        cache.remember("call recording service", ["a"], [])
+        cache.remember("billing service", ["b"], [])
+        cache.remember("sms gateway", ["c"], [])
+        topics = [r["topic"] for r in cache.recall("recording service")["results"]]
+        assert topics == ["call recording service", "billing service"]
+        assert not cache.recall("voicemail")["found"]
+        assert {t["topic"] for t in cache.recall()["topics"]} == {"call recording service", "billing service", "sms gateway"}
+
+    def test_facts_of_unverified_sources_are_withheld(self, cache):
+        cache.observe("confluence", {}, confluence_page("12", 3))
+        cache.remember("recording", ["a"], ["confluence:12", "confluence:13"])
+        result = cache.recall("recording")["results"][0]
+        assert "facts" not in result and result["unverified"] == ["confluence:13"]
+        cache.observe("confluence", {}, confluence_page("13", 1))
+        assert "stale" in cache.recall("recording")["results"][0]  # Unversioned when remembered
+
+    def test_persisted_with_cited_versions_only(self, cache, tmp_path):
+        cache.observe("confluence", {}, mcp_result([{"id": "12", "version": {"number": 3}}, {"id": "99", "version": {"number": 1}}]))
+        cache.remember("recording", ["a"], ["confluence:12"])
+        assert [p.name for p in tmp_path.iterdir()] == ["research.json"]  # No temp file left behind
+        reloaded = ResearchCache(tmp_path)
+        assert reloaded.versions == {"confluence:12": "3"}
+        assert reloaded.recall("recording")["results"][0]["unverified"] == ["confluence:12"]  # A new run checks again
+
+
+class TestRecheck:
+    def test_pending_checks_once_per_run(self, cache, tmp_path):
+        cache.observe("confluence", {}, confluence_page("12", 3))
+        cache.remember("recording", ["a"], ["confluence:12", "github:acme/svc:docs/a.md"])
+        cache.remember("billing", ["b"], [])
+        reloaded = ResearchCache(tmp_path)
+        assert reloaded.pending_checks("recording") == ["confluence:12", "github:acme/svc:docs/a.md"]
+        assert reloaded.pending_checks("recording") == []
+        assert reloaded.recall("billing")["results"][0]["facts"] == ["b"]  # Nothing to check
+
+    def test_check_call(self):
+        assert ResearchCache.check_call("confluence:12") == ("confluence", {"operation": "get_page", "pageId": "12"})
+        assert ResearchCache.check_call("github:acme/svc:docs/a.md") == (
+            "github",
+            {"operation": "get_file_content", "owner": "acme", "repo": "svc", "path": "docs/a.md"},
+        )
+
+    def test_recall_tool_rechecks_sources(self, agent, monkeypatch):
+        agent.research_cache.observe("confluence", {}, confluence_page("12", 3))
+        agent.research_cache.observe("confluence", {}, confluence_page("13", 5))
+        agent.research_cache.remember("recording", ["a"], ["confluence:12"])
+        agent.research_cache.remember("billing", ["b"], ["confluence:13"])
+        agent.research_cache = ResearchCache(agent.file_store.store_path)  # A later run
+        agent.mcp.tools = {"confluence": {}}
+        current = {"12": 3, "13": 6}
+        calls = []
+
+        async def fake_call_tool(name, arguments):
+            calls.append(arguments["pageId"])
+            return confluence_page(arguments["pageId"], current[arguments["pageId"]])
+
+        monkeypatch.setattr(agent.mcp, "call_tool", fake_call_tool)
+
+        def recall(topic):
+            return asyncio.run(agent._handle_tool_use({"type": "tool_use", "id": "t", "name": "recall", "input": {"topic": topic}}))
+
+        assert recall("recording")["results"][0]["facts"] == ["a"]
+        assert recall("billing")["results"][0]["stale"] == ["confluence:13 changed (5 -> 6)"]
+        recall("recording")
+        assert calls == ["12", "13"]
@@ -0,0 +1,142 @@
+"""MCP result shaping: Confluence storage format to markdown, GitHub payloads, boilerplate stripping, raw on demand."""
+
+import asyncio
+import base64
+import json
+
+from agent import ResultShaper, storage_to_markdown
+
+
+def wrap(payload) -> dict:
+    return {"success": True, "result": {"content": [{"type": "text", "text": json.dumps(payload)}]}}
+
+
+def unwrap(result: dict):
+    return json.loads(result["result"]["content"][0]["text"])
+
+
+class TestStorageToMarkdown:
+    def test_blocks_and_inline(self):
+        html = (
+            '<h2>Setup</h2><p>Use <strong>kubectl</strong> and <a href="https://x.io">docs</a>.</p>'
+            "<ul><li>one</li><li>two</li></ul>"
+            "<table><tr><th>A</th><th>B</th></tr><tr><td>1</td><td>2</td></tr></table>"
+        )
+        assert storage_to_markdown(html) == (
+            "## Setup\n\nUse **kubectl** and [docs](https://x.io).\n\n- one\n- two\n\n| A | B |\n|---|---|\n| 1 | 2 |"
+        )
+
+    def test_code_macro_kept_toc_dropped(self):
+        html = (
+            '<ac:structured-macro ac:name="toc"/>'
+            '<ac:structured-macro ac:name="code"><ac:plain-text-body><![CDATA[echo <hi>]]></ac:plain-text-body></ac:structured-macro>'
+        )
+        assert storage_to_markdown(html) == "```\necho <hi>\n```"
+
+
+def test_confluence_page_body_and_metadata():
+    page = {
+        "id": "12",
+        "title": "Recording",
+        "version": {"number": 4, "when": "2026-01-01", "by": {"displayName": "x"}},
+        "ancestors": [{"id": "1", "title": "Platform"}],
+        "body": {"storage": {"value": "<p>Hello <strong>world</strong></p>"}},
+    }
+    shaped = unwrap(ResultShaper().shape("mcp_confluence", wrap(page)))
+    assert shaped == {"id": "12", "title": "Recording", "version": {"number": 4, "when": "2026-01-01"}, "ancestors": ["Platform"], "body_markdown": "Hello **world**"}
+
+
+def test_github_file_is_decoded_and_listings_collapse():
+    encoded = {"path": "README.md", "encoding": "base64", "content": base64.b64encode(b"# Service\n").decode()}
+    assert unwrap(ResultShaper().shape("mcp_github", wrap(encoded)))["content"] == "# Service\n"
+
+    listing = [{"path": "src", "type": "dir"}, {"path": "src/main.py", "type": "file", "size": 120}]
+    assert ResultShaper().shape("mcp_github", wrap(listing))["result"]["content"][0]["text"] == "src/\nsrc/main.py 120"
+
+    big_tree = {"tree": [{"path": "pkg", "type": "tree"}, {"path": "pkg/mod0", "type": "tree"}]}
+    big_tree["tree"] += [{"path": f"pkg/mod{i // 100}/deep/file{i}.py", "type": "blob", "sha": "abc", "size": 1} for i in range(400)]
+    assert unwrap(ResultShaper().shape("mcp_github", wrap(big_tree)))["tree"].splitlines() == [
+        "pkg/",
+        "pkg/mod0/ [100 entries]",
+        "pkg/mod1/ [100 entries]",
+        "pkg/mod2/ [100 entries]",
+        "pkg/mod3/ [100 entries]",
+    ]
+
+
+def test_unchanged_text_is_not_reshaped():
+    result = {"success": True, "result": {"content": [{"type": "text", "text": "plain words"}]}}
+    assert ResultShaper().shape("mcp_slack", result) is None
+
+
+def test_navigation_keys_and_empty_values_are_dropped():
+    entry = {"name": "svc", "description": "", "topics": [], "_links": {"self": "x"}, "_expandable": {"children": "y"}}
+    assert unwrap(ResultShaper().shape("mcp_github", wrap(entry))) == {"name": "svc"}
+
+
+def test_other_tools_keep_their_fields():
+    record = {"Id": "001", "attributes": {"type": "Account", "url": "/services/data/v58.0/sobjects/Account/001"}, "metadata": {"owner": "x"}, "_links": {"self": "y"}}
+    assert unwrap(ResultShaper().shape("mcp_salesforce", wrap(record))) == record  # Only re-serialized compactly
+
+
+def test_confluence_page_envelope_and_url():
+    page = {
+        "id": "12",
+        "title": "Recording",
+        "metadata": {"labels": []},
+        "operations": [{"operation": "read"}],
+        "_links": {"webui": "/spaces/DOC/pages/12", "base": "https://wiki.example.com", "self": "https://wiki.example.com/rest/api/content/12"},
+        "_expandable": {"children": "/rest/api/content/12/child"},
+        "body": {"storage": {"value": "<p>Hello <strong>world</strong></p>"}},
+        "space": {"key": "DOC", "metadata": {"kept": True}},
+    }
+    shaped = unwrap(ResultShaper().shape("mcp_confluence", wrap(page)))
+    assert shaped["url"] == "https://wiki.example.com/spaces/DOC/pages/12"
+    assert "**world**" in shaped["body_markdown"]
+    assert not {"metadata", "operations", "_links", "_expandable", "body"} & shaped.keys()
+    assert shaped["space"] == {"key": "DOC", "metadata": {"kept": True}}  # Envelope keys only at page level
+
+
+def test_confluence_search_results_are_pages():
+    results = {"results": [{"id": "1", "title": "A", "restrictions": {"read": {}}, "_links": {"webui": "/a"}}], "metadata": {"x": 1}}
+    shaped = unwrap(ResultShaper().shape("mcp_confluence", wrap(results)))
+    assert shaped == {"results": [{"id": "1", "title": "A", "url": "/a"}]}
+
+
+def test_github_keeps_urls():
+    entry = {"path": "README.md", "sha": "abc", "html_url": "https://github.com/acme/svc/blob/main/README.md", "_links": {"self": "x"}}
+    shaped = unwrap(ResultShaper().shape("mcp_github", wrap(entry)))
+    assert shaped["html_url"] == entry["html_url"] and "_links" not in shaped
+
+
+class TestRawOnDemand:
+    PAGE = {"id": "12", "title": "Recording", "_links": {"webui": "/p/12"}, "body": {"storage": {"value": "<p>Hello</p>"}}}
+
+    def test_shaped_result_is_marked_and_raw_is_not_stored(self, agent):
+        shaped = agent._shape_result("mcp_confluence", wrap(self.PAGE))
+        assert unwrap(shaped)["body_markdown"] == "Hello" and "raw=true" in shaped["shaped"]
+        assert agent.file_store.list_files()["files"] == []
+
+    def test_raw_argument_is_added_to_mcp_schemas(self, agent):
+        tool = {"name": "mcp_confluence", "description": "d", "input_schema": {"type": "object", "properties": {"operation": {"type": "string"}}, "required": ["operation"]}}
+        schema = agent._with_raw_option(tool)["input_schema"]
+        assert set(schema["properties"]) == {"operation", "raw"} and schema["required"] == ["operation"]
+        assert "raw" not in tool["input_schema"]["properties"]
+
+    def test_raw_argument_is_not_sent_to_the_server(self, agent, monkeypatch):
+        sent = []
+
+        async def fake_call_tool(name, arguments):
+            sent.append((name, arguments))
+            return wrap(TestRawOnDemand.PAGE)
+
+        monkeypatch.setattr(agent.mcp, "call_tool", fake_call_tool)
+        block = {"type": "tool_use", "id": "toolu_1", "name": "mcp_confluence", "input": {"operation": "get_page", "page_id": "12", "raw": True}}
+        asyncio.run(agent._handle_tool_use(block))
+        assert sent == [("confluence", {"operation": "get_page", "page_id": "12"})]
+        assert block["input"]["raw"] is True  # The history keeps what the model asked for
+
+    def test_raw_copies_are_not_sketched(self, file_store):
+        text = "\n".join(f"raw line {i} with the full storage markup of the page" for i in range(200))
+        info = file_store.store(text, "mcp_confluence (raw)", "json")
+        assert "sketch" not in file_store._index[info["file_id"]] and not file_store._sketch_index
@@ -0,0 +1,149 @@
+"""Async bash execution: streaming, capped capture with spill to the file store, timeouts and cancellation."""
+
+import asyncio
+import time
+from pathlib import Path
+
+import pytest
+
+from agent import ShellTool
+
+
+def alive(pid: int) -> bool:
+    try:
+        state = Path(f"/proc/{pid}/stat").read_text().rsplit(")", 1)[1].split()[0]
+    except FileNotFoundError:
+        return False
+    return state != "Z"
+
+
+def wait_dead(pid: int, seconds: float = 5) -> bool:
+    deadline = time.monotonic() + seconds
+    while alive(pid) and time.monotonic() < deadline:
+        time.sleep(0.05)
+    return not alive(pid)
+
+
+@pytest.fixture
+def spilling_shell(work_dir, file_store) -> ShellTool:
+    shell = ShellTool(work_dir, timeout=10, file_store=file_store)
+    shell.MAX_CAPTURE_CHARS = 1000
+    return shell
+
+
+class TestExecuteAsync:
+    def test_output_streams_and_return_code(self, shell, work_dir):
+        seen = []
+        result = asyncio.run(shell.execute_async("pwd; echo oops >&2; exit 3", on_output=lambda stream, text: seen.append(stream)))
+        assert result["stdout"].strip() == str(work_dir)
+        assert result["stderr"] == "oops\n"
+        assert (result["returncode"], result["success"]) == (3, False)
+        assert set(seen) == {"stdout", "stderr"}
+
+    def test_blocked_command_never_runs(self, shell):
+        result = asyncio.run(shell.execute_async("sudo rm -rf /"))
+        assert result["returncode"] == -1 and "sudo" in result["stderr"]
+
+    def test_large_output_spills_to_the_file_store(self, spilling_shell, file_store):
+        result = asyncio.run(spilling_shell.execute_async("seq 1 2000"))
+        full = "".join(f"{i}\n" for i in range(1, 2001))
+        assert result["success"] and result["stdout_chars"] == len(full)
+        assert result["stdout"].startswith("1\n2\n") and result["stdout"].rstrip().endswith(f"read_from_store(file_id='{result['stdout_file_id']}')")
+        assert "chars omitted" in result["stdout"] and "2000\n" in result["stdout"]
+        assert file_store.read(result["stdout_file_id"], 0, 10**6)["content"] == full
+        assert list(file_store.store_path.glob(".spill-*")) == []
+
+    def test_without_a_file_store_only_head_and_tail_are_kept(self, work_dir):
+        shell = ShellTool(work_dir)
+        shell.MAX_CAPTURE_CHARS = 1000
+        result = asyncio.run(shell.execute_async("seq 1 2000"))
+        assert "stdout_file_id" not in result and "chars omitted" in result["stdout"]
+        assert len(result["stdout"]) < 1200
+
+    def test_timeout_kills_the_process_group(self, work_dir):
+        shell = ShellTool(work_dir, timeout=1)
+        started = time.monotonic()
+        result = asyncio.run(shell.execute_async("sleep 30 & echo $! > child.pid; echo started; wait"))
+        assert time.monotonic() - started < 10
+        assert not result["success"] and result["returncode"] == -1
+        assert result["stdout"] == "started\n" and result["stderr"].endswith("Command timed out after 1 seconds")
+        assert wait_dead(int((work_dir / "child.pid").read_text()))
+
+    def test_cancellation_kills_the_command_and_drops_its_spill(self, spilling_shell, work_dir, file_store):
+        async def run_and_cancel():
+            task = asyncio.create_task(spilling_shell.execute_async("seq 1 5000; sleep 30 & echo $! > child.pid; wait"))
+            while not (work_dir / "child.pid").exists():
+                await asyncio.sleep(0.05)
+            await asyncio.sleep(0.1)
+            task.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await task
+
+        asyncio.run(run_and_cancel())
+        assert wait_dead(int((work_dir / "child.pid").read_text()))
+        assert list(file_store.store_path.glob(".spill-*")) == []
+        assert file_store.list_files()["files"] == []
+
+
+class TestPersistentShell:
+    def run(self, shell, *commands):
+        async def go():
+            try:
+                return [await shell.execute_async(command) for command in commands]
+            finally:
+                await shell.close()
+
+        return asyncio.run(go())
+
+    def test_directory_and_variables_persist(self, work_dir):
+        (work_dir / "docs").mkdir()
+        shell = ShellTool(work_dir, persistent=True)
+        first, second = self.run(shell, "cd docs && export STAGE=review", "pwd; echo $STAGE")
+        assert first["success"] and second["stdout"] == f"{work_dir}/docs\nreview\n"
+        assert shell.session.commands == 2  # Both in the same shell process
+
+    def test_exit_codes_stderr_and_unterminated_output(self, work_dir):
+        shell = ShellTool(work_dir, persistent=True)
+        failed, partial, quoted = self.run(shell, "echo bad >&2; false", "printf 'no newline'", "cat <<'EOF'\n$HOME 'quotes' \"too\"\nEOF")
+        assert (failed["returncode"], failed["stderr"]) == (1, "bad\n")
+        assert partial["stdout"] == "no newline"
+        assert quoted["stdout"] == "$HOME 'quotes' \"too\"\n"
+
+    def test_leaving_the_workspace_is_undone(self, work_dir):
+        shell = ShellTool(work_dir, persistent=True)
+        escaped, after = self.run(shell, "cd /tmp", "pwd")
+        assert "outside the workspace" in escaped["stderr"]
+        assert after["stdout"] == f"{work_dir}\n"
+
+    def test_exit_starts_a_new_shell(self, work_dir):
+        shell = ShellTool(work_dir, persistent=True)
+        exited, after = self.run(shell, "export X=1; exit 4", "echo ${X:-unset}")
+        assert exited["returncode"] == 4 and "next command starts a new shell" in exited["stderr"]
+        assert after["stdout"] == "unset\n"
+
+    def test_timeout_restarts_the_shell(self, work_dir):
+        shell = ShellTool(work_dir, timeout=1, persistent=True)
+
+        async def go():
+            await shell.execute_async("echo $$ > shell.pid")
+            timed_out = await shell.execute_async("sleep 30")
+            after = await shell.execute_async("echo alive")
+            await shell.close()
+            return timed_out, after
+
+        timed_out, after = asyncio.run(go())
+        assert timed_out["returncode"] == -1 and "timed out after 1 seconds (shell restarted)" in timed_out["stderr"]
+        assert after["stdout"] == "alive\n"
+        assert wait_dead(int((work_dir / "shell.pid").read_text()))
+
+    def test_large_output_spills(self, work_dir, file_store):
+        shell = ShellTool(work_dir, file_store=file_store, persistent=True)
+        shell.session.max_capture = 1000
+        (result,) = self.run(shell, "seq 1 2000")
+        assert file_store.read(result["stdout_file_id"], 0, 10**6)["content"] == "".join(f"{i}\n" for i in range(1, 2001))
+
+    def test_close_ends_the_shell(self, work_dir):
+        shell = ShellTool(work_dir, persistent=True)
+        self.run(shell, "echo $$ > shell.pid")
+        assert shell.session.proc is None
+        assert wait_dead(int((work_dir / "shell.pid").read_text()))
@@ -0,0 +1,306 @@
+"""Workspace file tools: ranged reads, patches and edits, batched writes, listings and the read memo."""
+
+import os
+
+import pytest
+
+from agent import ShellTool
+
+
+class TestReadMemo:
+    def test_memo_points_at_the_stored_result(self, shell, work_dir):
+        (work_dir / "a.md").write_text("hello")
+        assert shell.read_file("a.md")["content"] == "hello"
+        shell.remember_result("read_file", "a.md", "fid1", "toolu_1")
+        hit = shell.read_file("a.md")
+        assert hit["unchanged"] and hit["file_id"] == "fid1"
+        assert shell.read_file("a.md", force=True)["content"] == "hello"
+
+    def test_memo_forgets_results_that_left_the_context(self, shell, work_dir):
+        (work_dir / "a.md").write_text("hello")
+        shell.read_file("a.md")
+        shell.remember_result("read_file", "a.md", "fid1", "toolu_1")
+        shell.forget_results({"toolu_1"})
+        assert shell.read_file("a.md")["content"] == "hello"
+
+        shell.remember_result("read_file", "a.md", "fid2", "toolu_2")
+        shell.reset_memo()
+        assert shell.read_file("a.md")["content"] == "hello"
+
+    def test_no_pointer_until_the_result_is_stored(self, shell, work_dir):
+        (work_dir / "a.md").write_text("hello")
+        shell.read_file("a.md")
+        assert shell.read_file("a.md")["content"] == "hello"
+
+    def test_change_outside_the_tools_is_noticed(self, shell, work_dir):
+        path = work_dir / "a.md"
+        path.write_text("one")
+        shell.read_file("a.md")
+        shell.remember_result("read_file", "a.md", "fid1", "toolu_1")
+        path.write_text("two!")
+        os.utime(path, ns=(1, 1))  # Even with an older mtime, the size differs
+        assert shell.read_file("a.md")["content"] == "two!"
+
+    def test_write_invalidates_memo(self, shell, work_dir):
+        (work_dir / "a.md").write_text("one")
+        shell.read_file("a.md")
+        shell.remember_result("read_file", "a.md", "fid1", "toolu_1")
+        shell.write_file("a.md", "two")
+        assert shell.read_file("a.md")["content"] == "two"
+
+    def test_bash_naming_the_file_invalidates_memo(self, shell, work_dir):
+        (work_dir / "a.md").write_text("one")
+        shell.read_file("a.md")
+        shell.remember_result("read_file", "a.md", "fid1", "toolu_1")
+        shell._invalidate_for_command("sed -i s/one/two/ a.md")
+        assert "content" in shell.read_file("a.md")
+
+    def test_listing_memo_sees_new_entries(self, shell, work_dir):
+        (work_dir / "a.md").write_text("x")
+        shell.list_directory(".")
+        shell.remember_result("list_directory", ".", "fid-list", "toolu_1")
+        assert shell.list_directory(".")["unchanged"]
+        (work_dir / "b.md").write_text("y")
+        assert len(shell.list_directory(".")["items"]) == 2
+
+
+class TestRangedReads:
+    def test_line_window_and_byte_range(self, shell, work_dir):
+        (work_dir / "big.md").write_text("".join(f"row {i}\n" for i in range(1, 501)))
+        window = shell.read_file("big.md", start_line=10, end_line=12)
+        assert window["content"] == "row 10\nrow 11\nrow 12\n"
+        assert window["total_lines"] == 500 and window["next_start_line"] == 13
+
+        default_window = shell.read_file("big.md", start_line=450)
+        assert default_window["end_line"] == 500 and not default_window["has_more"]
+
+        chunk = shell.read_file("big.md", offset=0, limit=12)
+        assert chunk["content"] == "row 1\nrow 2\n" and chunk["next_offset"] == 12
+        assert (chunk["start_line"], chunk["end_line"]) == (1, 2)
+
+    def test_last_line_without_newline_and_out_of_range(self, shell, work_dir):
+        (work_dir / "a.md").write_text("one\ntwo")
+        assert shell.read_file("a.md", start_line=2)["content"] == "two"
+        past = shell.read_file("a.md", start_line=5)
+        assert past["content"] == "" and not past["has_more"]
+        tail = shell.read_file("a.md", offset=100)
+        assert tail["content"] == "" and tail["offset"] == 7
+
+    def test_whole_read_reports_size_and_lines(self, shell, work_dir):
+        (work_dir / "a.md").write_text("one\ntwo")
+        assert shell.read_file("a.md") == {"success": True, "content": "one\ntwo", "size_bytes": 7, "total_lines": 2}
+
+    def test_line_index_follows_file_changes(self, shell, work_dir):
+        path = work_dir / "a.md"
+        path.write_text("a\nb\nc\n")
+        assert shell.read_file("a.md", start_line=3)["content"] == "c\n"
+        path.write_text("alpha\nbeta\ngamma\ndelta\n")
+        assert shell.read_file("a.md", start_line=3, end_line=3)["content"] == "gamma\n"
+
+    def test_ranged_reads_bypass_the_memo(self, shell, work_dir):
+        (work_dir / "a.md").write_text("one\ntwo\n")
+        shell.read_file("a.md")
+        shell.remember_result("read_file", "a.md", "fid1", "toolu_1")
+        assert shell.read_file("a.md", start_line=2)["content"] == "two\n"
+
+
+class TestApplyPatch:
+    CONTENT = "".join(f"line {i}\n" for i in range(1, 21))
+
+    def test_single_hunk(self):
+        patch = "@@ -4,3 +4,3 @@\n line 4\n-line 5\n+line five\n line 6\n"
+        assert ShellTool._apply_patch(self.CONTENT, patch) == self.CONTENT.replace("line 5\n", "line five\n")
+
+    def test_later_hunks_are_shifted_by_earlier_ones(self):
+        patch = "@@ -2,1 +2,3 @@\n line 2\n+inserted a\n+inserted b\n@@ -10,2 +12,1 @@\n line 10\n-line 11\n"
+        result = ShellTool._apply_patch(self.CONTENT, patch).splitlines()
+        assert result[1:4] == ["line 2", "inserted a", "inserted b"]
+        assert "line 11" not in result and "line 12" in result
+
+    def test_hunk_found_near_a_wrong_line_number(self):
+        patch = "@@ -3,1 +3,1 @@\n-line 15\n+line fifteen\n"
+        assert "line fifteen\n" in ShellTool._apply_patch(self.CONTENT, patch)
+
+    def test_missing_final_newline_is_preserved(self):
+        assert ShellTool._apply_patch("a\nb", "@@ -2,1 +2,1 @@\n-b\n+c\n") == "a\nc"
+
+    @pytest.mark.parametrize(
+        "patch, message",
+        [
+            ("@@ -1,1 +1,1 @@\n-not there\n+x\n", "does not match"),
+            ("just text\n", "no @@ hunks"),
+            ("@@ -1,1 +1,1 @@\n*bogus\n", "Unrecognized patch line"),
+        ],
+    )
+    def test_conflicts(self, patch, message):
+        with pytest.raises(ValueError, match=message):
+            ShellTool._apply_patch(self.CONTENT, patch)
+
+
+class TestEditFile:
+    def test_replacements_and_diff(self, shell, work_dir):
+        (work_dir / "BACKLOG.md").write_text("- [ ] one\n- [ ] two\n")
+        result = shell.edit_file("BACKLOG.md", edits=[{"old": "- [ ] two", "new": "- [x] two"}])
+        assert result["success"] and result["changed"]
+        assert (result["lines_added"], result["lines_removed"]) == (1, 1)
+        assert "+- [x] two" in result["diff"]
+        assert (work_dir / "BACKLOG.md").read_text() == "- [ ] one\n- [x] two\n"
+
+    def test_ambiguous_edit_writes_nothing(self, shell, work_dir):
+        (work_dir / "a.md").write_text("x\nx\n")
+        result = shell.edit_file("a.md", edits=[{"old": "x", "new": "y"}])
+        assert not result["success"] and "matches 2 times" in result["error"]
+        assert shell.edit_file("a.md", edits=[{"old": "x", "new": "y", "replace_all": True}])["success"]
+        assert (work_dir / "a.md").read_text() == "y\ny\n"
+
+    def test_all_or_nothing(self, shell, work_dir):
+        (work_dir / "a.md").write_text("alpha\nbeta\n")
+        result = shell.edit_file("a.md", edits=[{"old": "alpha", "new": "ALPHA"}, {"old": "gamma", "new": "GAMMA"}])
+        assert not result["success"] and "Edit 2" in result["error"]
+        assert (work_dir / "a.md").read_text() == "alpha\nbeta\n"
+
+    def test_patch_and_memo_invalidation(self, shell, work_dir):
+        (work_dir / "a.md").write_text("one\ntwo\nthree\n")
+        shell.read_file("a.md")
+        shell.remember_result("read_file", "a.md", "fid1", "toolu_1")
+        result = shell.edit_file("a.md", patch="@@ -2,1 +2,1 @@\n-two\n+TWO\n")
+        assert result["success"] and (work_dir / "a.md").read_text() == "one\nTWO\nthree\n"
+        assert shell.read_file("a.md")["content"] == "one\nTWO\nthree\n"
+
+    def test_outside_workspace(self, shell):
+        assert not shell.edit_file("/etc/hosts", edits=[{"old": "a", "new": "b"}])["success"]
+
+
+class TestWriteFiles:
+    def test_writes_all(self, shell, work_dir):
+        result = shell.write_files([{"path": "a/one.md", "content": "1"}, {"path": "a/b/two.md", "content": "22"}])
+        assert result == {"success": True, "files_written": 2, "total_chars": 3, "paths": ["a/one.md", "a/b/two.md"]}
+        assert (work_dir / "a/b/two.md").read_text() == "22"
+
+    def test_invalid_path_writes_nothing(self, shell, work_dir):
+        result = shell.write_files([{"path": "ok.md", "content": "x"}, {"path": "../escape.md", "content": "y"}])
+        assert not result["success"] and result["error"].startswith("File 2")
+        assert not (work_dir / "ok.md").exists()
+
+    def test_failure_while_staging_rolls_back(self, shell, work_dir):
+        (work_dir / "keep.md").write_text("original")
+        (work_dir / "blocker").write_text("a file where a directory is needed")
+        result = shell.write_files([{"path": "keep.md", "content": "changed"}, {"path": "blocker/new.md", "content": "x"}])
+        assert not result["success"] and result["error"].startswith("Nothing written")
+        assert (work_dir / "keep.md").read_text() == "original"
+        assert [p.name for p in work_dir.iterdir() if p.name.endswith(".tmp")] == []
+
+    def test_duplicate_paths(self, shell):
+        assert not shell.write_files([{"path": "a.md", "content": "1"}, {"path": "./a.md", "content": "2"}])["success"]
+
+    def test_existing_file_keeps_its_mode(self, shell, work_dir):
+        script = work_dir / "build.sh"
+        script.write_text("#!/bin/sh\n")
+        script.chmod(0o755)
+        assert shell.write_files([{"path": "build.sh", "content": "#!/bin/sh\nmake\n"}])["success"]
+        assert script.stat().st_mode & 0o777 == 0o755
+
+    def test_new_file_gets_the_umask_mode(self, shell, work_dir):
+        umask = os.umask(0o027)
+        try:
+            assert shell.write_files([{"path": "new.md", "content": "x"}])["success"]
+        finally:
+            os.umask(umask)
+        assert (work_dir / "new.md").stat().st_mode & 0o777 == 0o640
+
+
+class TestListDirectory:
+    def test_recursive_glob_and_tree(self, shell, work_dir):
+        (work_dir / "docs/api").mkdir(parents=True)
+        (work_dir / "docs/api/ref.md").write_text("x" * 2000)
+        (work_dir / "docs/notes.txt").write_text("x")
+        listing = shell.list_directory(".", depth=3, glob="*.md")
+        assert [item["name"] for item in listing["items"]] == ["docs/api/ref.md"]
+        tree = shell.list_directory(".", depth=3, tree=True)["tree"]
+        assert "ref.md 2K" in tree and "notes.txt 1B" in tree
+
+    def test_depth_limit_and_skipped_directories(self, shell, work_dir):
+        (work_dir / "a/b/c").mkdir(parents=True)
+        (work_dir / "a/b/c/deep.md").write_text("x")
+        (work_dir / ".git").mkdir()
+        (work_dir / ".git/HEAD").write_text("ref")
+        names = [item["name"] for item in shell.list_directory(".", depth=2)["items"]]
+        assert "a/b" in names and "a/b/c" not in names
+        assert not any(item["name"].startswith(".git/") for item in shell.list_directory(".", depth=5)["items"])
+
+    def test_sort_by_size_and_mtime(self, shell, work_dir):
+        for name, size, mtime in (("small.md", 1, 300), ("large.md", 300, 100), ("medium.md", 30, 200)):
+            (work_dir / name).write_text("x" * size)
+            os.utime(work_dir / name, (mtime, mtime))
+        assert [item["name"] for item in shell.list_directory(".", sort="size")["items"]] == ["large.md", "medium.md", "small.md"]
+        by_mtime = shell.list_directory(".", sort="mtime")["items"]
+        assert [item["name"] for item in by_mtime] == ["small.md", "medium.md", "large.md"] and "mtime" in by_mtime[0]
+        assert not shell.list_directory(".", sort="colour")["success"]
+
+    def test_pages(self, shell, work_dir):
+        for i in range(5):
+            (work_dir / f"f{i}.md").write_text("x")
+        first = shell.list_directory(".", page_size=2)
+        assert [item["name"] for item in first["items"]] == ["f0.md", "f1.md"] and first["total"] == 5
+        last = shell.list_directory(".", page_size=2, cursor="4")
+        assert [item["name"] for item in last["items"]] == ["f4.md"] and "next_cursor" not in last
+        assert not shell.list_directory(".", cursor="later")["success"]
+
+    def test_partial_page_is_not_memoized(self, shell, work_dir):
+        for i in range(5):
+            (work_dir / f"f{i}.md").write_text("x")
+        page = shell.list_directory(".", page_size=2)
+        assert page["next_cursor"] == "2" and len(page["items"]) == 2
+        shell.remember_result("list_directory", ".", "fid-page", "toolu_1")
+        full = shell.list_directory(".")
+        assert not full.get("unchanged") and len(full["items"]) == 5
+
+        shell.remember_result("list_directory", ".", "fid-full", "toolu_2")
+        assert shell.list_directory(".")["file_id"] == "fid-full"
+
+    def test_listing_over_one_page_is_not_memoized(self, shell, work_dir):
+        for i in range(201):
+            (work_dir / f"f{i:03}.md").write_text("x")
+        assert "next_cursor" in shell.list_directory(".")
+        shell.remember_result("list_directory", ".", "fid-page", "toolu_1")
+        assert not shell.list_directory(".").get("unchanged")
+
+
+class TestDocIndex:
+    def test_digest_links_and_incremental_updates(self, shell, work_dir):
+        shell.write_files(
+            [
+                {
+                    "path": "architecture/overview.md",
+                    "content": (
+                        "# Platform Overview\n\n> **Last Updated:** 2026-01-15\n\n"
+                        "Voice calls are routed through FreeSWITCH.\n\n"
+                        "## Call Recording\nSee [inventory](../services/inventory.md#core) and [missing](gone.md).\n"
+                        "```\n# not a heading\n```\n"
+                    ),
+                },
+                {"path": "services/inventory.md", "content": "# Service Inventory\n\nEvery service.\n"},
+            ]
+        )
+        found = shell.find_docs("call recording")
+        top = found["results"][0]
+        assert top["path"] == "architecture/overview.md"
+        assert top["headings"] == ["## Call Recording"]
+        assert top["digest"] == "Voice calls are routed through FreeSWITCH."
+        assert top["last_updated"] == "2026-01-15"
+
+        detail = shell.find_docs(path="overview.md")
+        assert detail["links"] == ["services/inventory.md", "architecture/gone.md"]
+        assert detail["broken_links"] == ["architecture/gone.md"]
+        assert "# not a heading" not in detail["headings"]
+        assert shell.find_docs(path="services/inventory.md")["linked_from"] == ["architecture/overview.md"]
+
+        shell.edit_file("services/inventory.md", edits=[{"old": "# Service Inventory", "new": "# Services"}])
+        assert shell.find_docs(path="services/inventory.md")["title"] == "Services"
+        (work_dir / "runbook.md").write_text("# Restart Runbook\n")  # Outside the tools: picked up by the scan
+        assert shell.find_docs()["total_docs"] == 3
+
+    def test_lookup_of_unknown_path_and_no_match(self, shell):
+        shell.write_file("a.md", "# Alpha\n\nFirst doc.\n")
+        assert not shell.find_docs(path="missing.md")["success"]
+        assert shell.find_docs("zebra crossings")["results"] == []
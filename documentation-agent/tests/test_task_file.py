@@ -0,0 +1,128 @@
+"""tasks.yaml loading and the concurrent task-file runner."""
+
+import asyncio
+import textwrap
+
+import pytest
+
+import agent as agent_module
+from agent import SessionTranscript, load_tasks, select_tasks
+
+
+def write_tasks(tmp_path, text):
+    path = tmp_path / "tasks.yaml"
+    path.write_text(textwrap.dedent(text))
+    return path
+
+
+class TestLoadTasks:
+    def test_nested_ids_and_short_dependency_names(self, tmp_path):
+        tasks = load_tasks(
+            write_tasks(
+                tmp_path,
+                """
+                architecture:
+                  overview:
+                    description: Overview
+                    task: Write the overview
+                runbooks:
+                  deploy:
+                    task: Write the deploy runbook
+                    depends_on: overview
+                standalone:
+                  task: Something else
+                """,
+            )
+        )
+        assert set(tasks) == {"architecture.overview", "runbooks.deploy", "standalone"}
+        assert tasks["runbooks.deploy"]["depends_on"] == ["architecture.overview"]
+        assert tasks["runbooks.deploy"]["description"] == "runbooks.deploy"
+
+    def test_unknown_dependency(self, tmp_path):
+        with pytest.raises(ValueError, match="unknown or ambiguous"):
+            load_tasks(write_tasks(tmp_path, "a:\n  task: x\n  depends_on: [missing]\n"))
+
+    def test_ambiguous_short_name(self, tmp_path):
+        text = """
+        one:
+          overview: {task: x}
+        two:
+          overview: {task: y}
+        user:
+          task: z
+          depends_on: overview
+        """
+        with pytest.raises(ValueError, match="ambiguous"):
+            load_tasks(write_tasks(tmp_path, text))
+
+    def test_cycle(self, tmp_path):
+        text = """
+        a: {task: x, depends_on: c}
+        b: {task: y, depends_on: a}
+        c: {task: z, depends_on: b}
+        """
+        with pytest.raises(ValueError, match="Dependency cycle"):
+            load_tasks(write_tasks(tmp_path, text))
+
+    def test_select_pulls_in_dependencies(self, tmp_path):
+        tasks = load_tasks(write_tasks(tmp_path, "a: {task: x}\nb: {task: y, depends_on: a}\nc: {task: z}\n"))
+        assert set(select_tasks(tasks, ["b"])) == {"a", "b"}
+        with pytest.raises(ValueError):
+            select_tasks(tasks, ["nope"])
+
+
+def fake_sessions(monkeypatch, fail_tasks=()):
+    """Sessions that record the order tasks ran in instead of calling Bedrock; tasks in fail_tasks raise."""
+    ran: list[str] = []
+
+    async def fake_initialize(self):
+        return True
+
+    async def fake_run_task(self, task: str) -> str:
+        self.transcript = SessionTranscript(self.file_store.store_path, task)
+        ran.append(task)
+        await asyncio.sleep(0.01)
+        if task in fail_tasks:
+            raise RuntimeError("Bedrock throttled")
+        return f"done: {task}"
+
+    monkeypatch.setattr(agent_module.DocumentationAgent, "initialize", fake_initialize)
+    monkeypatch.setattr(agent_module.DocumentationAgent, "run_task", fake_run_task)
+    return ran
+
+
+TASKS = {
+    "a": {"description": "A", "task": "write a", "depends_on": []},
+    "b": {"description": "B", "task": "write b", "depends_on": ["a"]},
+    "c": {"description": "C", "task": "write c", "depends_on": []},
+}
+
+
+class TestRunTaskFile:
+    def test_dependencies_run_first(self, agent, monkeypatch):
+        ran = fake_sessions(monkeypatch)
+        report = asyncio.run(agent_module.run_task_file(agent, TASKS, max_concurrent=2))
+        assert ran.index("write a") < ran.index("write b")
+        assert {task_id: entry["status"] for task_id, entry in report["tasks"].items()} == {"a": "completed", "b": "completed", "c": "completed"}
+        assert report["tasks"]["b"]["result"] == "done: write b"
+
+    def test_failure_skips_dependents_only(self, agent, monkeypatch):
+        ran = fake_sessions(monkeypatch, fail_tasks={"write a"})
+        report = asyncio.run(agent_module.run_task_file(agent, TASKS, max_concurrent=2))
+        assert report["tasks"]["a"]["status"] == "failed" and report["tasks"]["a"]["error"] == "Bedrock throttled"
+        assert report["tasks"]["b"]["status"] == "skipped"
+        assert report["tasks"]["c"]["status"] == "completed"
+        assert "write b" not in ran
+
+    def test_failed_start_fails_task_and_skips_dependents(self, agent, monkeypatch):
+        ran = fake_sessions(monkeypatch)
+
+        async def fake_initialize(self):
+            raise ConnectionError("MCP unreachable")
+
+        monkeypatch.setattr(agent_module.DocumentationAgent, "initialize", fake_initialize)
+        report = asyncio.run(agent_module.run_task_file(agent, TASKS, max_concurrent=1))
+        assert report["tasks"]["a"]["status"] == "failed" and report["tasks"]["a"]["error"] == "MCP unreachable"
+        assert report["tasks"]["b"]["status"] == "skipped"
+        assert report["tasks"]["c"]["status"] == "failed"
+        assert ran == []
@@ -0,0 +1,83 @@
+"""Concurrent tool execution."""
+
+import asyncio
+
+
+def block(n: int, name: str, **tool_input) -> dict:
+    return {"type": "tool_use", "id": f"toolu_{n}", "name": name, "input": tool_input}
+
+
+def record_calls(agent, monkeypatch, fail: set[str] = frozenset()):
+    """Replace tool dispatch with a fake that logs start/end order; ids in fail raise."""
+    events: list[str] = []
+
+    async def fake_handle(tool_block: dict) -> dict:
+        events.append(f"start {tool_block['id']}")
+        await asyncio.sleep(0.01)
+        events.append(f"end {tool_block['id']}")
+        if tool_block["id"] in fail:
+            raise RuntimeError("connection reset")
+        return {"success": True, "id": tool_block["id"]}
+
+    monkeypatch.setattr(agent, "_handle_tool_use", fake_handle)
+    return events
+
+
+class TestExecuteToolCalls:
+    def test_results_keep_block_order(self, agent, monkeypatch):
+        record_calls(agent, monkeypatch)
+        blocks = [block(n, "read_file", path=f"doc{n}.md") for n in range(6)]
+        results = asyncio.run(agent._execute_tool_calls(blocks))
+        assert [r["id"] for r in results] == [f"toolu_{n}" for n in range(6)]
+
+    def test_mcp_writes_run_in_order_reads_in_parallel(self, agent, monkeypatch):
+        events = record_calls(agent, monkeypatch)
+        blocks = [
+            block(1, "mcp_confluence", operation="create_page", title="A"),
+            block(2, "mcp_confluence", operation="get_page", page_id="1"),
+            block(3, "mcp_github", operation="create_issue", title="B"),
+        ]
+        results = asyncio.run(agent._execute_tool_calls(blocks))
+        assert [r["id"] for r in results] == ["toolu_1", "toolu_2", "toolu_3"]
+        assert events.index("end toolu_1") < events.index("start toolu_3")  # Writes never overlap
+        assert events.index("start toolu_2") < events.index("end toolu_1")  # The read does not wait
+
+    def test_same_path_is_ordered(self, agent, monkeypatch):
+        events = record_calls(agent, monkeypatch)
+        blocks = [block(1, "write_file", path="docs/a.md", content="x"), block(2, "read_file", path="docs/a.md"), block(3, "read_file", path="docs/b.md")]
+        asyncio.run(agent._execute_tool_calls(blocks))
+        assert events.index("end toolu_1") < events.index("start toolu_2")
+        assert events.index("start toolu_3") < events.index("end toolu_1")
+
+    def test_directory_contains_its_files(self, agent, monkeypatch):
+        events = record_calls(agent, monkeypatch)
+        asyncio.run(agent._execute_tool_calls([block(1, "write_file", path="docs/a.md", content="x"), block(2, "list_directory", path="docs")]))
+        assert events.index("end toolu_1") < events.index("start toolu_2")
+
+    def test_bash_orders_everything_after_it(self, agent, monkeypatch):
+        events = record_calls(agent, monkeypatch)
+        blocks = [block(1, "read_file", path="a.md"), block(2, "bash", command="make docs"), block(3, "read_file", path="b.md")]
+        asyncio.run(agent._execute_tool_calls(blocks))
+        assert events.index("end toolu_1") < events.index("start toolu_2")
+        assert events.index("end toolu_2") < events.index("start toolu_3")
+
+    def test_concurrency_limit(self, agent, monkeypatch):
+        events = record_calls(agent, monkeypatch)
+        agent.config.max_parallel_tools = 2
+        asyncio.run(agent._execute_tool_calls([block(n, "read_file", path=f"doc{n}.md") for n in range(4)]))
+        running = peak = 0
+        for event in events:
+            running += 1 if event.startswith("start") else -1
+            peak = max(peak, running)
+        assert peak == 2
+
+    def test_exception_becomes_error_result(self, agent, monkeypatch):
+        record_calls(agent, monkeypatch, fail={"toolu_2"})
+        blocks = [block(1, "read_file", path="a.md"), block(2, "mcp_github", operation="get_file_content"), block(3, "read_file", path="b.md")]
+        results = asyncio.run(agent._execute_tool_calls(blocks))
+        assert results[0]["success"] and results[2]["success"]
+        assert results[1] == {"success": False, "error": "RuntimeError: connection reset"}
+
+    def test_single_call_exception(self, agent, monkeypatch):
+        record_calls(agent, monkeypatch, fail={"toolu_1"})
+        assert asyncio.run(agent._execute_tool_calls([block(1, "bash", command="ls")]))[0]["success"] is False
@@ -0,0 +1,100 @@
+"""SessionTranscript replay, and an agent's checkpoints replaying to the same history."""
+
+import copy
+import json
+
+import agent as agent_module
+from agent import SessionTranscript
+
+
+def user(text):
+    return {"role": "user", "content": text}
+
+
+def assistant(text):
+    return {"role": "assistant", "content": [{"type": "text", "text": text}]}
+
+
+class TestReplay:
+    def test_snapshot_turns_drops_and_head(self, tmp_path):
+        transcript = SessionTranscript(tmp_path, "task")
+        transcript.append({"type": "snapshot", "messages": [user("task"), assistant("a1")], "state": {"turns_used": 1}})
+        transcript.append({"type": "turn", "messages": [user("r1"), assistant("a2")], "state": {"turns_used": 2}, "store_refs": ["f1"]})
+        transcript.append({"type": "turn", "messages": [user("r2")], "drop": [[1, 2]], "head": "task + summary", "state": {"turns_used": 3}, "store_refs": ["f2"]})
+
+        session = transcript.load()
+        assert session["messages"] == [user("task + summary"), assistant("a2"), user("r2")]
+        assert session["state"]["turns_used"] == 3
+        assert session["store_refs"] == ["f1", "f2"]
+        assert session["exit"] is None
+
+    def test_exit_record_only_counts_when_last(self, tmp_path):
+        transcript = SessionTranscript(tmp_path, "task")
+        transcript.append({"type": "snapshot", "messages": [user("task")]})
+        transcript.append({"type": "exit", "reason": "loop", "detail": "same call"})
+        assert transcript.load()["exit"]["reason"] == "loop"
+        transcript.append({"type": "turn", "messages": [assistant("more")]})
+        assert transcript.load()["exit"] is None
+
+    def test_torn_final_line_is_ignored_and_truncated(self, tmp_path):
+        transcript = SessionTranscript(tmp_path, "task")
+        transcript.append({"type": "snapshot", "messages": [user("task")]})
+        good_size = transcript.path.stat().st_size
+        with open(transcript.path, "a") as f:
+            f.write('{"type": "turn", "messages": [{"role": "assi')
+        assert transcript.load()["messages"] == [user("task")]
+        assert transcript.path.stat().st_size == good_size
+
+    def test_distinct_tasks_get_distinct_files(self, tmp_path):
+        assert SessionTranscript(tmp_path, "a").path != SessionTranscript(tmp_path, "b").path
+        assert SessionTranscript(tmp_path, "a").load() is None
+
+
+def tool_turn(n: int, size: int = 50):
+    return [
+        {"role": "assistant", "content": [{"type": "tool_use", "id": f"toolu_{n}", "name": "bash", "input": {"command": f"echo {n}"}}]},
+        {"role": "user", "content": [{"type": "tool_result", "tool_use_id": f"toolu_{n}", "content": json.dumps({"output": str(n) * size})}]},
+    ]
+
+
+class TestAgentCheckpoints:
+    def test_checkpoints_replay_to_the_live_history(self, agent):
+        agent.transcript = SessionTranscript(agent.file_store.store_path, "task")
+        agent.messages = [user("task")]
+        agent._checkpoint("task", 0, 0)
+        for n in range(1, 6):
+            agent.messages.extend(tool_turn(n))
+            agent._files_written.add(f"doc{n}.md")
+            agent._checkpoint("task", n, 0)
+        agent._drop_history(1, 4)  # As a rolling summary fold does
+        agent.messages[0]["content"] = "task\n\nsummary of turns 1-2"
+        agent.messages.extend(tool_turn(6))
+        agent._checkpoint("task", 6, 0)
+
+        session = agent.transcript.load()
+        assert session["messages"] == agent.messages
+        assert session["state"]["files_written"] == [f"doc{n}.md" for n in range(1, 6)]
+
+        lines = agent.transcript.path.read_text().splitlines()
+        assert json.loads(lines[0])["type"] == "snapshot"
+        assert all(json.loads(line)["type"] == "turn" for line in lines[1:])  # Incremental after the first
+
+    def test_resume_restores_state_and_notes_a_loop(self, agent, work_dir):
+        agent.transcript = SessionTranscript(agent.file_store.store_path, "task")
+        agent.messages = [user("task")]
+        for n in range(1, 3):
+            agent.messages.extend(tool_turn(n, size=2000))
+        agent._files_written = {"a.md"}
+        agent._checkpoint("task", 2, 0)
+        agent.transcript.append({"type": "exit", "reason": "loop", "detail": "same call x3"})
+        expected = copy.deepcopy(agent.messages)
+
+        config = agent_module.Config(bedrock_model_id="m", natterbox_mcp_url="http://mcp.invalid/sse", work_dir=work_dir, output_dir=work_dir / "output")
+        resumed = agent_module.DocumentationAgent(config)
+        resumed.transcript = SessionTranscript(resumed.file_store.store_path, "task")
+        original, turns, resets = resumed._resume_session(resumed.transcript.load())
+
+        assert (original, turns, resets) == ("task", 2, 0)
+        assert resumed._files_written == {"a.md"}
+        assert len(resumed.messages) == len(expected)
+        assert "repeating itself" in resumed.messages[-1]["content"][-1]["text"]
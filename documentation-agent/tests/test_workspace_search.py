@@ -0,0 +1,78 @@
+"""WorkspaceIndex: trigram-indexed, incrementally refreshed workspace search."""
+
+import os
+
+from agent import WorkspaceIndex
+
+
+def make_workspace(root):
+    (root / "docs/services").mkdir(parents=True)
+    (root / "docs/services/billing.md").write_text("# Billing\n\nInvoices are generated nightly.\n## Billing exports\nCSV only.\n")
+    (root / "docs/overview.md").write_text("Billing is covered elsewhere.\nbilling billing\nAnd again: billing.\n")
+    (root / "docs/recording.md").write_text("# Call Recording\n\nRecordings go to S3.\n")
+    (root / "notes.txt").write_text("billing notes\n")
+    for skipped in (".git", "node_modules", ".agent-store"):
+        (root / skipped).mkdir()
+        (root / skipped / "billing.md").write_text("billing\n")
+    (root / "logo.png").write_bytes(b"\x89PNG\0billing\0\xff")
+
+
+class TestWorkspaceIndex:
+    def test_ranking_path_then_headings_then_count(self, work_dir):
+        make_workspace(work_dir)
+        result = WorkspaceIndex(work_dir).search("billing")
+        assert result["files"] == ["docs/services/billing.md", "docs/overview.md", "notes.txt"]
+        assert result["matches"][0] == {"path": "docs/services/billing.md", "line": 1, "text": "# Billing"}
+        assert result["total_matches"] == 2 + 3 + 1 and not result["truncated"]
+
+    def test_skipped_directories_and_binaries(self, work_dir):
+        make_workspace(work_dir)
+        index = WorkspaceIndex(work_dir)
+        assert not any(path.startswith((".git", "node_modules", ".agent-store", "logo")) for path in index.search("billing")["files"])
+        index.refresh()
+        assert "logo.png" in index._files and index.candidates("billing").count("logo.png") == 0
+
+    def test_case_glob_context_and_limits(self, work_dir):
+        make_workspace(work_dir)
+        index = WorkspaceIndex(work_dir)
+        assert index.search("Billing")["total_matches"] == 3  # Capitals make it case-sensitive
+        assert index.search("billing", glob="*.txt")["files"] == ["notes.txt"]
+        assert index.search("billing", glob="docs/services/*")["files"] == ["docs/services/billing.md"]
+
+        with_context = index.search("nightly", context_lines=1)["matches"][0]
+        assert (with_context["before"], with_context["after"]) == ([""], ["## Billing exports"])
+
+        limited = index.search("billing", max_results=2)
+        assert len(limited["matches"]) == 2 and limited["truncated"]
+
+    def test_trigrams_prune_candidates(self, work_dir):
+        make_workspace(work_dir)
+        result = WorkspaceIndex(work_dir).search("recordings? go")
+        assert result["files"] == ["docs/recording.md"]
+        assert result["files_scanned"] == 1 < result["files_indexed"]
+        assert WorkspaceIndex._required_literals("billing|recording") == []
+
+    def test_refresh_is_incremental(self, work_dir):
+        make_workspace(work_dir)
+        index = WorkspaceIndex(work_dir)
+        index.refresh()
+        assert index.reindexed == 5
+        index.refresh()
+        assert index.reindexed == 0
+
+        path = work_dir / "docs/recording.md"
+        path.write_text("# Call Recording\n\nRecordings now go to GCS.\n")
+        os.utime(path, ns=(1, 1))
+        (work_dir / "notes.txt").unlink()
+        assert index.search("gcs")["files"] == ["docs/recording.md"]
+        assert index.reindexed == 1 and "notes.txt" not in index._files
+        assert index.search("s3")["total_matches"] == 0
+
+    def test_invalid_pattern(self, work_dir):
+        assert not WorkspaceIndex(work_dir).search("billing(")["success"]
+
+
+def test_search_workspace_tool_bounds_its_arguments(shell, work_dir):
+    make_workspace(work_dir)
+    result = shell.search_workspace("billing", max_results=0, context_lines=50)
+    assert len(result["matches"]) == 1 and len(result["matches"][0]["after"]) <= 5